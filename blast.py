@@ -0,0 +1,149 @@
+import time
+import adafruit_rfm69
+from diag_packets import (
+    BlastData,
+    BlastRequest,
+    BlastSummary,
+)
+from packets import (
+    MAX_PAYLOAD_LENGTH,
+    airtime_s,
+    format_short_id,
+    poll_message,
+    wait_for_packet,
+)
+from input import get_user_input
+from registry import Registry
+from rfm_util import attempt_send
+from rgb_indicator import indicate_processing, indicate_ready
+
+# How long the controller keeps listening after the blast should have ended
+SUMMARY_WAIT_S = 1.0
+
+
+def frame_airtime_s(rfm69: adafruit_rfm69.RFM69, payload_len: int) -> float:
+    """Time on air of one packet with the radio's current framing settings"""
+    sync_len = len(rfm69.sync_word) if rfm69.sync_word else 0
+    return airtime_s(payload_len, rfm69.bitrate, rfm69.preamble_length, sync_len)
+
+
+def report_rate(
+    rfm69: adafruit_rfm69.RFM69, label: str, packets: int, payload_len: int, elapsed_s: float
+):
+    """Print packets/s and goodput next to the channel's theoretical ceiling"""
+    airtime = frame_airtime_s(rfm69, payload_len)
+    ceiling_pps = 1 / airtime
+    ceiling_kbps = payload_len * 8 * ceiling_pps / 1000
+    pps = packets / elapsed_s if elapsed_s > 0 else 0.0
+    kbps = payload_len * 8 * pps / 1000
+    print(
+        f"  {label}: {packets} packets in {elapsed_s:.2f}s = {pps:.1f} packets/s, "
+        f"goodput {kbps:.2f}kbit/s"
+    )
+    print(
+        f"  Ceiling at {rfm69.bitrate / 1000:.1f}kbit/s: {ceiling_pps:.1f} packets/s, "
+        f"goodput {ceiling_kbps:.2f}kbit/s ({airtime * 1000:.2f}ms per packet), "
+        f"reached {100 * pps / ceiling_pps:.1f}%"
+    )
+
+
+def send_blast(rfm69: adafruit_rfm69.RFM69, device_id: str, request: BlastRequest):
+    """Send packets back to back for the requested time and report the rate"""
+    packet = BlastData.template(device_id, request.payload_len, request.wire_format)
+    payload_len = len(packet)
+    print(f"[BLAST] Sending {payload_len} byte packets for {request.duration_ms}ms")
+
+    sent = 0
+    start = time.monotonic()
+    end = start + request.duration_ms / 1000.0
+    while time.monotonic() < end:
+        BlastData.set_sequence(packet, sent)
+        attempt_send(rfm69, packet)
+        sent += 1
+    elapsed = time.monotonic() - start
+
+    report_rate(rfm69, "Sent", sent, payload_len, elapsed)
+    return sent, elapsed
+
+
+class BlastSession:
+    """Has one relay blast packets at the controller and counts what arrives"""
+
+    def __init__(self, rfm69: adafruit_rfm69.RFM69, wire_format: str):
+        self._rfm69 = rfm69
+        self._wire_format = wire_format
+
+    def run(self, short_id: int, device_id: str, payload_len: int, duration_ms: int):
+        print(
+            f"\n[BLAST] {device_id} ({format_short_id(short_id)}): "
+            f"{payload_len} byte packets for {duration_ms}ms"
+        )
+        payload_len = len(BlastData.template(device_id, payload_len, self._wire_format))
+        attempt_send(
+            self._rfm69,
+            BlastRequest.encode(short_id, payload_len, duration_ms, self._wire_format),
+        )
+
+        received = 0
+        highest = -1
+        first_at = last_at = 0.0
+        sent = None
+        elapsed_s = 0.0
+        deadline = time.monotonic() + duration_ms / 1000.0 + SUMMARY_WAIT_S
+        while time.monotonic() < deadline:
+            message, _ = poll_message(self._rfm69)
+            if message is None:
+                wait_for_packet(self._rfm69)
+                continue
+            if getattr(message, "short_id", None) != short_id:
+                continue
+            if isinstance(message, BlastData):
+                last_at = time.monotonic()
+                if not received:
+                    first_at = last_at
+                received += 1
+                highest = max(highest, message.sequence)
+            elif isinstance(message, BlastSummary):
+                sent = message.sent
+                elapsed_s = message.elapsed_ms / 1000.0
+                break
+
+        print("\n" + "=" * 80)
+        print("BLAST RESULTS")
+        print("=" * 80)
+        if sent is None:
+            # Summary lost: estimate what was sent from the highest sequence
+            sent = highest + 1
+            elapsed_s = last_at - first_at
+            print("  No summary from the relay, sent count estimated")
+        loss = 100.0 * (1 - received / sent) if sent else 0.0
+        print(f"  Received {received}/{sent} packets, {loss:.1f}% lost")
+        report_rate(self._rfm69, "Received", received, payload_len, elapsed_s)
+        print("=" * 80 + "\n")
+
+
+def blast_relay(rfm69: adafruit_rfm69.RFM69, registry: Registry, wire_format: str):
+    """Measure throughput from one relay sending back to back"""
+    print("\n[CONTROLLER] Throughput Blast")
+    print("-" * 40)
+    if not len(registry):
+        print("\n[CONTROLLER] No relays known yet, request device info (q) first")
+        return
+    default = registry.device_id(next(iter(registry)))
+    target = get_user_input("Relay device id or short id", default)
+    relay = registry.find(target)
+    if relay is None:
+        print(f"[CONTROLLER] Unknown relay: {target}")
+        return
+    payload_len = int(
+        get_user_input(f"Payload length (bytes, max {MAX_PAYLOAD_LENGTH})", MAX_PAYLOAD_LENGTH)
+    )
+    duration_ms = int(get_user_input("Duration (ms, max 65535)", 5000))
+    # Both fit the binary request's u8 and u16 fields
+    payload_len = max(1, min(payload_len, MAX_PAYLOAD_LENGTH))
+    duration_ms = max(1, min(duration_ms, 0xFFFF))
+
+    indicate_processing()
+    session = BlastSession(rfm69, wire_format)
+    session.run(relay.short_id, relay.device_id, payload_len, duration_ms)
+    indicate_ready()
@@ -0,0 +1,269 @@
+import json
+import math
+from array import array
+from input import get_user_input
+from packets import format_short_id, short_device_id
+from stats import LinkStats
+
+# Per-relay fits, kept on the CIRCUITPY drive when it is writable
+CALIBRATION_FILE = "calibration.json"
+
+# Path loss covered by the distance lookup tables, in 1db steps
+LUT_MIN_DB = 0
+LUT_MAX_DB = 160
+
+# Two-sided 95% interval, normal approximation
+Z_95 = 1.96
+
+# Distinct calibration distances remembered per relay
+MAX_DISTANCES = 16
+
+
+class PathLossModel:
+    """Log-distance path loss: tx_power - rssi = A + 10 * n * log10(distance).
+
+    Distances are read from a table over the path loss in 1db steps with
+    linear interpolation, built on first use, so rendering a table does not
+    evaluate a power per row.
+    """
+
+    def __init__(self, a: float, n: float, sigma: float = 0.0):
+        self.a = a
+        self.n = n
+        self.sigma = sigma  # Residual standard deviation in db
+        # Distance factor covering 95% of the residuals either way
+        self.spread = 10 ** (Z_95 * sigma / (10 * n))
+        self._lut = None
+
+    def _build_lut(self):
+        self._lut = array(
+            "f",
+            (
+                10 ** ((loss - self.a) / (10 * self.n))
+                for loss in range(LUT_MIN_DB, LUT_MAX_DB + 1)
+            ),
+        )
+
+    def distance(self, tx_power: float, rssi: float) -> float:
+        if self._lut is None:
+            self._build_lut()
+        lut = self._lut
+        pos = tx_power - rssi - LUT_MIN_DB
+        if pos <= 0:
+            return lut[0]
+        if pos >= LUT_MAX_DB - LUT_MIN_DB:
+            return lut[-1]
+        index = int(pos)
+        return lut[index] + (lut[index + 1] - lut[index]) * (pos - index)
+
+    def interval(self, tx_power: float, rssi: float) -> tuple[float, float]:
+        """95% range of the distance given the scatter seen while fitting"""
+        distance = self.distance(tx_power, rssi)
+        return distance / self.spread, distance * self.spread
+
+
+class PathLossFit:
+    """Least squares fit of A and n for one relay, updated incrementally.
+
+    Only the sums of the regression are kept, so any number of packets at
+    any number of distances fits in a few floats.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xx = 0.0
+        self.sum_xy = 0.0
+        self.sum_yy = 0.0
+        self.distances = []
+
+    def add_stats(self, distance_m: float, tx_power: float, stats: LinkStats):
+        """Add every packet of a test run at a known distance.
+
+        Uses the run's mean and variance, which gives the same sums as
+        adding the packets one by one.
+        """
+        if stats.count == 0 or distance_m <= 0:
+            return
+        x = 10 * math.log10(distance_m)
+        loss = tx_power - stats.rssi_avg
+        squares = stats.rssi_variance * (stats.count - 1)
+        self.count += stats.count
+        self.sum_x += stats.count * x
+        self.sum_y += stats.count * loss
+        self.sum_xx += stats.count * x * x
+        self.sum_xy += stats.count * x * loss
+        self.sum_yy += stats.count * loss * loss + squares
+        if distance_m not in self.distances and len(self.distances) < MAX_DISTANCES:
+            self.distances.append(distance_m)
+
+    def solve(self) -> "PathLossFitResult | None":
+        """The fitted model, or None until there are two distances"""
+        count = self.count
+        denominator = count * self.sum_xx - self.sum_x * self.sum_x
+        if count < 3 or len(self.distances) < 2 or denominator <= 0:
+            return None
+        n = (count * self.sum_xy - self.sum_x * self.sum_y) / denominator
+        a = (self.sum_y - n * self.sum_x) / count
+        if n <= 0:
+            return None
+        residual = self.sum_yy - a * self.sum_y - n * self.sum_xy
+        sigma = math.sqrt(max(residual, 0.0) / (count - 2))
+        return PathLossFitResult(
+            PathLossModel(a, n, sigma),
+            sigma * math.sqrt(self.sum_xx / denominator),
+            sigma * math.sqrt(count / denominator),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "sums": [
+                self.count,
+                self.sum_x,
+                self.sum_y,
+                self.sum_xx,
+                self.sum_xy,
+                self.sum_yy,
+            ],
+            "distances": self.distances,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "PathLossFit":
+        fit = PathLossFit()
+        (
+            fit.count,
+            fit.sum_x,
+            fit.sum_y,
+            fit.sum_xx,
+            fit.sum_xy,
+            fit.sum_yy,
+        ) = data["sums"]
+        fit.distances = list(data["distances"])
+        return fit
+
+
+class PathLossFitResult:
+    def __init__(self, model: PathLossModel, a_error: float, n_error: float):
+        self.model = model
+        self.a_error = a_error  # Standard errors of the coefficients
+        self.n_error = n_error
+
+    def describe(self) -> str:
+        model = self.model
+        return (
+            f"A {model.a:.1f}db ±{Z_95 * self.a_error:.1f}, "
+            f"n {model.n:.2f} ±{Z_95 * self.n_error:.2f}, "
+            f"residual {model.sigma:.1f}db"
+        )
+
+
+class Calibration:
+    """Per-relay path loss models, from on-device fits or a host fit.
+
+    Relays are keyed by short id, the one id both wire formats carry, and
+    calibration.json stores it as 8 hex digits.
+    """
+
+    def __init__(self):
+        self._fits = {}  # short_id -> PathLossFit
+        self._models = {}  # short_id -> PathLossModel
+
+    def model(self, short_id: int) -> PathLossModel | None:
+        return self._models.get(short_id)
+
+    def add(self, short_id: int, distance_m: float, tx_power: float, stats: LinkStats):
+        """Add a test run at a known distance and refit the relay's model"""
+        fit = self._fits.get(short_id)
+        if fit is None:
+            fit = self._fits[short_id] = PathLossFit()
+        fit.add_stats(distance_m, tx_power, stats)
+        result = fit.solve()
+        if result is not None:
+            self._models[short_id] = result.model
+        return result
+
+    def clear(self):
+        self._fits = {}
+        self._models = {}
+
+    def prompt(self, results: dict, tx_power: int, name_of):
+        """Ask for the distance of every relay in `results` (short id ->
+        LinkStats of the last test), add them and save the calibration"""
+        print("\n[CONTROLLER] Distance Calibration")
+        print("-" * 40)
+        action = get_user_input("Add last test at known distances, or clear (a/c)", "a")
+        if action.lower() == "c":
+            self.clear()
+            print("[CONTROLLER] Calibration cleared")
+            self._save_or_warn()
+            return
+        if not results:
+            print("[CONTROLLER] No test results yet, run a test (s) first")
+            return
+
+        for short_id, stats in results.items():
+            device_id = name_of(short_id)
+            distance_m = float(get_user_input(f"Distance to {device_id} (m, 0 skips)", 0))
+            if distance_m <= 0:
+                continue
+            # Raw samples for fitting on the host with host/fit_path_loss.py
+            print(
+                "CALPOINT "
+                + json.dumps(
+                    {
+                        "device": device_id,
+                        "short_id": format_short_id(short_id),
+                        "distance_m": distance_m,
+                        "tx_power": tx_power,
+                        "samples": list(stats.samples()),
+                    }
+                )
+            )
+            result = self.add(short_id, distance_m, tx_power, stats)
+            if result is None:
+                print(f"  {device_id}: needs a second distance to fit")
+            else:
+                print(f"  {device_id}: {result.describe()}")
+        self._save_or_warn()
+
+    def _save_or_warn(self):
+        if not self.save():
+            print("[CONTROLLER] Calibration kept until reset, the drive is read-only")
+
+    def load(self):
+        try:
+            with open(CALIBRATION_FILE) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        for key, entry in data.items():
+            # Files written before relays were keyed by short id hold full ids
+            short_id = int(key, 16) if len(key) == 8 else short_device_id(key)
+            if "sums" in entry:
+                fit = PathLossFit.from_dict(entry)
+                self._fits[short_id] = fit
+                result = fit.solve()
+                if result is not None:
+                    self._models[short_id] = result.model
+            else:
+                # Coefficients fitted on the host
+                self._models[short_id] = PathLossModel(
+                    entry["a"], entry["n"], entry.get("sigma", 0.0)
+                )
+
+    def save(self) -> bool:
+        """Write the calibration, False if the drive is read-only"""
+        data = {}
+        for short_id, fit in self._fits.items():
+            data[format_short_id(short_id)] = fit.to_dict()
+        for short_id, model in self._models.items():
+            entry = data.setdefault(format_short_id(short_id), {})
+            entry.update({"a": model.a, "n": model.n, "sigma": model.sigma})
+        try:
+            with open(CALIBRATION_FILE, "w") as file:
+                json.dump(data, file)
+        except OSError:
+            return False
+        return True
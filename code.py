@@ -1,5 +1,9 @@
+import time
+
+boot_started = time.monotonic_ns()
+
+import gc
 import microcontroller
-from controller_mode import ControllerMode
 from input import MODE_CONTROLLER, MODE_RELAY
 from rfm_util import init_rfm69
 from relay_mode import RelayMode
@@ -13,7 +17,8 @@ if rfm69 is None:
 
 current_mode = MODE_RELAY
 relay_mode = RelayMode(rfm69, DEVICE_ID)
-controller_mode = ControllerMode(rfm69, DEVICE_ID)
+# Most devices only ever relay, so controller code is imported on first use
+controller_mode = None
 
 
 # Print device state:
@@ -26,6 +31,12 @@ print(f"Frequency: {rfm69.frequency_mhz}mhz")
 print(f"Bit rate: {rfm69.bitrate / 1000}kbit/s")
 print(f"Frequency deviation: {rfm69.frequency_deviation}hz")
 print(f"Transmit power: {rfm69.tx_power}dbm")
+gc.collect()
+boot_ms = (time.monotonic_ns() - boot_started) // 1_000_000
+if hasattr(gc, "mem_free"):
+    print(f"Boot: {boot_ms}ms, {gc.mem_free()} bytes free")
+else:
+    print(f"Boot: {boot_ms}ms")
 print("=" * 50)
 print(f"\nStarting in RELAY mode...")
 print("Press any key to switch to CONTROLLER mode")
@@ -37,6 +48,17 @@ while True:
         if current_mode == MODE_RELAY:
             current_mode = relay_mode.run()
         elif current_mode == MODE_CONTROLLER:
+            if controller_mode is None:
+                load_started = time.monotonic_ns()
+                from controller_mode import ControllerMode
+
+                controller_mode = ControllerMode(rfm69, DEVICE_ID)
+                gc.collect()
+                load_ms = (time.monotonic_ns() - load_started) // 1_000_000
+                if hasattr(gc, "mem_free"):
+                    print(f"\nController mode loaded in {load_ms}ms, {gc.mem_free()} bytes free")
+                else:
+                    print(f"\nController mode loaded in {load_ms}ms")
             current_mode = controller_mode.run()
     except Exception as e:
         indicate_error(f"Error in main loop: {e}")
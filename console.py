@@ -0,0 +1,90 @@
+DEBUG = 10
+INFO = 20
+WARNING = 30
+
+# Lines held until the radio is idle; more are counted as dropped
+CONSOLE_CAPACITY = 64
+
+# Lines printed per flush() call, so one call stays short
+FLUSH_LINES = 8
+
+MODE_BUFFERED = "buffered"
+MODE_QUIET = "quiet"
+MODE_DIRECT = "direct"
+MODES = (MODE_BUFFERED, MODE_QUIET, MODE_DIRECT)
+
+
+class Console:
+    """Leveled status lines, printed when the radio has nothing to do.
+
+    A print over USB can block for milliseconds, so lines go into a ring
+    of preallocated slots as a format string and its arguments, and are
+    only formatted and printed by flush(), which the loops call when no
+    packet is waiting and no transmission is due. Quiet mode keeps just
+    warnings, direct mode prints at once as plain print() would.
+    """
+
+    def __init__(self, capacity: int = CONSOLE_CAPACITY):
+        self.mode = MODE_BUFFERED
+        self.level = DEBUG
+        self.dropped = 0
+        self._texts = [None] * capacity
+        self._args = [None] * capacity
+        self._head = 0  # Slot of the oldest line
+        self._count = 0
+
+    def set_mode(self, mode: str):
+        self.flush_all()
+        self.mode = mode
+        self.level = WARNING if mode == MODE_QUIET else DEBUG
+
+    @property
+    def pending(self) -> int:
+        return self._count
+
+    def log(self, level: int, text: str, args: tuple):
+        if level < self.level:
+            return
+        if self.mode == MODE_DIRECT:
+            print(text.format(*args) if args else text)
+            return
+        if self._count == len(self._texts):
+            self.dropped += 1
+            return
+        slot = (self._head + self._count) % len(self._texts)
+        self._texts[slot] = text
+        self._args[slot] = args
+        self._count += 1
+
+    def debug(self, text: str, *args):
+        self.log(DEBUG, text, args)
+
+    def info(self, text: str, *args):
+        self.log(INFO, text, args)
+
+    def warning(self, text: str, *args):
+        self.log(WARNING, text, args)
+
+    def flush(self, limit: int = FLUSH_LINES) -> int:
+        """Print up to `limit` held lines, returning how many were printed"""
+        printed = 0
+        while self._count and printed < limit:
+            slot = self._head
+            text, args = self._texts[slot], self._args[slot]
+            self._texts[slot] = self._args[slot] = None
+            self._head = (slot + 1) % len(self._texts)
+            self._count -= 1
+            print(text.format(*args) if args else text)
+            printed += 1
+        if not self._count and self.dropped:
+            print(f"[CONSOLE] {self.dropped} lines dropped, the buffer was full")
+            self.dropped = 0
+        return printed
+
+    def flush_all(self):
+        """Print everything held, before output that must come after it"""
+        while self.flush():
+            pass
+
+
+console = Console()
@@ -0,0 +1,126 @@
+import adafruit_rfm69
+from diag_packets import DownlinkData, DownlinkSummary
+from packets import RunTestResponse, TestParameters, airtime_s
+from rfm_util import attempt_send
+from stats import bitmap_bursts
+
+
+class DownlinkTest:
+    """The controller's half of a downlink test: it sends the packets, and
+    every relay counts them and answers with one summary.
+
+    The packets go straight to the relays, like a ping, to measure the
+    direct link.
+    """
+
+    def __init__(
+        self,
+        rfm69: adafruit_rfm69.RFM69,
+        device_id: str,
+        params: TestParameters,
+        wire_format: str,
+        started_at: float,
+    ):
+        self._rfm69 = rfm69
+        self._device_id = device_id
+        self._params = params
+        self._wire_format = wire_format
+        self._started_at = started_at
+        self.next_packet = 0
+        # short_id -> [received, expected, RSSI min, max, avg, packets covered
+        # by the bitmap, bitmap] from the relays' summaries
+        self.results = {}
+
+    def service(self, now: float):
+        """Send the next packet once it is due"""
+        params = self._params
+        if self.next_packet >= params.num_packets:
+            return
+        if now < self._started_at + self.next_packet * params.delay_ms / 1000.0:
+            return
+        attempt_send(
+            self._rfm69,
+            DownlinkData.encode(params.test_id, self.next_packet, self._wire_format),
+        )
+        self.next_packet += 1
+
+    def add(self, message: DownlinkSummary):
+        self.results[message.short_id] = [
+            message.received,
+            message.expected,
+            message.rssi_min,
+            message.rssi_max,
+            message.rssi_avg,
+            message.covered,
+            bytes(message.bitmap[: (message.covered + 7) // 8]),
+        ]
+
+    def render(self, uplink: dict, name_of, bitrate: float):
+        """Print the relays' summaries next to `uplink`, the LinkStats of the
+        summaries as received here"""
+        print("\nDownlink, measured by the relays (Uplink = RSSI of the summary here):")
+        print(
+            "| Device | Received | Packet Loss | RSSI Min | RSSI Max | RSSI Avg "
+            "| Max Burst | Uplink | Down-Up |"
+        )
+        print(
+            "|--------|----------|-------------|----------|----------|----------"
+            "|-----------|--------|---------|"
+        )
+        partial = False
+        for short_id, entry in self.results.items():
+            received, expected, rssi_min, rssi_max, rssi_avg, covered, bitmap = entry
+            loss = 100.0 * (1 - received / expected) if expected else 0.0
+            longest = "-"
+            if covered:
+                longest = str(bitmap_bursts(bitmap, covered)[0])
+                partial = partial or covered < expected
+            uplink_avg = uplink[short_id].rssi_avg
+            print(
+                f"| {name_of(short_id):<6} | {received:>4}/{expected:<3} | {loss:>10.1f}% "
+                f"| {rssi_min:>8.1f} | {rssi_max:>8.1f} | {rssi_avg:>8.1f} | {longest:>9} "
+                f"| {uplink_avg:>6.1f} | {rssi_avg - uplink_avg:>7.1f} |"
+            )
+        if partial:
+            print("  Max Burst covers only the packets whose bits fit in the summary")
+
+        # Airtime the relays spent answering, against one response per packet
+        params = self._params
+        n = params.num_packets
+        summary_len = len(
+            DownlinkSummary.encode(
+                self._device_id, params.test_id, n, n, 0, 0, 0, bytearray((n + 7) // 8),
+                self._wire_format,
+            )
+        )
+        response_len = len(
+            RunTestResponse.encode(self._device_id, 0, self._wire_format, params.test_id)
+        )
+        summary_ms = airtime_s(summary_len, bitrate) * 1000
+        responses_ms = n * airtime_s(response_len, bitrate) * 1000
+        print(
+            f"  Uplink per relay: one {summary_len} byte summary, {summary_ms:.1f}ms on air, "
+            f"instead of {n} responses, {responses_ms:.1f}ms ({responses_ms / summary_ms:.1f}x)"
+        )
+
+    def as_dict(self, name_of) -> dict:
+        return {
+            name_of(short_id): {
+                "received": received,
+                "expected": expected,
+                "rssi_min": rssi_min,
+                "rssi_max": rssi_max,
+                "rssi_avg": rssi_avg,
+                "covered": covered,
+                "bitmap": bitmap.hex(),
+            }
+            for short_id, (
+                received,
+                expected,
+                rssi_min,
+                rssi_max,
+                rssi_avg,
+                covered,
+                bitmap,
+            ) in self.results.items()
+        }
@@ -0,0 +1,87 @@
+import time
+import adafruit_rfm69
+from input import get_user_input
+from packets import WIRE_FORMAT_BINARY, Flood, RunTestResponse, short_device_id
+from flood import DEFAULT_FLOOD_HOPS, FORWARD_JITTER_MS, FloodRouter
+
+
+class FloodControl:
+    """The controller's end of multi-hop forwarding: requests sent as floods,
+    and the paths the relays' test packets took back"""
+
+    def __init__(self, rfm69: adafruit_rfm69.RFM69, device_id: str):
+        # Hops relays may forward requests and answers over, 0 sends direct
+        self.hops = 0
+        self.router = FloodRouter(rfm69, short_device_id(device_id), forwarding=False)
+        # short_id -> [packets, fewest hops, most hops, last per-hop RSSI]
+        self.paths = {}
+
+    @property
+    def forward_delay_s(self) -> float:
+        """How long forwarders can hold a packet on its way, a jitter per hop"""
+        return self.hops * FORWARD_JITTER_MS / 1000.0
+
+    def send(self, packet: bytes, wire_format: str):
+        self.router.send(packet, self.hops, wire_format)
+
+    def unwrap(self, message: Flood, rssi: float):
+        """The packet a flood carries, the first time it arrives, after noting
+        the hops it took; None for repeats and echoes of the controller's own"""
+        if not self.router.receive(message, rssi, time.monotonic()):
+            return None
+        hops = message.hops
+        path = [message.rssi[i] for i in range(hops)] + [round(rssi)]
+        inner = message.inner()
+        if isinstance(inner, RunTestResponse):
+            entry = self.paths.get(inner.short_id)
+            if entry is None:
+                entry = self.paths[inner.short_id] = [0, hops, hops, path]
+            entry[0] += 1
+            entry[1] = min(entry[1], hops)
+            entry[2] = max(entry[2], hops)
+            entry[3] = path
+        return inner
+
+    def configure(self, wire_format: str):
+        """Choose how many hops relays forward requests and answers over"""
+        print("\n[CONTROLLER] Multi-hop Forwarding")
+        print("-" * 40)
+        default = self.hops or DEFAULT_FLOOD_HOPS
+        hops = int(get_user_input(f"Hops, 0 sends direct (max {Flood.MAX_HOPS})", default))
+        self.hops = max(0, min(hops, Flood.MAX_HOPS))
+        self.router.reset()
+        if not self.hops:
+            print("[CONTROLLER] Forwarding off, requests go straight to relays")
+            return
+        print(
+            f"[CONTROLLER] Requests and answers are forwarded over up to "
+            f"{self.hops} hops; ping and blast stay direct"
+        )
+        if wire_format != WIRE_FORMAT_BINARY:
+            print(
+                "[CONTROLLER] Text packets that leave no room for the flood "
+                "envelope go out direct, the binary format (f) fits them all"
+            )
+
+    def render(self, name_of):
+        print("\nMulti-hop paths of test packets (RSSI at each hop, from the relay inward):")
+        print("| Device | Packets | Hops | Last Path |")
+        print("|--------|---------|------|-----------|")
+        for short_id, (packets, fewest, most, path) in self.paths.items():
+            hops = str(fewest) if fewest == most else f"{fewest}-{most}"
+            print(
+                f"| {name_of(short_id):<6} | {packets:>7} | {hops:>4} "
+                f"| {' > '.join(f'{value}db' for value in path)} |"
+            )
+        print(f"  Flood at the controller: {self.router.describe()}")
+
+    def as_dict(self, name_of) -> dict:
+        return {
+            name_of(short_id): {
+                "packets": packets,
+                "min_hops": fewest,
+                "max_hops": most,
+                "rssi": path,
+            }
+            for short_id, (packets, fewest, most, path) in self.paths.items()
+        }
@@ -0,0 +1,156 @@
+from input import get_user_input
+from packets import TestParameters
+from console import MODES, console
+from runlog import RunLog
+
+# Spacing of channel groups when none is configured, wide enough for the
+# occupied bandwidth at the highest bitrates a test uses
+DEFAULT_CHANNEL_STEP_KHZ = 1000
+
+
+def _yes(text: str) -> bool:
+    return text.lower() in ["true", "t", "1", "yes", "y"]
+
+
+def show_help(params: TestParameters, wire_format: str):
+    """Display help menu"""
+    print("\n" + "=" * 50)
+    print("CONTROLLER MODE ACTIVATED")
+    print("=" * 50)
+    print("Commands:")
+    print("  r - Return to relay mode")
+    print("  s - Start test (send command to relays)")
+    print("  x - Abort the running test")
+    print("  c - Configure test parameters")
+    print("  d - Configure distance calculation parameters")
+    print("  k - Calibrate distance estimates at known distances")
+    print("  p - Show current parameters")
+    print("  w - Sweep a grid of test parameters")
+    print("  t - Show results table")
+    print("  j - Print results as JSON")
+    print("  l - Dump or clear the run log")
+    print("  m - Toggle machine mode (binary result frames)")
+    print("  q - Request relay device info")
+    print("  v - List known relays")
+    print("  g - Ping relays and measure round-trip time")
+    print("  b - Measure throughput with a blast from one relay")
+    print("  u - Profile hot paths here or on one relay")
+    print("  n - Scan the band for noise and other transmitters")
+    print("  e - Console output: buffered, quiet or direct")
+    print("  y - Multi-hop forwarding through relays")
+    print("  o - Monitor links continuously with relay heartbeats")
+    print("  i - Show local device info")
+    print("  f - Toggle wire format (text/binary)")
+    print("  h - Show this help menu")
+    print("=" * 50 + "\n")
+
+    print(f"Current test parameters:")
+    print(f"  Packets: {params.num_packets}")
+    print(f"  Delay: {params.delay_ms}ms")
+    print(f"  High Power: {params.high_power}")
+    print(f"  TX Power: {params.tx_power}db")
+    print(f"  Wire Format: {wire_format}")
+    print()
+
+
+def _print_params(params: TestParameters):
+    print(f"  Packets: {params.num_packets}")
+    print(f"  Delay: {params.delay_ms}ms")
+    print(f"  Stagger: {params.stagger_ms}ms")
+    print(f"  High Power: {params.high_power}")
+    print(f"  TX Power: {params.tx_power}db")
+    print(f"  Slot: {params.slot_ms}ms")
+    print(f"  Channels: {params.channels}, {params.channel_step_khz}khz apart")
+
+
+def configure_test(params: TestParameters, min_slot_ms: int):
+    """Ask for every test parameter, changing `params` in place"""
+    print("\n[CONTROLLER] Configure Test Parameters")
+    print("-" * 40)
+
+    num_packets = int(get_user_input("Number of packets", params.num_packets))
+    delay_ms = int(get_user_input("Delay between packets (ms)", params.delay_ms))
+    stagger_ms = int(
+        get_user_input("Stagger (random delay) between packets (ms)", params.stagger_ms)
+    )
+    high_power = _yes(get_user_input("High power mode (true/false)", params.high_power))
+    tx_power = int(get_user_input("TX power (db)", params.tx_power))
+    slot_ms = int(
+        get_user_input(
+            f"Slot length (ms, 0 = random stagger, min {min_slot_ms})", params.slot_ms
+        )
+    )
+    channels = int(get_user_input("Channel groups (1 = single channel)", params.channels))
+    downlink = _yes(
+        get_user_input("Downlink test, the controller sends (true/false)", params.downlink)
+    )
+    channel_step_khz = params.channel_step_khz
+    if channels > 1:
+        channel_step_khz = int(
+            get_user_input(
+                "Channel spacing (khz)", channel_step_khz or DEFAULT_CHANNEL_STEP_KHZ
+            )
+        )
+
+    # Packed as 16 bits in requests, the run log and stream frames
+    params.num_packets = max(0, min(num_packets, 0xFFFF))
+    params.delay_ms = max(0, min(delay_ms, 0xFFFF))
+    params.stagger_ms = max(0, min(stagger_ms, 0xFFFF))
+    params.high_power = high_power
+    params.tx_power = tx_power
+    params.slot_ms = slot_ms
+    params.channels = max(1, min(channels, 255))
+    params.channel_step_khz = channel_step_khz
+    params.downlink = downlink
+
+    print("\n[CONTROLLER] Parameters updated:")
+    _print_params(params)
+    print(f"  Downlink: {params.downlink}\n")
+
+
+def configure_distance(distance_a: float) -> float:
+    """Ask for the signal strength at 1 meter the distance estimates use"""
+    print("\n[CONTROLLER] Configure Distance Parameters")
+    print("-" * 40)
+
+    distance_a = float(get_user_input("A value (signal @ 1m)", distance_a))
+
+    print("\n[CONTROLLER] Distance parameters updated:")
+    print(f"  A: {distance_a}db")
+    return distance_a
+
+
+def show_params(params: TestParameters, wire_format: str, distance_a: float):
+    print(f"\n[CONTROLLER] Current test parameters:")
+    _print_params(params)
+    print(f"  Downlink: {params.downlink}")
+    print(f"  Wire Format: {wire_format}")
+    print(f"\nDistance calculation parameters:")
+    print(f"  A (signal @ 1m): {distance_a}db")
+
+
+def choose_console_mode():
+    """Choose how status lines reach the serial console"""
+    print("\n[CONTROLLER] Console Output")
+    print("-" * 40)
+    print("  buffered - printed when the radio is idle")
+    print("  quiet    - only warnings, for timing-sensitive tests")
+    print("  direct   - printed at once")
+    mode = get_user_input("Mode (" + "/".join(MODES) + ")", console.mode).lower()
+    if mode not in MODES:
+        print(f"[CONTROLLER] Unknown mode: {mode}")
+        return
+    console.set_mode(mode)
+    print(f"[CONTROLLER] Console output {mode}")
+
+
+def dump_log(log: RunLog, names: dict):
+    """Print the on-flash run log, or clear it"""
+    print(f"\n[CONTROLLER] Run Log ({log.location}, {log.capacity} records)")
+    print("-" * 40)
+    action = get_user_input("Dump or clear (d/c)", "d")
+    if action.lower() == "c":
+        log.clear()
+        print("[CONTROLLER] Run log cleared")
+        return
+    log.dump(names)
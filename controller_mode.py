@@ -1,22 +1,77 @@
 import time
 import adafruit_rfm69
 from input import MODE_RELAY, get_user_command, get_user_input
+from diag_packets import (
+    BlastData,
+    BlastSummary,
+    DownlinkSummary,
+    Heartbeat,
+    MonitorRequest,
+    PingResponse,
+    StatsRequest,
+    StatsResponse,
+)
 from packets import (
+    DEFAULT_WIRE_FORMAT,
+    MAX_DRAIN_PACKETS,
+    WIRE_FORMAT_BINARY,
+    WIRE_FORMAT_TEXT,
+    AbortTestRequest,
+    Flood,
     InfoRequest,
     InfoResponse,
-    RunTestRequest,
     RunTestResponse,
-    TestParameters,
+    TestAck,
     check_for_message,
+    poll_message,
+    wait_for_packet,
+)
+from calibration import Calibration, PathLossModel
+from console import console
+from controller_menus import (
+    choose_console_mode,
+    configure_distance,
+    configure_test,
+    dump_log,
+    show_help,
+    show_params,
 )
+from controller_test import TestSession
+from perf import Counter, profiler, render_counters
+from registry import Registry
+from runlog import RunLog
 from rfm_util import attempt_send
 from rgb_indicator import indicate_processing, indicate_ready
 
-
-class TestResult:
-    def __init__(self):
-        self.sequence: int = 0
-        self.rssi: float = 0.0
+# The range test itself is in controller_test, its reports in
+# controller_output and the prompts in controller_menus. Rarely used commands
+# (ping, blast, scan, sweep, monitoring, forwarding, downlink tests and
+# machine mode) import their modules when first run, so a controller compiles
+# and keeps in RAM only the code of the commands it uses.
+
+# How long to collect a relay's profiling counters after asking for them
+STATS_WAIT_S = 1.0
+
+# Profiling actions by the name typed at the prompt
+STATS_ACTIONS = {
+    "show": StatsRequest.ACTION_SHOW,
+    "on": StatsRequest.ACTION_ENABLE,
+    "off": StatsRequest.ACTION_DISABLE,
+    "reset": StatsRequest.ACTION_RESET,
+}
+
+# Packets only relays send, which keep their registry entries fresh
+RELAY_RESPONSES = (
+    RunTestResponse,
+    InfoResponse,
+    PingResponse,
+    BlastData,
+    BlastSummary,
+    StatsResponse,
+    TestAck,
+    DownlinkSummary,
+    Heartbeat,
+)
 
 
 class ControllerMode:
@@ -24,228 +79,474 @@ class ControllerMode:
     def __init__(self, rfm69: adafruit_rfm69.RFM69, device_id: str):
         self._rfm69 = rfm69
         self._device_id = device_id
-        self._test_params = TestParameters()
+        self._wire_format = DEFAULT_WIRE_FORMAT
         self._distance_A = 35  # Estimated signal strength at 1 meter
-        self._test_running = False
-        self._test_timeout = 0.0
-        self._test_run_results = {}  # device_id -> list of TestResult
+        self._registry = Registry()  # Relays heard from, by short id
+        self._log = RunLog()
+        self._log.open()
+        self._test = TestSession(rfm69, device_id, self._registry, self._log, self._broadcast)
+        self._monitor = None  # Monitor while monitoring links
+        self._flood = None  # FloodControl, from the first time forwarding is used
+        self._sweep = None  # Sweep running, if any
+        self._next_sweep_at = 0.0
+        self._distance_models = {}  # n -> PathLossModel with _distance_A
+        self._calibration = Calibration()
+        self._calibration.load()
 
     def _calculate_distance(self, tx_power, rssi, n):
         """Calculate distance based on RSSI using path loss model"""
-        return 10 ** ((tx_power - rssi - self._distance_A) / (10 * n))
+        model = self._distance_models.get(n)
+        if model is None or model.a != self._distance_A:
+            model = self._distance_models[n] = PathLossModel(self._distance_A, n)
+        return model.distance(tx_power, rssi)
+
+    @property
+    def _flood_hops(self) -> int:
+        return self._flood.hops if self._flood is not None else 0
+
+    def _flood_control(self):
+        """The FloodControl, imported and created on first use"""
+        if self._flood is None:
+            from controller_flood import FloodControl
+            profiler.instrument("flood")
+
+            self._flood = FloodControl(self._rfm69, self._device_id)
+        return self._flood
+
+    def _broadcast(self, packet: bytes):
+        """Send a request straight to relays, or as a flood they forward"""
+        if self._flood_hops:
+            self._flood.send(packet, self._wire_format)
+        else:
+            attempt_send(self._rfm69, packet)
+
+    def _start_test(self):
+        """Send the test command to relays and start collecting results"""
+        print("\n[CONTROLLER] Sending test command to relays...")
+        indicate_processing()
+        if self._flood is not None:
+            self._flood.paths = {}
+        forward_delay_s = self._flood.forward_delay_s if self._flood is not None else 0.0
+        self._test.start(self._wire_format, forward_delay_s)
+
+    def _end_test(self, reason: str):
+        """Stop the running test and say how it ended, on the console and in
+        machine mode's run summary"""
+        test = self._test
+        test.end()
+        if self._monitor is not None:
+            # Relays hold their heartbeats during a test
+            self._monitor.resume(time.monotonic())
+        elapsed = time.monotonic() - test.started_at
+        if reason == "aborted":
+            print("[CONTROLLER] Test run aborted")
+        else:
+            print(f"\n[CONTROLLER] Test run complete! ({reason}, {elapsed:.1f}s)")
+        indicate_ready()
+        if test.streaming:
+            test.stream.run_end(
+                self._log.run_id, reason, elapsed, test.results, self._registry.device_id
+            )
 
     def _render_results_table(self):
-        """Render results as a markdown table"""
-        if not self._test_run_results:
-            print("No test results yet")
-            return
+        from controller_output import render_results_table
+
+        render_results_table(
+            self._test,
+            self._registry.device_id,
+            self._calibration,
+            self._distance_A,
+            self._calculate_distance,
+            self._flood,
+        )
+
+    def _print_results_json(self):
+        from controller_output import print_results_json
+
+        print_results_json(self._test, self._registry.device_id, self._flood)
+
+    def _calibrate(self):
+        """Fit per-relay path loss models from the last test at known distances"""
+        self._calibration.prompt(
+            self._test.results, self._test.params.tx_power, self._registry.device_id
+        )
 
-        print("\n" + "=" * 80)
-        print("TEST RESULTS TABLE")
-        print("=" * 80)
+    def _ping(self):
+        from ping import ping_relays
+        profiler.instrument("ping")
+
+        ping_relays(self._rfm69, self._registry, self._wire_format)
+
+    def _configure_sweep(self):
+        """Ask for the grid of settings to sweep and start the first test"""
+        from sweep import configure_sweep
+
+        self._sweep = configure_sweep(
+            self._test.params,
+            self._test.default_bitrate,
+            self._test.default_frequency_deviation,
+            self._registry.device_id,
+        )
+        self._next_sweep_at = time.monotonic()
 
-        # Calculate distances for different n values
+    def _start_sweep_test(self):
+        sweep = self._sweep
+        self._test.params = sweep.next_config()
         print(
-            "\n| Device | TX Power | RSSI Min | RSSI Max | RSSI Avg | Packet Loss | Dist(n=2) | Dist(n=3) | Dist(n=4) |"
+            f"\n[SWEEP] Configuration {sweep.index + 1}/{len(sweep.configs)}: "
+            f"{sweep.describe(sweep.index)}"
         )
+        self._start_test()
+
+    def _sweep_test_done(self):
+        """Record the finished sweep test and schedule the next one"""
+        from sweep import SWEEP_GAP_S
+
+        sweep = self._sweep
+        sweep.record(self._test.results)
+        if not sweep.done:
+            self._next_sweep_at = time.monotonic() + SWEEP_GAP_S
+            return
+        self._finish_sweep()
+
+    def _finish_sweep(self):
+        sweep = self._sweep
+        self._sweep = None
+        self._test.params = sweep.base
+        sweep.report(self._calculate_distance)
+
+    def _blast(self):
+        from blast import blast_relay
+        profiler.instrument("blast")
+
+        blast_relay(self._rfm69, self._registry, self._wire_format)
+
+    def _scan(self):
+        if self._test.running:
+            print("\n[CONTROLLER] Wait for the running test to finish, or abort it (x)")
+            return
+        from scan import scan_band
+
+        scan_band(self._rfm69)
+
+    def _configure_monitor(self):
+        """Start, change or stop monitoring with relay heartbeats"""
+        from monitor import DEFAULT_HEARTBEAT_S, MONITOR_REPORT_S, Monitor
+
+        print("\n[CONTROLLER] Link Monitoring")
+        print("-" * 40)
+        now = time.monotonic()
+        if self._monitor is not None:
+            self._monitor.render(now)
+        default = self._monitor.interval_s if self._monitor is not None else DEFAULT_HEARTBEAT_S
+        interval_s = int(get_user_input("Heartbeat interval (s, 0 stops)", default))
+        interval_s = max(0, min(interval_s, 0xFFFF))
+        self._broadcast(MonitorRequest.encode(interval_s, self._wire_format))
+        if not interval_s:
+            self._monitor = None
+            print("[CONTROLLER] Monitoring stopped")
+            return
+        if self._monitor is None:
+            self._monitor = Monitor(interval_s, self._registry.device_id)
+            self._monitor.start(now)
+        self._monitor.interval_s = interval_s
+        self._monitor.request_sent(now)
         print(
-            "|--------|----------|-----------|-----------|-----------|-------------|-----------|-----------|-----------|"
+            f"[CONTROLLER] Relays send a heartbeat every {interval_s}s; ALERT lines "
+            f"report degraded links, MONITOR lines every {MONITOR_REPORT_S:.0f}s the windows"
         )
 
-        for device_id, results in self._test_run_results.items():
-            rssi_min = min(result.rssi for result in results)
-            rssi_max = max(result.rssi for result in results)
-            rssi_avg = sum(result.rssi for result in results) / len(results)
+    def _service_monitor(self, now: float):
+        monitor = self._monitor
+        if monitor is None or self._test.running:
+            return
+        if monitor.refresh_due(now):
+            self._broadcast(MonitorRequest.encode(monitor.interval_s, self._wire_format))
+            monitor.request_sent(now)
+        monitor.service(now)
+
+    def _profile(self):
+        """Switch, reset or show the hot path counters here or on one relay"""
+        print("\n[CONTROLLER] Profiling")
+        print("-" * 40)
+        target = get_user_input("Relay device id or short id (local)", "local")
+        action = get_user_input("Action (show/on/off/reset)", "show").lower()
+        if action not in STATS_ACTIONS:
+            print(f"[CONTROLLER] Unknown action: {action}")
+            return
 
-            packet_loss = 100.0 * (1 - (len(results) / self._test_params.num_packets))
+        if target.lower() == "local":
+            if action == "show":
+                counters = profiler.snapshot()
+                if self._flood is not None:
+                    flood_counters = self._flood.router.snapshot()
+                    if any(counter.calls for counter in flood_counters):
+                        counters += flood_counters
+                render_counters(f"Profile of {self._device_id} (controller)", counters)
+            elif action == "on":
+                profiler.enable()
+            elif action == "off":
+                profiler.disable()
+            else:
+                profiler.reset()
+                if self._flood is not None:
+                    self._flood.router.reset()
+            print(f"[CONTROLLER] Profiling {'on' if profiler.enabled else 'off'}")
+            return
 
-            tx_power = self._test_params.tx_power
-            dist_n2 = self._calculate_distance(tx_power, rssi_avg, 2.0)
-            dist_n3 = self._calculate_distance(tx_power, rssi_avg, 3.0)
-            dist_n4 = self._calculate_distance(tx_power, rssi_avg, 4.0)
+        found = self._registry.find(target)
+        if found is None:
+            print(f"[CONTROLLER] Unknown relay: {target}")
+            return
+        relay = (found.short_id, found.device_id)
 
-            print(
-                f"| {device_id:<6} | {tx_power:>8}db | {rssi_min:>9.1f} | {rssi_max:>9.1f} | {rssi_avg:>9.1f} | {packet_loss:>10.1f}% | {dist_n2:>8.1f}m | {dist_n3:>8.1f}m | {dist_n4:>8.1f}m |"
-            )
+        self._broadcast(
+            StatsRequest.encode(relay[0], STATS_ACTIONS[action], self._wire_format)
+        )
+        if action != "show":
+            print(f"[CONTROLLER] Sent profiling {action} to {relay[1]}")
+            return
+
+        # Decoded messages are reused, so copy each counter as it arrives
+        counters = {}
+        expected = None
+        deadline = time.monotonic() + STATS_WAIT_S * (1 + self._flood_hops)
+        while time.monotonic() < deadline and len(counters) != expected:
+            message, rssi = check_for_message(self._rfm69, 0.1)
+            if isinstance(message, Flood):
+                message = self._flood_control().unwrap(message, rssi)
+            if not isinstance(message, StatsResponse) or message.short_id != relay[0]:
+                continue
+            expected = message.count
+            counter = Counter(message.name)
+            counter.calls = message.calls
+            if message.name == "heap":
+                counter.total_ns = message.total_ms
+                counter.max_ns = message.max_us
+            else:
+                counter.total_ns = message.total_ms * 1_000_000
+                counter.max_ns = message.max_us * 1000
+            counters[message.index] = counter
+
+        if not counters:
+            print(f"[CONTROLLER] No profile from {relay[1]}")
+            return
+        if len(counters) != expected:
+            print(f"[CONTROLLER] Only {len(counters)}/{expected} counters arrived")
+        render_counters(
+            f"Profile of {relay[1]} (relay)",
+            [counters[index] for index in sorted(counters)],
+        )
+
+    def _toggle_machine_mode(self):
+        test = self._test
+        if test.stream is None:
+            from stream import ResultStream
 
-        print("\nDistance calculation parameters:")
-        print(f"  A (signal @ 1m): {self._distance_A}db")
-        print("=" * 80 + "\n")
-
-    def _show_help(self):
-        """Display help menu"""
-        print("\n" + "=" * 50)
-        print("CONTROLLER MODE ACTIVATED")
-        print("=" * 50)
-        print("Commands:")
-        print("  r - Return to relay mode")
-        print("  s - Start test (send command to relays)")
-        print("  c - Configure test parameters")
-        print("  d - Configure distance calculation parameters")
-        print("  p - Show current parameters")
-        print("  t - Show results table")
-        print("  q - Request relay device info")
-        print("  i - Show local device info")
-        print("  h - Show this help menu")
-        print("=" * 50 + "\n")
-
-        print(f"Current test parameters:")
-        print(f"  Packets: {self._test_params.num_packets}")
-        print(f"  Delay: {self._test_params.delay_ms}ms")
-        print(f"  High Power: {self._test_params.high_power}")
-        print(f"  TX Power: {self._test_params.tx_power}db")
-        print()
+            test.stream = ResultStream()
+        test.stream.enabled = not test.stream.enabled
+        if not test.stream.enabled:
+            print("\n[CONTROLLER] Machine mode off")
+            return
+        port = "the data serial port" if test.stream.separate_port else "the console"
+        print(
+            f"\n[CONTROLLER] Machine mode on: results go to {port} as binary "
+            "frames for host/collect.py"
+        )
+
+    def _handle_message(self, message, rssi: float, received_at: float):
+        """Process one packet from a relay"""
+        if isinstance(message, Flood):
+            message = self._flood_control().unwrap(message, rssi)
+            if message is None:
+                return
+        if isinstance(message, InfoResponse):
+            self._registry.update_info(message, rssi, received_at)
+        elif isinstance(message, RELAY_RESPONSES):
+            self._registry.seen(message.short_id, message.device_id, rssi, received_at)
+
+        if isinstance(message, RunTestResponse):
+            self._test.add_response(message, rssi, received_at)
+        elif isinstance(message, DownlinkSummary):
+            self._test.add_summary(message, rssi, received_at)
+        elif isinstance(message, InfoResponse):
+            if self._test.streaming:
+                self._test.stream.device(message)
+            console.info("\n[CONTROLLER] Received device info | RSSI: {}db", rssi)
+            console.info("  Device ID: {}", message.device_id)
+            console.info("  High Power: {}", message.high_power)
+            console.info("  TX Power: {}dbm", message.tx_power)
+            console.info("  Temperature: {}C", message.temperature)
+            console.info("  Frequency: {}mhz", message.frequency_mhz)
+            console.info("  Bitrate: {:.1f}kbit/s", message.bitrate_kbps / 1000)
+            console.info("  Frequency Deviation: {}hz\n", message.frequency_deviation)
+        elif isinstance(message, Heartbeat):
+            if self._monitor is not None:
+                self._monitor.add(
+                    message.short_id, message.sequence, rssi, received_at
+                )
+        elif isinstance(message, TestAck):
+            self._test.add_ack(message)
+        elif isinstance(
+            message, (PingResponse, BlastData, BlastSummary, StatsResponse)
+        ):
+            pass  # Late reply to a ping, blast or profile that already ended
+        else:
+            # Decoded messages are reused, so describe it now
+            console.warning(
+                "[CONTROLLER] Received unhandled message: {} | RSSI: {}db",
+                str(message),
+                rssi,
+            )
 
     def run(self):
         """Controller mode - send commands to relays"""
-        self._show_help()
+        test = self._test
+        show_help(test.params, self._wire_format)
         indicate_ready()
+        self._rfm69.listen()
 
         while True:
+            if profiler.enabled:
+                profiler.tick()
+
             # Check for commands
             key = get_user_command()
+            if key:
+                # Held lines belong before whatever the command prints
+                console.flush_all()
 
             if key == "r":
+                if self._monitor is not None:
+                    self._broadcast(MonitorRequest.encode(0, self._wire_format))
                 print("\n[CONTROLLER] Switching back to relay mode...\n")
                 return MODE_RELAY
 
             elif key == "s":
                 # Send test command to relays
-                print("\n[CONTROLLER] Sending test command to relays...")
-                indicate_processing()
-
-                test_params = self._test_params
-
-                self._test_running = True
-                self._test_timeout = time.monotonic() + (
-                    test_params.num_packets * (test_params.delay_ms / 1000.0) + 2
-                )
-                self._test_run_results = {}
-
-                request = RunTestRequest.encode(test_params)
-                attempt_send(self._rfm69, request)
-                print(f"[CONTROLLER] Test command sent")
+                if self._sweep is not None:
+                    print("\n[CONTROLLER] Sweep cancelled")
+                    self._finish_sweep()
+                self._start_test()
+
+            elif key == "w":
+                self._configure_sweep()
+
+            elif key == "x":
+                # Abort a running test on all relays
+                print("\n[CONTROLLER] Sending abort command to relays...")
+                self._broadcast(AbortTestRequest.encode(self._wire_format))
+                if test.running:
+                    self._end_test("aborted")
+                    self._render_results_table()
+                if self._sweep is not None:
+                    print("[CONTROLLER] Sweep cancelled")
+                    self._finish_sweep()
 
             elif key == "c":
-                # Configure parameters
-                print("\n[CONTROLLER] Configure Test Parameters")
-                print("-" * 40)
-
-                num_packets = int(
-                    get_user_input("Number of packets", self._test_params.num_packets)
-                )
-                delay_ms = int(
-                    get_user_input(
-                        "Delay between packets (ms)", self._test_params.delay_ms
-                    )
-                )
-                stagger_ms = int(
-                    get_user_input(
-                        "Stagger (random delay) between packets (ms)",
-                        self._test_params.stagger_ms,
-                    )
-                )
-                high_power_str = get_user_input(
-                    "High power mode (true/false)", self._test_params.high_power
-                )
-                high_power = high_power_str.lower() in [
-                    "true",
-                    "t",
-                    "1",
-                    "yes",
-                    "y",
-                ]
-                tx_power = int(
-                    get_user_input("TX power (db)", self._test_params.tx_power)
-                )
-
-                self._test_params.num_packets = num_packets
-                self._test_params.delay_ms = delay_ms
-                self._test_params.stagger_ms = stagger_ms
-                self._test_params.high_power = high_power
-                self._test_params.tx_power = tx_power
-
-                print("\n[CONTROLLER] Parameters updated:")
-                print(f"  Packets: {self._test_params.num_packets}")
-                print(f"  Delay: {self._test_params.delay_ms}ms")
-                print(f"  Stagger: {self._test_params.stagger_ms}ms")
-                print(f"  High Power: {self._test_params.high_power}")
-                print(f"  TX Power: {self._test_params.tx_power}db\n")
+                configure_test(test.params, test.min_slot_ms(self._wire_format))
 
             elif key == "d":
-                # Configure distance calculation parameters
-                print("\n[CONTROLLER] Configure Distance Parameters")
-                print("-" * 40)
-
-                self._distance_A = float(
-                    get_user_input("A value (signal @ 1m)", self._distance_A)
-                )
+                self._distance_A = configure_distance(self._distance_A)
 
-                print("\n[CONTROLLER] Distance parameters updated:")
-                print(f"  A: {self._distance_A}db")
+            elif key == "k":
+                self._calibrate()
 
             elif key == "p":
-                # Show parameters
-                print(f"\n[CONTROLLER] Current test parameters:")
-                print(f"  Packets: {self._test_params.num_packets}")
-                print(f"  Delay: {self._test_params.delay_ms}ms")
-                print(f"  Stagger: {self._test_params.stagger_ms}ms")
-                print(f"  High Power: {self._test_params.high_power}")
-                print(f"  TX Power: {self._test_params.tx_power}db")
-                print(f"\nDistance calculation parameters:")
-                print(f"  A (signal @ 1m): {self._distance_A}db")
+                show_params(test.params, self._wire_format, self._distance_A)
 
             elif key == "t":
                 # Show results table
                 self._render_results_table()
 
+            elif key == "l":
+                dump_log(self._log, self._registry.names())
+
+            elif key == "m":
+                self._toggle_machine_mode()
+
+            elif key == "j":
+                self._print_results_json()
+
             elif key == "q":
                 # Request relay device info
                 print("\n[CONTROLLER] Requesting device info from relays...")
 
-                request = InfoRequest.encode()
-                attempt_send(self._rfm69, request)
+                request = InfoRequest.encode(self._wire_format)
+                self._broadcast(request)
                 print("[CONTROLLER] Info request sent\n")
 
+            elif key == "v":
+                self._registry.expire(time.monotonic())
+                self._registry.render(time.monotonic())
+
+            elif key == "g":
+                self._ping()
+
+            elif key == "b":
+                self._blast()
+
+            elif key == "u":
+                self._profile()
+
+            elif key == "n":
+                self._scan()
+
+            elif key == "e":
+                choose_console_mode()
+
+            elif key == "y":
+                self._flood_control().configure(self._wire_format)
+
             elif key == "i":
                 print(
                     f"\n[INFO] Device: {self._device_id} | Temperature: {self._rfm69.temperature}C | TX Power: {self._rfm69.tx_power}dbm | Freq: {self._rfm69.frequency_mhz}mhz\n"
                 )
-            elif key == "h":
-                self._show_help()
-
-            # Listen for packets from relays
-            message, rssi = check_for_message(self._rfm69)
-            if message is not None:
-                if isinstance(message, RunTestResponse):
-                    if message.device_id not in self._test_run_results:
-                        self._test_run_results[message.device_id] = []
-
-                    result = TestResult()
-                    result.sequence = message.packet_num
-                    result.rssi = rssi
-                    self._test_run_results[message.device_id].append(result)
-
-                    print(
-                        f"\n[CONTROLLER] Received test results from {message.device_id} | {result.sequence} | RSSI: {rssi}db"
-                    )
-                elif isinstance(message, InfoResponse):
-                    print(f"\n[CONTROLLER] Received device info | RSSI: {rssi}db")
-                    print(f"  Device ID: {message.device_id}")
-                    print(f"  High Power: {message.high_power}")
-                    print(f"  TX Power: {message.tx_power}dbm")
-                    print(f"  Temperature: {message.temperature}C")
-                    print(f"  Frequency: {message.frequency_mhz}mhz")
-                    print(f"  Bitrate: {message.bitrate_kbps / 1000:.1f}kbit/s")
-                    print(f"  Frequency Deviation: {message.frequency_deviation}hz\n")
+            elif key == "f":
+                if self._wire_format == WIRE_FORMAT_TEXT:
+                    self._wire_format = WIRE_FORMAT_BINARY
                 else:
-                    print(
-                        f"[CONTROLLER] Received unhandled message: {message} | RSSI: {rssi}db"
-                    )
+                    self._wire_format = WIRE_FORMAT_TEXT
+                print(f"\n[CONTROLLER] Wire format: {self._wire_format}\n")
 
-            if self._test_running and time.monotonic() > self._test_timeout:
-                self._test_running = False
-                print("\n[CONTROLLER] Test run complete!")
-                indicate_ready()
+            elif key == "o":
+                self._configure_monitor()
 
-                self._render_results_table()
+            elif key == "h":
+                show_help(test.params, self._wire_format)
+
+            # Read every packet that is already waiting
+            received = 0
+            while received < MAX_DRAIN_PACKETS:
+                message, rssi = poll_message(self._rfm69)
+                if message is None:
+                    break
+                received += 1
+                self._handle_message(message, rssi, time.monotonic())
+            if not received:
+                # Nothing arrived, so the radio is idle: write log records and
+                # print held status lines now
+                self._log.service()
+                console.flush()
+
+            if test.running:
+                test.service(time.monotonic())
+            self._service_monitor(time.monotonic())
+
+            completed = test.running and test.complete(time.monotonic())
+            if completed:
+                self._end_test(completed)
+                if self._sweep is not None:
+                    self._sweep_test_done()
+                elif not test.streaming:
+                    self._render_results_table()
+
+            if (
+                self._sweep is not None
+                and not test.running
+                and time.monotonic() >= self._next_sweep_at
+            ):
+                self._start_sweep_test()
+
+            if not received and not key:
+                wait_for_packet(self._rfm69)
@@ -0,0 +1,170 @@
+import json
+from packets import RunTestResponse, airtime_s
+from calibration import Calibration
+from controller_test import TestSession
+from stats import LinkStats
+
+
+def silent_relays(test: TestSession, name_of) -> list:
+    """Relays expected in the last test that sent nothing"""
+    return [name_of(short_id) for short_id, (highest, _) in test.progress.items() if highest < 0]
+
+
+def channel_report(test: TestSession) -> list:
+    """Per channel group: frequency, relays, packets received and the
+    share of the group's dwell those packets kept the channel busy"""
+    params = test.params
+    relays = [0] * params.channels
+    for short_id in test.progress:
+        relays[test.slots.group_of(short_id)[0]] += 1
+    response_len = len(
+        RunTestResponse.encode(test.device_id, 0, test.wire_format, params.test_id)
+    )
+    packet_ms = airtime_s(response_len, params.bitrate or test.default_bitrate) * 1000
+    listened_ms = params.num_packets * params.dwell_ms
+    report = []
+    for channel in range(params.channels):
+        packets = test.channel_packets[channel] if channel < len(test.channel_packets) else 0
+        report.append(
+            {
+                "mhz": round(params.channel_mhz(test.default_frequency, channel), 3),
+                "relays": relays[channel],
+                "packets": packets,
+                "utilization": round(packets * packet_ms / listened_ms, 3),
+            }
+        )
+    return report
+
+
+def _render_slot_schedule(test: TestSession, name_of):
+    params = test.params
+    print("\nSlot schedule:")
+    print(f"  {params.num_slots} slots of {params.slot_ms}ms, period {params.period_ms}ms")
+    for short_id in test.results:
+        slot = test.slots.slot_of(short_id)
+        kind = "assigned" if short_id in test.slots.assignments else "hashed"
+        print(
+            f"  {name_of(short_id)}: slot {slot} ({kind}), window +{test.slots.offset_ms(short_id)}ms, "
+            f"{test.slots.off_slot_packets.get(short_id, 0)} packets outside the window"
+        )
+
+
+def _render_channels(test: TestSession):
+    params = test.params
+    print("\nChannel groups (utilization = airtime of received packets / dwell):")
+    print("| Channel | Frequency | Relays | Packets | Utilization |")
+    print("|---------|-----------|--------|---------|-------------|")
+    for channel, entry in enumerate(channel_report(test)):
+        print(
+            f"| {channel:>7} | {entry['mhz']:>9.3f} | {entry['relays']:>6} "
+            f"| {entry['packets']:>7} | {entry['utilization'] * 100:>10.1f}% |"
+        )
+    # One receiver: the groups share the period instead of running side by side
+    print(
+        f"  Listened {params.dwell_ms}ms per channel, period {params.period_ms}ms; "
+        f"each group transmits without collisions from the others, but the test "
+        f"still takes a dwell per group"
+    )
+
+
+def render_results_table(
+    test: TestSession,
+    name_of,
+    calibration: Calibration,
+    distance_a: float,
+    distance,
+    flood=None,
+):
+    """Render results as a markdown table. `distance(tx_power, rssi, n)` is
+    the uncalibrated estimate with A = `distance_a`, `flood` the
+    FloodControl if forwarding was ever used."""
+    if not test.results:
+        print("No test results yet")
+        return
+
+    print("\n" + "=" * 80)
+    print("TEST RESULTS TABLE")
+    print("=" * 80)
+
+    # Calculate distances for different n values
+    print(
+        "\n| Device | TX Power | RSSI Min | RSSI Max | RSSI Avg | RSSI Std | Packet Loss | Dups | Reordered | Max Burst | Dist(n=2) | Dist(n=3) | Dist(n=4) | Dist(calibrated, 95%) |"
+    )
+    print(
+        "|--------|----------|-----------|-----------|-----------|----------|-------------|------|-----------|-----------|-----------|-----------|-----------|-----------------------|"
+    )
+
+    bursts = {}
+    tx_power = test.params.tx_power
+    for short_id, stats in test.results.items():
+        device_id = name_of(short_id)
+        rssi_avg = stats.rssi_avg
+        packet_loss = stats.loss_percent
+        longest_burst, bursts[device_id] = stats.loss_bursts()
+
+        dist_n2 = distance(tx_power, rssi_avg, 2.0)
+        dist_n3 = distance(tx_power, rssi_avg, 3.0)
+        dist_n4 = distance(tx_power, rssi_avg, 4.0)
+        model = calibration.model(short_id)
+        if model is None:
+            dist_cal = "-"
+        else:
+            low, high = model.interval(tx_power, rssi_avg)
+            dist_cal = f"{model.distance(tx_power, rssi_avg):.1f}m ({low:.1f}-{high:.1f})"
+
+        print(
+            f"| {device_id:<6} | {tx_power:>8}db | {stats.rssi_min:>9.1f} | {stats.rssi_max:>9.1f} | {rssi_avg:>9.1f} | {stats.rssi_stddev:>8.1f} | {packet_loss:>10.1f}% | {stats.duplicates:>4} | {stats.out_of_order:>9} | {longest_burst:>9} | {dist_n2:>8.1f}m | {dist_n3:>8.1f}m | {dist_n4:>8.1f}m | {dist_cal:>21} |"
+        )
+
+    print("\nLoss bursts (number of runs of consecutive lost packets by length):")
+    print("  " + " | ".join(f"{label:>5}" for label in LinkStats.burst_labels()))
+    for device_id, histogram in bursts.items():
+        print(f"  {' | '.join(f'{count:>5}' for count in histogram)}  {device_id}")
+
+    silent = silent_relays(test, name_of)
+    if silent:
+        print(f"\nNo packets from {len(silent)} expected relays (100% loss):")
+        for device_id in silent:
+            print(f"  {device_id}")
+
+    if test.params.slotted:
+        _render_slot_schedule(test, name_of)
+
+    if test.params.multi_channel:
+        _render_channels(test)
+
+    if test.downlink is not None and test.downlink.results:
+        test.downlink.render(
+            test.results, name_of, test.params.bitrate or test.default_bitrate
+        )
+
+    if flood is not None and flood.paths:
+        flood.render(name_of)
+
+    print("\nDistance calculation parameters:")
+    print(f"  A (signal @ 1m): {distance_a}db")
+    print("=" * 80 + "\n")
+
+
+def print_results_json(test: TestSession, name_of, flood=None):
+    """Print the results as one JSON line for scripts reading the console"""
+    devices = {}
+    for short_id, stats in test.results.items():
+        devices[name_of(short_id)] = stats.as_dict()
+    print(
+        "RESULTS "
+        + json.dumps(
+            {
+                "tx_power": test.params.tx_power,
+                "high_power": test.params.high_power,
+                "num_packets": test.params.num_packets,
+                "devices": devices,
+                "silent": silent_relays(test, name_of),
+                "paths": flood.as_dict(name_of) if flood is not None else {},
+                "downlink": (
+                    test.downlink.as_dict(name_of) if test.downlink is not None else {}
+                ),
+                "channels": channel_report(test) if test.params.multi_channel else [],
+            }
+        )
+    )
@@ -0,0 +1,111 @@
+import time
+from packets import (
+    WIRE_FORMAT_BINARY,
+    RunTestResponse,
+    SlotAssignment,
+    TestParameters,
+    slot_index,
+)
+from registry import Registry
+
+# Slots left unassigned in a slot plan for relays the controller does not know
+MIN_SPARE_SLOTS = 2
+
+# Pause between back-to-back broadcasts so relays can process each packet
+BROADCAST_GAP_S = 0.03
+
+
+class SlotPlan:
+    """Where in the test period every relay transmits.
+
+    Relays the controller knows each get a slot of their own, the others
+    hash into the spare slots. With channel groups the slots are dealt out
+    across the groups, and each group's share makes up its dwell.
+    """
+
+    def __init__(self, registry: Registry, broadcast):
+        self._registry = registry
+        self._broadcast = broadcast
+        self._params = TestParameters()  # Of the test the plan was applied to
+        self.plan = 0
+        self.assignments = {}  # short_id -> slot index in plan
+        self.off_slot_packets = {}  # short_id -> packets outside their slot
+
+    def apply(self, params: TestParameters, wire_format: str, min_slot_ms: int):
+        """Fill in the slot fields of a test about to start, and send the
+        assignments when they changed or the test is slotted. The same slots
+        order the start acknowledgements, `min_slot_ms` long."""
+        self._params = params
+        self.off_slot_packets = {}
+        known = sorted(self._registry)
+        changed = sorted(self.assignments) != known
+        if changed:
+            self.plan = (self.plan + 1) % 256
+            self.assignments = {short_id: i for i, short_id in enumerate(known)}
+
+        params.slot_plan = self.plan
+        params.num_assigned = len(known)
+        num_slots = len(known) + max(MIN_SPARE_SLOTS, len(known) // 4)
+        # A downlink test has no response slots, but its summaries need the
+        # acknowledgement slots even when no relay is known yet
+        params.num_slots = num_slots if params.slot_ms > 0 and not params.downlink else 0
+        params.ack_slots = num_slots if known or params.downlink else 0
+        params.ack_slot_ms = min_slot_ms
+        params.dwell_ms = 0
+        if params.channels > 1 and not params.downlink:
+            # A dwell per group holds its share of the slots, or one stagger
+            if params.slot_ms > 0:
+                group_slots = (num_slots + params.channels - 1) // params.channels
+                params.dwell_ms = group_slots * params.slot_ms
+            else:
+                params.dwell_ms = max(params.stagger_ms, min_slot_ms)
+        if not (params.slotted or (changed and known)):
+            return
+
+        # Resent with every slotted test, it is only a few packets
+        if wire_format == WIRE_FORMAT_BINARY:
+            capacity = SlotAssignment.CAPACITY_BINARY
+        else:
+            capacity = SlotAssignment.CAPACITY_TEXT
+        assignments = list(self.assignments.items())
+        for i in range(0, len(assignments), capacity):
+            packet = SlotAssignment.encode(
+                self.plan, assignments[i : i + capacity], wire_format
+            )
+            self._broadcast(packet)
+            time.sleep(BROADCAST_GAP_S)
+
+    def slot_of(self, short_id: int) -> int:
+        params = self._params
+        if short_id in self.assignments:
+            return self.assignments[short_id]
+        num_slots = params.num_slots
+        if params.multi_channel:
+            num_slots = max(num_slots, params.channels)
+        return slot_index(short_id, num_slots, params.num_assigned)
+
+    def group_of(self, short_id: int) -> tuple[int, int]:
+        """Channel group of a relay and its slot within the group's dwell"""
+        index = self.slot_of(short_id)
+        channels = self._params.channels
+        return index % channels, index // channels
+
+    def offset_ms(self, short_id: int) -> int:
+        """Start of a relay's slot within the test period"""
+        params = self._params
+        if not params.multi_channel:
+            return self.slot_of(short_id) * params.slot_ms
+        group, slot = self.group_of(short_id)
+        return group * params.dwell_ms + slot * params.slot_ms
+
+    def check(self, message: RunTestResponse, started_at: float, received_at: float):
+        """Count responses that arrive outside their relay's expected window"""
+        params = self._params
+        window_start = started_at + (
+            message.packet_num * params.period_ms + self.offset_ms(message.short_id)
+        ) / 1000.0
+        window_end = window_start + params.slot_ms / 1000.0
+        if not window_start <= received_at <= window_end:
+            self.off_slot_packets[message.short_id] = (
+                self.off_slot_packets.get(message.short_id, 0) + 1
+            )
@@ -0,0 +1,422 @@
+import time
+import supervisor
+import adafruit_rfm69
+from packets import (
+    DEFAULT_WIRE_FORMAT,
+    MAX_PAYLOAD_LENGTH,
+    WIRE_FORMAT_BINARY,
+    AbortTestRequest,
+    RunTestRequest,
+    RunTestResponse,
+    TestAck,
+    TestParameters,
+    airtime_s,
+)
+from console import console
+from controller_slots import BROADCAST_GAP_S, SlotPlan
+from perf import profiler
+from registry import Registry
+from runlog import RunLog
+from stats import LinkStats
+
+# A relay that stays silent this many packet intervals is considered done
+INACTIVITY_INTERVALS = 3
+
+# Allowance for loop latency on both ends when waiting for a packet
+TIMING_MARGIN_S = 0.15
+
+# Transmissions of a test request, the first included, each followed by an
+# acknowledgement window, before relays that did not confirm it are given up
+START_ATTEMPTS = 3
+
+# Raw RSSI samples kept per device on top of the running statistics, 0 for none
+RAW_SAMPLE_CAPACITY = 64
+
+
+class TestSession:
+    """A range test from the controller's side: the request and its
+    retransmissions, the slot plan, following the channel groups through
+    the period, and the responses collected until the test is over.
+
+    The controller loop calls `service` and `complete` while `running`, and
+    hands every test packet to the `add_*` methods.
+    """
+
+    def __init__(
+        self,
+        rfm69: adafruit_rfm69.RFM69,
+        device_id: str,
+        registry: Registry,
+        log: RunLog,
+        broadcast,
+    ):
+        self._rfm69 = rfm69
+        self.device_id = device_id
+        self._registry = registry
+        self._log = log
+        self._broadcast = broadcast  # Sends a request direct or as a flood
+        self.params = TestParameters()
+        self.wire_format = DEFAULT_WIRE_FORMAT  # Of the running or last test
+        self.running = False
+        self.timeout = 0.0
+        self.results = {}  # short_id -> LinkStats
+        self.started_at = 0.0
+        self.progress = {}  # short_id -> [highest sequence, last heard]
+        self._send_overhead_s = 0.0  # Measured send time beyond airtime
+        self._forward_delay_s = 0.0  # Longest forwarders hold a packet
+        self.slots = SlotPlan(registry, broadcast)
+        self._start_pending = {}  # short_id -> True until it confirmed the start
+        self._start_attempts = 0
+        self._next_start_at = 0.0
+        self.stale_packets = 0  # Responses tagged with another test's id
+        self.downlink = None  # DownlinkTest of the last test, if it was one
+        # Radio settings to return to after a test that changed them
+        self.default_bitrate = rfm69.bitrate
+        self.default_frequency_deviation = rfm69.frequency_deviation
+        self.default_frequency = rfm69.frequency_mhz
+        self._channel = 0  # Channel group listened to during a multi-channel test
+        self.channel_packets = []  # Test responses received per channel group
+        self.stream = None  # ResultStream, from the first time machine mode is on
+
+    @property
+    def streaming(self) -> bool:
+        return self.stream is not None and self.stream.enabled
+
+    def min_slot_ms(self, wire_format: str, bitrate: float = 0) -> int:
+        """Shortest slot that fits a test response plus timing margin"""
+        response_len = len(RunTestResponse.encode(self.device_id, 0, wire_format, 1))
+        airtime_ms = airtime_s(response_len, bitrate or self._rfm69.bitrate) * 1000
+        return int(2 * airtime_ms + 10)
+
+    def start(self, wire_format: str, forward_delay_s: float = 0.0):
+        """Send the test request to relays and start collecting results.
+        `forward_delay_s` is how long forwarders may hold each packet."""
+        test_params = self.params
+        self.wire_format = wire_format
+        self._forward_delay_s = forward_delay_s
+        expired = self._registry.expire(time.monotonic())
+        if expired:
+            print(f"[CONTROLLER] {expired} relays not heard from recently, no longer expected")
+        self.slots.apply(test_params, wire_format, self.min_slot_ms(wire_format, test_params.bitrate))
+
+        self.running = True
+        self.results = {}
+
+        self._log.start_run(test_params)
+        if self.streaming:
+            self.stream.run_start(self._log.run_id, test_params)
+        # Never 0, which means no handshake; the run id survives restarts, so
+        # stragglers of a test before a reboot are not taken for this one
+        test_params.test_id = self._log.run_id % 255 + 1
+        self.stale_packets = 0
+        self.channel_packets = [0] * test_params.channels
+        # Room for an acknowledgement window after every transmission
+        window_s = test_params.ack_window_ms / 1000.0
+        request = self._request(START_ATTEMPTS * test_params.ack_window_ms)
+        send_start = time.monotonic()
+        self._broadcast(request)
+        # Relays time their responses from when they received the command
+        sent_at = time.monotonic()
+        self.started_at = sent_at + START_ATTEMPTS * window_s
+        self._measure_send_overhead(sent_at - send_start, len(request))
+        # Relays switch to the test's radio settings when they get the request
+        self._apply_test_radio()
+
+        # Every relay in the registry is expected to answer, and to confirm
+        # the start before the test begins or with its first packet
+        self.progress = {short_id: [-1, self.started_at] for short_id in self._registry}
+        self._start_pending = {short_id: True for short_id in self._registry}
+        self._start_attempts = 1
+        self._next_start_at = sent_at + window_s
+        self.timeout = self.started_at + (
+            max(
+                test_params.num_packets * test_params.period_ms / 1000.0,
+                self._channel_time_s(len(self.progress)),
+            )
+            + self._packet_spread_s()
+        )
+        self.downlink = None
+        if test_params.downlink:
+            from controller_downlink import DownlinkTest
+            profiler.instrument("controller_downlink")
+
+            self.downlink = DownlinkTest(
+                self._rfm69, self.device_id, test_params, wire_format, self.started_at
+            )
+            self.timeout = self.started_at + (
+                (test_params.report_at_ms + test_params.ack_window_ms) / 1000.0
+                + self._packet_spread_s()
+            )
+        console.info("[CONTROLLER] Test command sent (test {})", test_params.test_id)
+        if test_params.ack_slots:
+            console.info(
+                "[CONTROLLER] Up to {} windows of {}ms for {} relays to acknowledge",
+                START_ATTEMPTS,
+                test_params.ack_window_ms,
+                len(self._start_pending),
+            )
+        if test_params.slotted:
+            console.info(
+                "[CONTROLLER] {} slots of {}ms, {} assigned (plan {}), period {}ms",
+                test_params.num_slots,
+                test_params.slot_ms,
+                len(self.slots.assignments),
+                test_params.slot_plan,
+                test_params.period_ms,
+            )
+        if test_params.downlink:
+            console.info(
+                "[CONTROLLER] Downlink: sending {} packets, summaries after {}ms",
+                test_params.num_packets,
+                test_params.report_at_ms,
+            )
+        if test_params.multi_channel:
+            console.info(
+                "[CONTROLLER] {} channels {}khz apart, {}ms dwell each",
+                test_params.channels,
+                test_params.channel_step_khz,
+                test_params.dwell_ms,
+            )
+
+    def _request(self, start_in_ms: int, pending: list | tuple = ()) -> bytes:
+        """The test request in the test's wire format, or in binary when
+        the text one does not fit in a packet; relays then answer in binary"""
+        params = self.params
+        request = RunTestRequest.encode(params, self.wire_format, start_in_ms, pending)
+        if len(request) <= MAX_PAYLOAD_LENGTH:
+            return request
+        console.warning(
+            "[CONTROLLER] Text test request is {} bytes, over the {} byte limit; sent in binary",
+            len(request),
+            MAX_PAYLOAD_LENGTH,
+        )
+        return RunTestRequest.encode(params, WIRE_FORMAT_BINARY, start_in_ms, pending)
+
+    def service(self, now: float):
+        """Retransmit the request, send downlink packets and follow the
+        channel groups, whichever is due"""
+        self._service_start(now)
+        if self.downlink is not None:
+            self.downlink.service(now)
+        self._service_hop(now)
+
+    def _service_start(self, now: float):
+        """Once an acknowledgement window is over, retransmit the test request
+        to the relays that have not confirmed it yet"""
+        if not self._start_pending or now < self._next_start_at:
+            return
+        pending = list(self._start_pending)
+        if self._start_attempts >= START_ATTEMPTS or now >= self.started_at:
+            console.warning(
+                "\n[CONTROLLER] {} relays did not confirm the start after {} attempts",
+                len(pending),
+                self._start_attempts,
+            )
+            self._start_pending = {}
+            return
+
+        params = self.params
+        request = self._request(int((self.started_at - now) * 1000), pending)
+        # Relays that missed the request are still on the default settings
+        self._restore_radio()
+        self._broadcast(request)
+        self._apply_test_radio()
+        self._start_attempts += 1
+        self._next_start_at = time.monotonic() + params.ack_window_ms / 1000.0
+        console.info(
+            "\n[CONTROLLER] Retransmitted test {} to {} relays (attempt {})",
+            params.test_id,
+            len(pending),
+            self._start_attempts,
+        )
+
+    def _confirm_start(self, short_id: int):
+        if self._start_pending.pop(short_id, None) and not self._start_pending:
+            console.info(
+                "\n[CONTROLLER] All relays confirmed test {} ({} transmissions)",
+                self.params.test_id,
+                self._start_attempts,
+            )
+
+    def _apply_test_radio(self):
+        params = self.params
+        if params.bitrate:
+            self._rfm69.bitrate = params.bitrate
+        if params.frequency_deviation:
+            self._rfm69.frequency_deviation = params.frequency_deviation
+
+    def _restore_radio(self):
+        if self._rfm69.bitrate != self.default_bitrate:
+            self._rfm69.bitrate = self.default_bitrate
+        if self._rfm69.frequency_deviation != self.default_frequency_deviation:
+            self._rfm69.frequency_deviation = self.default_frequency_deviation
+        self._tune(0)
+
+    def _tune(self, channel: int):
+        """Move to a channel group's frequency, in standby, then receive there"""
+        if channel == self._channel:
+            return
+        self._rfm69.idle()
+        self._rfm69.frequency_mhz = self.params.channel_mhz(self.default_frequency, channel)
+        self._rfm69.listen()
+        self._channel = channel
+
+    def _service_hop(self, now: float):
+        """Follow the channel groups through the period: the radio receives
+        one channel at a time, so every group gets its own dwell"""
+        params = self.params
+        if not params.multi_channel or now < self.started_at:
+            return
+        position_ms = int((now - self.started_at) * 1000) % params.period_ms
+        channel = position_ms // params.dwell_ms
+        if channel < params.channels:
+            self._tune(channel)
+
+    def end(self):
+        """Stop collecting results and return to the default radio settings"""
+        self.running = False
+        self._start_pending = {}
+        self._log.flush_soon()
+        console.flush_all()
+        if self.stale_packets:
+            print(f"[CONTROLLER] Ignored {self.stale_packets} packets from earlier tests")
+        params = self.params
+        if not (params.radio_changed or params.multi_channel):
+            return
+        # Relays still on the test settings would miss everything sent after
+        # the switch back, so stop them first, on every group's channel
+        for channel in range(params.channels if params.multi_channel else 1):
+            self._tune(channel)
+            self._broadcast(AbortTestRequest.encode(self.wire_format))
+            time.sleep(BROADCAST_GAP_S)
+        self._restore_radio()
+
+    def _channel_time_s(self, responders: int) -> float:
+        """Time on air of every expected response back to back, which bounds the
+        test from below when more relays answer than the schedule has room for"""
+        response_len = len(RunTestResponse.encode(self.device_id, 0, self.wire_format))
+        return responders * self.params.num_packets * airtime_s(response_len, self._rfm69.bitrate)
+
+    def _measure_send_overhead(self, send_s: float, packet_len: int):
+        """Track how much longer a send takes than its airtime (SPI, mode switches)"""
+        overhead = max(0.0, send_s - airtime_s(packet_len, self._rfm69.bitrate))
+        self._send_overhead_s = 0.75 * self._send_overhead_s + 0.25 * overhead
+
+    def _packet_spread_s(self) -> float:
+        """How late after its nominal time a relay's packet can arrive"""
+        params = self.params
+        if params.multi_channel:
+            offset_ms = params.channels * params.dwell_ms
+        elif params.slotted:
+            offset_ms = params.num_slots * params.slot_ms
+        else:
+            offset_ms = params.stagger_ms
+        response_len = len(RunTestResponse.encode(self.device_id, 0, self.wire_format))
+        return (
+            offset_ms / 1000.0
+            + airtime_s(response_len, self._rfm69.bitrate)
+            + self._send_overhead_s
+            + TIMING_MARGIN_S
+            + self._forward_delay_s
+        )
+
+    def complete(self, now: float) -> str | None:
+        """Why the running test is over, or None while results may still arrive"""
+        if now > self.timeout:
+            return "timeout"
+        params = self.params
+        if params.downlink:
+            # Relays are silent until the summary window, so only their
+            # summaries end the test early
+            for highest, _ in self.progress.values():
+                if highest < params.num_packets - 1:
+                    return None
+            return "all relays delivered" if self.progress else None
+        if not self.progress:
+            # Nobody is known: wait for first packets, then call it done
+            if now - self.started_at > INACTIVITY_INTERVALS * self._packet_spread_s():
+                return "no relays responded"
+            return None
+
+        last_packet = params.num_packets - 1
+        inactivity_s = INACTIVITY_INTERVALS * (
+            params.period_ms / 1000.0 + self._packet_spread_s()
+        )
+        all_delivered = True
+        for highest, last_heard in self.progress.values():
+            if highest >= last_packet:
+                continue
+            all_delivered = False
+            if now - last_heard < inactivity_s:
+                return None
+        return "all relays delivered" if all_delivered else "remaining relays inactive"
+
+    def add_response(self, message: RunTestResponse, rssi: float, received_at: float):
+        """Record a test packet, and with it the sender's confirmed start"""
+        if message.test_id:
+            if message.test_id != self.params.test_id:
+                self.stale_packets += 1
+                return
+            self._confirm_start(message.short_id)
+
+        if self.running:
+            progress = self.progress.get(message.short_id)
+            if progress is None:
+                progress = self.progress[message.short_id] = [-1, received_at]
+            progress[0] = max(progress[0], message.packet_num)
+            progress[1] = received_at
+        if self.params.slotted:
+            self.slots.check(message, self.started_at, received_at)
+        if self.running and self._channel < len(self.channel_packets):
+            self.channel_packets[self._channel] += 1
+        stats = self.results.get(message.short_id)
+        if stats is None:
+            stats = LinkStats(self.params.num_packets, RAW_SAMPLE_CAPACITY)
+            self.results[message.short_id] = stats
+        if stats.add(rssi, message.packet_num):
+            self._log.add_packet(message.short_id, message.packet_num, rssi)
+            if self.streaming:
+                self.stream.packet(
+                    self._log.run_id,
+                    message.short_id,
+                    message.packet_num,
+                    rssi,
+                    supervisor.ticks_ms(),
+                )
+            else:
+                console.debug(
+                    "\n[CONTROLLER] Received test results from {} | {} | RSSI: {}db",
+                    message.device_id,
+                    message.packet_num,
+                    rssi,
+                )
+        elif not self.streaming:
+            console.debug(
+                "\n[CONTROLLER] Ignored repeated packet from {} | {}",
+                message.device_id,
+                message.packet_num,
+            )
+
+    def add_summary(self, message: "DownlinkSummary", rssi: float, received_at: float):
+        """Keep a relay's downlink summary; the summary itself is the one
+        uplink sample of the test"""
+        if not self.running or self.downlink is None or message.test_id != self.params.test_id:
+            self.stale_packets += 1
+            return
+        self.downlink.add(message)
+        stats = LinkStats(1)
+        stats.add(rssi, 0)
+        self.results[message.short_id] = stats
+        self.progress[message.short_id] = [self.params.num_packets - 1, received_at]
+        self._confirm_start(message.short_id)
+        console.debug(
+            "\n[CONTROLLER] Downlink summary from {} | {}/{} | RSSI: {}db",
+            message.device_id,
+            message.received,
+            message.expected,
+            rssi,
+        )
+
+    def add_ack(self, message: TestAck):
+        if self.running and message.test_id == self.params.test_id:
+            self._confirm_start(message.short_id)
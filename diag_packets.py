@@ -0,0 +1,710 @@
+"""Packets of the commands beside the range test: ping, blast, profile
+counters, downlink tests and monitoring heartbeats.
+
+They share the wire formats, reader and type numbers of packets.py but live
+here so neither module is too large to compile in a microcontroller's RAM.
+Importing this module registers their decoders with decode_packet.
+"""
+
+import struct
+from packets import (
+    BINARY_HEADER,
+    DEFAULT_WIRE_FORMAT,
+    MAX_PAYLOAD_LENGTH,
+    TYPE_BLAST_DATA,
+    TYPE_BLAST_REQUEST,
+    TYPE_BLAST_SUMMARY,
+    TYPE_DOWNLINK_DATA,
+    TYPE_DOWNLINK_SUMMARY,
+    TYPE_HEARTBEAT,
+    TYPE_MONITOR_REQUEST,
+    TYPE_PING_REQUEST,
+    TYPE_PING_RESPONSE,
+    TYPE_STATS_REQUEST,
+    TYPE_STATS_RESPONSE,
+    WIRE_FORMAT_BINARY,
+    WIRE_FORMAT_TEXT,
+    PacketReader,
+    binary_header,
+    format_short_id,
+    register_decoder,
+    short_device_id,
+)
+
+# Ping timestamps are microseconds kept to 30 bits so they stay small ints on
+# CircuitPython; they wrap after about 17 minutes, far longer than any ping.
+PING_TIMESTAMP_MASK = 0x3FFFFFFF
+
+_COLON = 0x3A
+_ZERO = 0x30
+
+
+class PingRequest:
+    """Asks one relay (by short id) to echo a timestamp back immediately"""
+
+    __slots__ = ("target", "sequence", "timestamp_us", "wire_format")
+
+    # target short id, sequence, controller timestamp
+    _BINARY = "<IHI"
+
+    def __init__(self):
+        self.target: int = 0
+        self.sequence: int = 0
+        self.timestamp_us: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(
+        target: int, sequence: int, timestamp_us: int, wire_format: str | None = None
+    ) -> bytes:
+        timestamp_us &= PING_TIMESTAMP_MASK
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(
+                TYPE_PING_REQUEST, struct.calcsize(PingRequest._BINARY)
+            )
+            struct.pack_into(
+                PingRequest._BINARY, packet, 2, target, sequence, timestamp_us
+            )
+            return bytes(packet)
+
+        return bytes(
+            f"P:{format_short_id(target)}:{sequence}:{timestamp_us}", "utf-8"
+        )
+
+    def decode_text(self, reader: PacketReader) -> "PingRequest":
+        self.target = reader.text_hex()
+        self.sequence = reader.text_int()
+        self.timestamp_us = reader.text_int()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "PingRequest":
+        self.target = reader.u32()
+        self.sequence = reader.u16()
+        self.timestamp_us = reader.u32()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class PingResponse:
+    """Echo of a ping with the time the relay took to turn it around"""
+
+    __slots__ = (
+        "device_id",
+        "short_id",
+        "sequence",
+        "timestamp_us",
+        "turnaround_us",
+        "wire_format",
+    )
+
+    # short device id, sequence, echoed timestamp, turnaround
+    _BINARY = "<IHII"
+
+    def __init__(self):
+        self.device_id: str = ""
+        self.short_id: int = 0
+        self.sequence: int = 0
+        self.timestamp_us: int = 0
+        self.turnaround_us: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(
+        device_id: str,
+        sequence: int,
+        timestamp_us: int,
+        turnaround_us: int,
+        wire_format: str | None = None,
+    ) -> bytes:
+        turnaround_us = min(turnaround_us, PING_TIMESTAMP_MASK)
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(
+                TYPE_PING_RESPONSE, struct.calcsize(PingResponse._BINARY)
+            )
+            struct.pack_into(
+                PingResponse._BINARY,
+                packet,
+                2,
+                short_device_id(device_id),
+                sequence,
+                timestamp_us,
+                turnaround_us,
+            )
+            return bytes(packet)
+
+        return bytes(
+            f"PR:{device_id}:{sequence}:{timestamp_us}:{turnaround_us}", "utf-8"
+        )
+
+    def decode_text(self, reader: PacketReader) -> "PingResponse":
+        reader.text_device_id(self)
+        self.sequence = reader.text_int()
+        self.timestamp_us = reader.text_int()
+        self.turnaround_us = reader.text_int()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "PingResponse":
+        reader.binary_device_id(self)
+        self.sequence = reader.u16()
+        self.timestamp_us = reader.u32()
+        self.turnaround_us = reader.u32()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class BlastRequest:
+    """Asks one relay to send packets back to back for a fixed time"""
+
+    __slots__ = ("target", "payload_len", "duration_ms", "wire_format")
+
+    # target short id, payload length, duration
+    _BINARY = "<IBH"
+
+    def __init__(self):
+        self.target: int = 0
+        self.payload_len: int = 0
+        self.duration_ms: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(
+        target: int, payload_len: int, duration_ms: int, wire_format: str | None = None
+    ) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(
+                TYPE_BLAST_REQUEST, struct.calcsize(BlastRequest._BINARY)
+            )
+            struct.pack_into(
+                BlastRequest._BINARY, packet, 2, target, payload_len, duration_ms
+            )
+            return bytes(packet)
+
+        return bytes(
+            f"B:{format_short_id(target)}:{payload_len}:{duration_ms}", "utf-8"
+        )
+
+    def decode_text(self, reader: PacketReader) -> "BlastRequest":
+        self.target = reader.text_hex()
+        self.payload_len = reader.text_int()
+        self.duration_ms = reader.text_int()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "BlastRequest":
+        self.target = reader.u32()
+        self.payload_len = reader.u8()
+        self.duration_ms = reader.u16()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class BlastData:
+    """One packet of a blast, padded to the requested payload length.
+
+    Built once as a template and only the sequence number is patched for
+    each packet, so a relay spends as little time as possible between sends.
+    """
+
+    __slots__ = ("device_id", "short_id", "sequence", "wire_format")
+
+    # short device id, sequence
+    _BINARY = "<IH"
+    _TEXT_SEQUENCE_DIGITS = 5
+    _PADDING = 0x2D  # "-"
+
+    def __init__(self):
+        self.device_id: str = ""
+        self.short_id: int = 0
+        self.sequence: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def min_length(device_id: str, wire_format: str | None = None) -> int:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            return 2 + struct.calcsize(BlastData._BINARY)
+        return len(device_id) + BlastData._TEXT_SEQUENCE_DIGITS + 5
+
+    @staticmethod
+    def template(
+        device_id: str, payload_len: int, wire_format: str | None = None
+    ) -> bytearray:
+        """A packet of payload_len bytes to pass to set_sequence"""
+        payload_len = min(
+            max(payload_len, BlastData.min_length(device_id, wire_format)),
+            MAX_PAYLOAD_LENGTH,
+        )
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(TYPE_BLAST_DATA, payload_len - 2)
+            struct.pack_into("<I", packet, 2, short_device_id(device_id))
+            for i in range(8, payload_len):
+                packet[i] = BlastData._PADDING
+            return packet
+
+        packet = bytearray(f"BD:{device_id}:", "utf-8")
+        packet.extend(b"0" * BlastData._TEXT_SEQUENCE_DIGITS)
+        packet.append(_COLON)
+        packet.extend(bytes((BlastData._PADDING,)) * (payload_len - len(packet)))
+        return packet
+
+    @staticmethod
+    def set_sequence(packet: bytearray, sequence: int):
+        if packet[0] == BINARY_HEADER:
+            packet[6] = sequence & 0xFF
+            packet[7] = (sequence >> 8) & 0xFF
+            return
+
+        pos = packet.index(_COLON, 3) + BlastData._TEXT_SEQUENCE_DIGITS
+        for _ in range(BlastData._TEXT_SEQUENCE_DIGITS):
+            packet[pos] = _ZERO + sequence % 10
+            sequence //= 10
+            pos -= 1
+
+    def decode_text(self, reader: PacketReader) -> "BlastData":
+        reader.text_device_id(self)
+        self.sequence = reader.text_int()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "BlastData":
+        reader.binary_device_id(self)
+        self.sequence = reader.u16()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class BlastSummary:
+    """Sent by a relay after a blast: how many packets it sent and how long it took"""
+
+    __slots__ = ("device_id", "short_id", "sent", "elapsed_ms", "wire_format")
+
+    # short device id, packets sent, elapsed; tiny packets can top 65535 sends
+    _BINARY = "<III"
+
+    def __init__(self):
+        self.device_id: str = ""
+        self.short_id: int = 0
+        self.sent: int = 0
+        self.elapsed_ms: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(
+        device_id: str, sent: int, elapsed_ms: int, wire_format: str | None = None
+    ) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(
+                TYPE_BLAST_SUMMARY, struct.calcsize(BlastSummary._BINARY)
+            )
+            struct.pack_into(
+                BlastSummary._BINARY,
+                packet,
+                2,
+                short_device_id(device_id),
+                sent,
+                elapsed_ms,
+            )
+            return bytes(packet)
+
+        return bytes(f"BS:{device_id}:{sent}:{elapsed_ms}", "utf-8")
+
+    def decode_text(self, reader: PacketReader) -> "BlastSummary":
+        reader.text_device_id(self)
+        self.sent = reader.text_int()
+        self.elapsed_ms = reader.text_int()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "BlastSummary":
+        reader.binary_device_id(self)
+        self.sent = reader.u32()
+        self.elapsed_ms = reader.u32()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class StatsRequest:
+    """Asks one relay to act on its profiling counters"""
+
+    ACTION_SHOW = 0
+    ACTION_ENABLE = 1
+    ACTION_DISABLE = 2
+    ACTION_RESET = 3
+
+    __slots__ = ("target", "action", "wire_format")
+
+    # target short id, action
+    _BINARY = "<IB"
+
+    def __init__(self):
+        self.target: int = 0
+        self.action: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(target: int, action: int, wire_format: str | None = None) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(
+                TYPE_STATS_REQUEST, struct.calcsize(StatsRequest._BINARY)
+            )
+            struct.pack_into(StatsRequest._BINARY, packet, 2, target, action)
+            return bytes(packet)
+
+        return bytes(f"U:{format_short_id(target)}:{action}", "utf-8")
+
+    def decode_text(self, reader: PacketReader) -> "StatsRequest":
+        self.target = reader.text_hex()
+        self.action = reader.text_int()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "StatsRequest":
+        self.target = reader.u32()
+        self.action = reader.u8()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class StatsResponse:
+    """One profiling counter of a relay; a relay sends `count` of these"""
+
+    __slots__ = (
+        "device_id",
+        "short_id",
+        "index",
+        "count",
+        "calls",
+        "total_ms",
+        "max_us",
+        "name",
+        "wire_format",
+    )
+
+    # short device id, index, count, calls, total ms, max us, then the name
+    _BINARY = "<IBBIII"
+
+    def __init__(self):
+        self.device_id: str = ""
+        self.short_id: int = 0
+        self.index: int = 0
+        self.count: int = 0
+        self.calls: int = 0
+        self.total_ms: int = 0
+        self.max_us: int = 0
+        self.name: str = ""
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(
+        device_id: str,
+        index: int,
+        count: int,
+        calls: int,
+        total_ms: int,
+        max_us: int,
+        name: str,
+        wire_format: str | None = None,
+    ) -> bytes:
+        calls = min(calls, 0xFFFFFFFF)
+        total_ms = min(total_ms, 0xFFFFFFFF)
+        max_us = min(max_us, 0xFFFFFFFF)
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            size = struct.calcsize(StatsResponse._BINARY)
+            name_bytes = bytes(name, "utf-8")
+            packet = binary_header(TYPE_STATS_RESPONSE, size + len(name_bytes))
+            struct.pack_into(
+                StatsResponse._BINARY,
+                packet,
+                2,
+                short_device_id(device_id),
+                index,
+                count,
+                calls,
+                total_ms,
+                max_us,
+            )
+            packet[2 + size :] = name_bytes
+            return bytes(packet)
+
+        return bytes(
+            f"UR:{device_id}:{index}:{count}:{calls}:{total_ms}:{max_us}:{name}",
+            "utf-8",
+        )
+
+    def decode_text(self, reader: PacketReader) -> "StatsResponse":
+        reader.text_device_id(self)
+        self.index = reader.text_int()
+        self.count = reader.text_int()
+        self.calls = reader.text_int()
+        self.total_ms = reader.text_int()
+        self.max_us = reader.text_int()
+        self.name = reader.rest()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "StatsResponse":
+        reader.binary_device_id(self)
+        self.index = reader.u8()
+        self.count = reader.u8()
+        self.calls = reader.u32()
+        self.total_ms = reader.u32()
+        self.max_us = reader.u32()
+        self.name = reader.rest()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class DownlinkData:
+    """A test packet sent by the controller in a downlink test"""
+
+    __slots__ = ("test_id", "packet_num", "wire_format")
+
+    # test id, packet_num
+    _BINARY = "<BH"
+
+    def __init__(self):
+        self.test_id: int = 0
+        self.packet_num: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(test_id: int, packet_num: int, wire_format: str | None = None) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(
+                TYPE_DOWNLINK_DATA, struct.calcsize(DownlinkData._BINARY)
+            )
+            struct.pack_into(DownlinkData._BINARY, packet, 2, test_id, packet_num)
+            return bytes(packet)
+
+        return bytes(f"DD:{test_id}:{packet_num}", "utf-8")
+
+    def decode_text(self, reader: PacketReader) -> "DownlinkData":
+        self.test_id = reader.text_int()
+        self.packet_num = reader.text_int()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "DownlinkData":
+        self.test_id = reader.u8()
+        self.packet_num = reader.u16()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class DownlinkSummary:
+    """What a relay received of a downlink test, sent once at its end.
+
+    Carries the counts, the RSSI range and mean, and as much of the bitmap
+    of received packets as fits after them; `covered` says how many packets
+    the bitmap describes, which in text is often none.
+    """
+
+    __slots__ = (
+        "device_id",
+        "short_id",
+        "test_id",
+        "expected",
+        "received",
+        "rssi_min",
+        "rssi_max",
+        "rssi_avg",
+        "covered",
+        "bitmap",
+        "wire_format",
+    )
+
+    # short device id, test id, expected, received, then min, max and mean
+    # RSSI in half dB, followed by the bitmap
+    _BINARY = "<IBHHhhh"
+
+    BITMAP_CAPACITY = MAX_PAYLOAD_LENGTH - 2 - struct.calcsize(_BINARY)
+
+    def __init__(self):
+        self.device_id: str = ""
+        self.short_id: int = 0
+        self.test_id: int = 0
+        self.expected: int = 0
+        self.received: int = 0
+        self.rssi_min: float = 0.0
+        self.rssi_max: float = 0.0
+        self.rssi_avg: float = 0.0
+        self.covered: int = 0
+        self.bitmap = bytearray(self.BITMAP_CAPACITY)
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(
+        device_id: str,
+        test_id: int,
+        expected: int,
+        received: int,
+        rssi_min: float,
+        rssi_max: float,
+        rssi_avg: float,
+        bitmap,
+        wire_format: str | None = None,
+    ) -> bytes:
+        """Encode a summary; the bitmap is cut to the whole bytes that fit"""
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            size = struct.calcsize(DownlinkSummary._BINARY)
+            length = min(len(bitmap), MAX_PAYLOAD_LENGTH - 2 - size)
+            packet = binary_header(TYPE_DOWNLINK_SUMMARY, size + length)
+            struct.pack_into(
+                DownlinkSummary._BINARY,
+                packet,
+                2,
+                short_device_id(device_id),
+                test_id,
+                expected,
+                received,
+                round(rssi_min * 2),
+                round(rssi_max * 2),
+                round(rssi_avg * 2),
+            )
+            packet[2 + size :] = bitmap[:length]
+            return bytes(packet)
+
+        text = (
+            f"DS:{device_id}:{test_id}:{expected}:{received}:"
+            f"{rssi_min:.1f}:{rssi_max:.1f}:{rssi_avg:.1f}:"
+        )
+        length = min(len(bitmap), (MAX_PAYLOAD_LENGTH - len(text)) // 2)
+        for i in range(length):
+            text += f"{bitmap[i]:02x}"
+        return bytes(text, "utf-8")
+
+    def received_packet(self, packet_num: int) -> bool:
+        return bool(self.bitmap[packet_num >> 3] & (1 << (packet_num & 7)))
+
+    def decode_text(self, reader: PacketReader) -> "DownlinkSummary":
+        reader.text_device_id(self)
+        self.test_id = reader.text_int()
+        self.expected = reader.text_int()
+        self.received = reader.text_int()
+        self.rssi_min = reader.text_float()
+        self.rssi_max = reader.text_float()
+        self.rssi_avg = reader.text_float()
+        length = 0
+        while reader.pos + 1 < reader.end and length < self.BITMAP_CAPACITY:
+            self.bitmap[length] = reader.hex_byte()
+            length += 1
+        self.covered = min(self.expected, length * 8)
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "DownlinkSummary":
+        reader.binary_device_id(self)
+        self.test_id = reader.u8()
+        self.expected = reader.u16()
+        self.received = reader.u16()
+        self.rssi_min = reader.i16() / 2
+        self.rssi_max = reader.i16() / 2
+        self.rssi_avg = reader.i16() / 2
+        length = 0
+        while reader.more() and length < self.BITMAP_CAPACITY:
+            self.bitmap[length] = reader.u8()
+            length += 1
+        self.covered = min(self.expected, length * 8)
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class MonitorRequest:
+    """Asks every relay to send a heartbeat every `interval_s`, 0 stops them"""
+
+    __slots__ = ("interval_s", "wire_format")
+
+    # interval
+    _BINARY = "<H"
+
+    def __init__(self):
+        self.interval_s: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(interval_s: int, wire_format: str | None = None) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(
+                TYPE_MONITOR_REQUEST, struct.calcsize(MonitorRequest._BINARY)
+            )
+            struct.pack_into(MonitorRequest._BINARY, packet, 2, interval_s)
+            return bytes(packet)
+
+        return bytes(f"M:{interval_s}", "utf-8")
+
+    def decode_text(self, reader: PacketReader) -> "MonitorRequest":
+        self.interval_s = reader.text_int()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "MonitorRequest":
+        self.interval_s = reader.u16()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class Heartbeat:
+    """Sent by a relay every monitoring interval. The sequence number counts
+    heartbeats since monitoring started, so gaps show the ones lost."""
+
+    __slots__ = ("device_id", "short_id", "sequence", "wire_format")
+
+    # short device id, sequence
+    _BINARY = "<IH"
+
+    def __init__(self):
+        self.device_id: str = ""
+        self.short_id: int = 0
+        self.sequence: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(device_id: str, sequence: int, wire_format: str | None = None) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(TYPE_HEARTBEAT, struct.calcsize(Heartbeat._BINARY))
+            struct.pack_into(
+                Heartbeat._BINARY, packet, 2, short_device_id(device_id), sequence
+            )
+            return bytes(packet)
+
+        return bytes(f"HB:{device_id}:{sequence}", "utf-8")
+
+    def decode_text(self, reader: PacketReader) -> "Heartbeat":
+        reader.text_device_id(self)
+        self.sequence = reader.text_int()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "Heartbeat":
+        reader.binary_device_id(self)
+        self.sequence = reader.u16()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+register_decoder(b"P:", 2, PingRequest().decode_text)
+register_decoder(b"PR", 3, PingResponse().decode_text)
+register_decoder(b"B:", 2, BlastRequest().decode_text)
+register_decoder(b"BD", 3, BlastData().decode_text)
+register_decoder(b"BS", 3, BlastSummary().decode_text)
+register_decoder(b"U:", 2, StatsRequest().decode_text)
+register_decoder(b"UR", 3, StatsResponse().decode_text)
+register_decoder(b"DD", 3, DownlinkData().decode_text)
+register_decoder(b"DS", 3, DownlinkSummary().decode_text)
+register_decoder(b"M:", 2, MonitorRequest().decode_text)
+register_decoder(b"HB", 3, Heartbeat().decode_text)
+for _msg_type, _message in (
+    (TYPE_PING_REQUEST, PingRequest()),
+    (TYPE_PING_RESPONSE, PingResponse()),
+    (TYPE_BLAST_REQUEST, BlastRequest()),
+    (TYPE_BLAST_DATA, BlastData()),
+    (TYPE_BLAST_SUMMARY, BlastSummary()),
+    (TYPE_STATS_REQUEST, StatsRequest()),
+    (TYPE_STATS_RESPONSE, StatsResponse()),
+    (TYPE_DOWNLINK_DATA, DownlinkData()),
+    (TYPE_DOWNLINK_SUMMARY, DownlinkSummary()),
+    (TYPE_MONITOR_REQUEST, MonitorRequest()),
+    (TYPE_HEARTBEAT, Heartbeat()),
+):
+    register_decoder(bytes((BINARY_HEADER, _msg_type)), 2, _message.decode_binary)
@@ -0,0 +1,216 @@
+import random
+from array import array
+import adafruit_rfm69
+from packets import Flood, airtime_s
+from perf import Counter
+from rfm_util import attempt_send
+
+# Floods remembered for duplicate suppression; the least recently seen one
+# makes room for a new one
+SEEN_CAPACITY = 32
+
+# Forwarders wait a random time up to this before rebroadcasting, so the
+# neighbours that heard the same packet do not all transmit at once
+FORWARD_JITTER_MS = 40
+
+# Forwards waiting for their jitter at most; more are skipped
+FORWARD_QUEUE = 4
+
+# Hops the controller allows a flood when forwarding is switched on
+DEFAULT_FLOOD_HOPS = 2
+
+# Counter names in the order they are reported
+FLOOD_COUNTER_NAMES = ("origin", "forward", "jitter", "dup", "skipped", "evict")
+
+
+class SeenCache:
+    """(origin, sequence) pairs of recent floods in preallocated arrays.
+
+    A lookup scans every slot, which at this size costs less than a hashed
+    key would allocate, and remembers the least recently used slot on the
+    way for a new pair to replace.
+    """
+
+    def __init__(self, capacity: int = SEEN_CAPACITY):
+        self.capacity = capacity
+        self.size = 0
+        self.evictions = 0
+        self._origins = array("L", [0] * capacity)
+        self._sequences = array("H", [0] * capacity)
+        self._used = array("L", [0] * capacity)  # Clock of the last use, 0 when empty
+        self._clock = 0
+
+    def check(self, origin: int, sequence: int) -> bool:
+        """Whether the flood was seen before; it is recorded either way"""
+        self._clock += 1
+        used = self._used
+        oldest = 0
+        for slot in range(self.capacity):
+            if used[slot] and self._origins[slot] == origin and self._sequences[slot] == sequence:
+                used[slot] = self._clock
+                return True
+            if used[slot] < used[oldest]:
+                oldest = slot
+        if used[oldest]:
+            self.evictions += 1
+        else:
+            self.size += 1
+        self._origins[oldest] = origin
+        self._sequences[oldest] = sequence
+        used[oldest] = self._clock
+        return False
+
+    def clear(self):
+        for slot in range(self.capacity):
+            self._used[slot] = 0
+        self.size = 0
+
+
+class _Forward:
+    """A received flood waiting for its jitter before it is rebroadcast"""
+
+    __slots__ = (
+        "send_at",
+        "received_at",
+        "origin",
+        "sequence",
+        "hops",
+        "max_hops",
+        "delay_ms",
+        "rssi",
+        "packet",
+        "wire_format",
+    )
+
+
+class FloodRouter:
+    """Sends floods from this device and rebroadcasts the ones it hears.
+
+    Every flood is handled once: the seen cache drops repeats heard from
+    other forwarders and echoes of this device's own floods. Counters track
+    the airtime spent originating and forwarding, the jitter waited and the
+    packets dropped or skipped, to show how a flood scales with the number
+    of relays in range.
+    """
+
+    def __init__(
+        self,
+        rfm69: adafruit_rfm69.RFM69,
+        short_id: int,
+        forwarding: bool = True,
+        capacity: int = SEEN_CAPACITY,
+    ):
+        self._rfm69 = rfm69
+        self._short_id = short_id
+        self.forwarding = forwarding
+        self.seen = SeenCache(capacity)
+        self._sequence = 0
+        self._queue = []  # _Forward
+        self.counters = {}
+        self.reset()
+
+    def reset(self):
+        self.counters = {name: Counter(name) for name in FLOOD_COUNTER_NAMES}
+
+    def send(self, packet, max_hops: int, wire_format: str | None = None):
+        """Send a packet as a new flood, or as is when the envelope does not fit"""
+        self._sequence = (self._sequence + 1) & 0xFFFF
+        envelope = Flood.encode(self._short_id, self._sequence, max_hops, packet, wire_format)
+        if envelope is None:
+            self.counters["skipped"].add(0)
+            attempt_send(self._rfm69, packet)
+            return
+        # Forwarders echo it back; the cache drops those copies
+        self.seen.check(self._short_id, self._sequence)
+        attempt_send(self._rfm69, envelope)
+        self.counters["origin"].add(
+            int(airtime_s(len(envelope), self._rfm69.bitrate) * 1e9)
+        )
+
+    def receive(self, message: Flood, rssi: float, received_at: float) -> bool:
+        """Record a flood, queueing it for rebroadcast if hops are left.
+        Returns False for repeats, whose wrapped packet was handled already."""
+        evictions = self.seen.evictions
+        if self.seen.check(message.origin, message.sequence):
+            self.counters["dup"].add(0)
+            return False
+        if self.seen.evictions != evictions:
+            self.counters["evict"].add(0)
+
+        if not self.forwarding or message.hops >= message.max_hops:
+            return True
+        if len(self._queue) >= FORWARD_QUEUE:
+            self.counters["skipped"].add(0)
+            return True
+
+        forward = _Forward()
+        forward.send_at = received_at + random.randint(0, FORWARD_JITTER_MS) / 1000.0
+        forward.received_at = received_at
+        forward.origin = message.origin
+        forward.sequence = message.sequence
+        forward.hops = message.hops + 1
+        forward.max_hops = message.max_hops
+        forward.delay_ms = message.delay_ms
+        forward.rssi = [message.rssi[i] for i in range(message.hops)] + [round(rssi)]
+        forward.packet = message.inner_packet()
+        forward.wire_format = message.wire_format
+        self._queue.append(forward)
+        return True
+
+    def next_due(self) -> float | None:
+        """When the next queued forward is due, if any"""
+        due = None
+        for forward in self._queue:
+            if due is None or forward.send_at < due:
+                due = forward.send_at
+        return due
+
+    def service(self, now: float):
+        """Rebroadcast the queued floods whose jitter is over"""
+        for forward in self._queue:
+            if forward.send_at > now:
+                continue
+            self._queue.remove(forward)
+            self._send_forward(forward, now)
+            return  # One per call, the loop comes back for the next
+
+    def _send_forward(self, forward: _Forward, now: float):
+        bitrate = self._rfm69.bitrate
+        envelope = None
+        held_ms = 0
+        # Twice: the held time includes the time on air of the envelope itself
+        for _ in range(2):
+            envelope = Flood.encode(
+                forward.origin,
+                forward.sequence,
+                forward.max_hops,
+                forward.packet,
+                forward.wire_format,
+                forward.hops,
+                forward.rssi,
+                forward.delay_ms + held_ms,
+            )
+            if envelope is None:
+                self.counters["skipped"].add(0)  # No room for another hop
+                return
+            held_ms = int((now - forward.received_at + airtime_s(len(envelope), bitrate)) * 1000)
+        attempt_send(self._rfm69, envelope)
+        self.counters["forward"].add(int(airtime_s(len(envelope), bitrate) * 1e9))
+        self.counters["jitter"].add(int((now - forward.received_at) * 1e9))
+
+    def clear(self):
+        """Drop queued forwards, e.g. when leaving relay mode"""
+        self._queue = []
+
+    def snapshot(self) -> list:
+        return [self.counters[name] for name in FLOOD_COUNTER_NAMES]
+
+    def describe(self) -> str:
+        counters = self.counters
+        airtime_ms = (counters["origin"].total_ns + counters["forward"].total_ns) / 1e6
+        return (
+            f"{counters['origin'].calls} sent, {counters['forward'].calls} forwarded, "
+            f"{counters['dup'].calls} repeats dropped, {counters['skipped'].calls} skipped, "
+            f"{airtime_ms:.1f}ms on air, seen cache {self.seen.size}/{self.seen.capacity} "
+            f"({self.seen.evictions} evictions)"
+        )
@@ -0,0 +1,147 @@
+"""Micro-benchmark of packet decoding: the original str/split decoder versus the
+in-place decoder in packets.py.
+
+Runs on CPython from the repository root:
+
+    python host/bench_decode.py
+
+Reports time per packet and the transient heap used by a single decode
+(tracemalloc peak), which is the garbage a receive leaves behind.
+
+The in-place decoder is not allocation-free: on CPython it still uses
+about 100 bytes per decode for boxed ints and floats, where CircuitPython
+boxes only floats and ints from 2**30 up. It is also slower than the
+old decoder on CPython, whose str.split runs in C, so the times here say
+nothing about CircuitPython.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HOST_DIR, "sim"), os.path.dirname(HOST_DIR)]
+
+from packets import (  # noqa: E402
+    RADIO_HEADER_LENGTH,
+    WIRE_FORMAT_BINARY,
+    WIRE_FORMAT_TEXT,
+    InfoResponse,
+    RunTestRequest,
+    RunTestResponse,
+    TestParameters,
+    decode_packet,
+)
+
+DEVICE_ID = "E6614C311B7B5C25"
+ITERATIONS = 50000
+ALLOC_SAMPLES = 200
+
+
+class _LegacyRunTestRequest:
+    pass
+
+
+class _LegacyRunTestResponse:
+    pass
+
+
+class _LegacyInfoResponse:
+    pass
+
+
+def _legacy_decode(packet):
+    """The decoder as it was before packets were parsed in place"""
+    packet = packet[RADIO_HEADER_LENGTH:]  # receive() stripped the header
+    parts = str(packet, "utf-8").split(":")
+    cmd = parts[0]
+    params = parts[1:] if len(parts) > 1 else []
+    if cmd == "R":
+        request = _LegacyRunTestRequest()
+        request.num_packets = int(params[0])
+        request.delay_ms = int(params[1])
+        request.stagger_ms = int(params[2])
+        request.high_power = bool(int(params[3]))
+        request.tx_power = int(params[4])
+        return request
+    if cmd == "RR":
+        response = _LegacyRunTestResponse()
+        response.device_id = params[0]
+        response.packet_num = int(params[1])
+        return response
+    if cmd == "IR":
+        response = _LegacyInfoResponse()
+        response.device_id = params[0]
+        response.high_power = bool(params[1])
+        response.tx_power = int(params[2])
+        response.temperature = float(params[3])
+        response.frequency_mhz = float(params[4])
+        response.bitrate_kbps = float(params[5])
+        response.frequency_deviation = float(params[6])
+        return response
+    return None
+
+
+def _new_decode(packet):
+    return decode_packet(packet, RADIO_HEADER_LENGTH)
+
+
+def _received(payload: bytes) -> bytearray:
+    """A receive buffer as returned by rfm69.receive(with_header=True)"""
+    return bytearray(b"\xff\xff\x00\x00" + payload)
+
+
+def _ns_per_packet(decode, packet):
+    decode(packet)  # Warm caches
+    start = time.perf_counter_ns()
+    for _ in range(ITERATIONS):
+        decode(packet)
+    return (time.perf_counter_ns() - start) / ITERATIONS
+
+
+def _peak_bytes_per_decode(decode, packet):
+    decode(packet)  # Warm caches
+    tracemalloc.start()
+    peaks = []
+    for _ in range(ALLOC_SAMPLES):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        decode(packet)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+    tracemalloc.stop()
+    return sorted(peaks)[len(peaks) // 2]
+
+
+def main():
+    params = TestParameters()
+    info = (DEVICE_ID, True, 13, 24.0, 915.0, 250000.0, 250000.0)
+    cases = [
+        ("RR text", _received(RunTestResponse.encode(DEVICE_ID, 7, WIRE_FORMAT_TEXT)), True),
+        ("RR binary", _received(RunTestResponse.encode(DEVICE_ID, 7, WIRE_FORMAT_BINARY)), False),
+        ("R text", _received(RunTestRequest.encode(params, WIRE_FORMAT_TEXT)), True),
+        ("R binary", _received(RunTestRequest.encode(params, WIRE_FORMAT_BINARY)), False),
+        ("IR text", _received(InfoResponse.encode(*info, WIRE_FORMAT_TEXT)), True),
+        ("IR binary", _received(InfoResponse.encode(*info, WIRE_FORMAT_BINARY)), False),
+    ]
+
+    print(f"{ITERATIONS} decodes per case, transient heap is the median of {ALLOC_SAMPLES}\n")
+    print("| Packet    | Before ns | After ns | Before heap B | After heap B |")
+    print("|-----------|-----------|----------|---------------|--------------|")
+    for name, packet, has_legacy in cases:
+        after_ns = _ns_per_packet(_new_decode, packet)
+        after_heap = _peak_bytes_per_decode(_new_decode, packet)
+        if has_legacy:
+            before_ns = f"{_ns_per_packet(_legacy_decode, packet):>9.0f}"
+            before_heap = f"{_peak_bytes_per_decode(_legacy_decode, packet):>13}"
+        else:
+            before_ns = f"{'-':>9}"
+            before_heap = f"{'-':>13}"
+        print(
+            f"| {name:<9} | {before_ns} | {after_ns:>8.0f} | {before_heap} | {after_heap:>12} |"
+        )
+
+
+if __name__ == "__main__":
+    main()
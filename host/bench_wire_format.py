@@ -0,0 +1,110 @@
+"""Round-trip and size benchmark for the text and binary wire formats.
+
+Runs on CPython from the repository root:
+
+    python host/bench_wire_format.py
+"""
+
+import os
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HOST_DIR, "sim"), os.path.dirname(HOST_DIR)]
+
+from packets import (  # noqa: E402
+    WIRE_FORMAT_BINARY,
+    WIRE_FORMAT_TEXT,
+    InfoRequest,
+    InfoResponse,
+    RunTestRequest,
+    RunTestResponse,
+    TestParameters,
+    airtime_s,
+    decode_packet,
+    short_device_id,
+)
+
+DEVICE_ID = "E6614C311B7B5C25E6614C311B7B5C25"
+BITRATE = 250000.0
+ITERATIONS = 20000
+
+
+def _encoders(wire_format):
+    params = TestParameters()
+    return {
+        "RunTestRequest": lambda: RunTestRequest.encode(params, wire_format),
+        "RunTestResponse": lambda: RunTestResponse.encode(DEVICE_ID, 7, wire_format),
+        "InfoRequest": lambda: InfoRequest.encode(wire_format),
+        "InfoResponse": lambda: InfoResponse.encode(
+            DEVICE_ID, True, 13, 24.0, 915.0, 250000.0, 250000.0, wire_format
+        ),
+    }
+
+
+def _check_round_trip(name, message):
+    if name == "RunTestRequest":
+        params = TestParameters()
+        assert (
+            message.num_packets,
+            message.delay_ms,
+            message.stagger_ms,
+            message.high_power,
+            message.tx_power,
+        ) == (
+            params.num_packets,
+            params.delay_ms,
+            params.stagger_ms,
+            params.high_power,
+            params.tx_power,
+        )
+    elif name == "RunTestResponse":
+        assert message.short_id == short_device_id(DEVICE_ID)
+        assert message.packet_num == 7
+    elif name == "InfoResponse":
+        assert message.short_id == short_device_id(DEVICE_ID)
+        assert message.high_power is True
+        assert message.tx_power == 13
+        assert message.temperature == 24.0
+        assert message.frequency_mhz == 915.0
+        assert message.bitrate_kbps == 250000.0
+        assert message.frequency_deviation == 250000.0
+
+
+def _time_ns(fn):
+    start = time.perf_counter_ns()
+    for _ in range(ITERATIONS):
+        fn()
+    return (time.perf_counter_ns() - start) / ITERATIONS
+
+
+def main():
+    text = _encoders(WIRE_FORMAT_TEXT)
+    binary = _encoders(WIRE_FORMAT_BINARY)
+
+    print(f"Bitrate: {BITRATE / 1000:.0f}kbit/s, {ITERATIONS} iterations\n")
+    print(
+        "| Message         | Text B | Binary B | Ratio | Text airtime | Binary airtime | Text enc+dec | Binary enc+dec |"
+    )
+    print(
+        "|-----------------|--------|----------|-------|--------------|----------------|--------------|----------------|"
+    )
+    for name in text:
+        text_packet = text[name]()
+        binary_packet = binary[name]()
+        _check_round_trip(name, decode_packet(text_packet))
+        _check_round_trip(name, decode_packet(binary_packet))
+
+        text_ns = _time_ns(lambda: decode_packet(text[name]()))
+        binary_ns = _time_ns(lambda: decode_packet(binary[name]()))
+        text_air = airtime_s(len(text_packet), BITRATE) * 1e6
+        binary_air = airtime_s(len(binary_packet), BITRATE) * 1e6
+        print(
+            f"| {name:<15} | {len(text_packet):>6} | {len(binary_packet):>8} | {len(text_packet) / len(binary_packet):>4.1f}x "
+            f"| {text_air:>10.0f}us | {binary_air:>12.0f}us | {text_ns:>10.0f}ns | {binary_ns:>12.0f}ns |"
+        )
+    print("\nRound trips OK")
+
+
+if __name__ == "__main__":
+    main()
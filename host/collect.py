@@ -0,0 +1,268 @@
+"""Collect the controller's machine-mode result frames into CSV or Parquet.
+
+In machine mode (`m` in controller mode) the controller writes every test
+packet, device info and run summary as a COBS-framed, CRC-checked binary
+record to USB serial. This script reads those frames from a serial port
+(needs pyserial) or from a capture file, parses each record type into a
+NumPy structured array in one pass, prints per-run, per-relay statistics and
+optionally writes the tables to CSV or Parquet (needs pyarrow):
+
+    python host/collect.py --port /dev/ttyACM1 --csv results/
+    python host/collect.py capture.bin --parquet results/
+
+Reading from a port stops on Ctrl-C.
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HOST_DIR, "sim"), os.path.dirname(HOST_DIR)]
+
+from stream import (  # noqa: E402
+    END_REASONS,
+    FRAME_DEVICE,
+    FRAME_PACKET,
+    FRAME_RUN_END,
+    FRAME_RUN_START,
+    FRAME_RUN_SUMMARY,
+    crc16,
+)
+
+PACKET_DTYPE = np.dtype(
+    [
+        ("run", "<u2"),
+        ("short_id", "<u4"),
+        ("sequence", "<u2"),
+        ("rssi_half_db", "<i2"),
+        ("ticks_ms", "<u4"),
+    ]
+)
+RUN_START_DTYPE = np.dtype(
+    [
+        ("run", "<u2"),
+        ("num_packets", "<u2"),
+        ("delay_ms", "<u2"),
+        ("stagger_ms", "<u2"),
+        ("tx_power", "i1"),
+        ("flags", "u1"),
+        ("bitrate_100", "<u2"),
+        ("frequency_deviation_100", "<u2"),
+    ]
+)
+RUN_END_DTYPE = np.dtype([("run", "<u2"), ("reason", "u1"), ("elapsed_ms", "<u4")])
+
+_DEVICE = "<IBbhIHH"
+_RUN_SUMMARY = "<HIHHHHHhhhH"
+
+
+def cobs_decode(data: bytes) -> bytes | None:
+    out = bytearray()
+    pos = 0
+    while pos < len(data):
+        code = data[pos]
+        if code == 0 or pos + code > len(data) + (1 if code == 1 else 0):
+            return None
+        out += data[pos + 1 : pos + code]
+        pos += code
+        if code < 0xFF and pos < len(data):
+            out.append(0)
+    return bytes(out)
+
+
+def split_frames(stream: bytes):
+    """Valid frames (type, payload) and the number of rejected chunks"""
+    frames = []
+    rejected = 0
+    for chunk in stream.split(b"\x00"):
+        if not chunk:
+            continue
+        frame = cobs_decode(chunk)
+        if frame is None or len(frame) < 3:
+            rejected += 1
+            continue
+        length = len(frame) - 2
+        if crc16(frame, length) != frame[length] | (frame[length + 1] << 8):
+            rejected += 1
+            continue
+        frames.append((frame[0], frame[1:length]))
+    return frames, rejected
+
+
+def to_array(frames, frame_type: int, dtype: np.dtype) -> np.ndarray:
+    """Fixed-size records of one type as a structured array, parsed at once"""
+    payload = b"".join(p[: dtype.itemsize] for t, p in frames if t == frame_type)
+    return np.frombuffer(payload, dtype=dtype)
+
+
+def parse(frames) -> dict:
+    devices = {}
+    summaries = []
+    for frame_type, payload in frames:
+        if frame_type == FRAME_DEVICE:
+            size = struct.calcsize(_DEVICE)
+            values = struct.unpack(_DEVICE, payload[:size])
+            devices[values[0]] = payload[size:].decode(errors="replace")
+        elif frame_type == FRAME_RUN_SUMMARY:
+            size = struct.calcsize(_RUN_SUMMARY)
+            values = struct.unpack(_RUN_SUMMARY, payload[:size])
+            device_id = payload[size:].decode(errors="replace")
+            devices.setdefault(values[1], device_id)
+            summaries.append(values + (device_id,))
+    return {
+        "packets": to_array(frames, FRAME_PACKET, PACKET_DTYPE),
+        "runs": to_array(frames, FRAME_RUN_START, RUN_START_DTYPE),
+        "ends": to_array(frames, FRAME_RUN_END, RUN_END_DTYPE),
+        "summaries": summaries,
+        "devices": devices,
+    }
+
+
+def link_stats(packets: np.ndarray) -> dict:
+    """Per (run, relay) count, RSSI min/max/mean/std, vectorized"""
+    if not len(packets):
+        return {}
+    keys = (packets["run"].astype(np.uint64) << 32) | packets["short_id"]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    rssi = packets["rssi_half_db"][order] / 2.0
+    unique, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    sums = np.add.reduceat(rssi, starts)
+    squares = np.add.reduceat(rssi * rssi, starts)
+    mean = sums / counts
+    variance = np.where(
+        counts > 1, (squares - counts * mean * mean) / np.maximum(counts - 1, 1), 0.0
+    )
+    return {
+        "run": (unique >> 32).astype(np.uint16),
+        "short_id": (unique & 0xFFFFFFFF).astype(np.uint32),
+        "count": counts,
+        "rssi_min": np.minimum.reduceat(rssi, starts),
+        "rssi_max": np.maximum.reduceat(rssi, starts),
+        "rssi_avg": mean,
+        "rssi_std": np.sqrt(np.maximum(variance, 0.0)),
+    }
+
+
+def read_input(args) -> bytes:
+    if args.port:
+        import serial
+
+        data = bytearray()
+        with serial.Serial(args.port, args.baud, timeout=0.5) as port:
+            print(f"Reading {args.port}, Ctrl-C to stop")
+            try:
+                while True:
+                    data += port.read(4096)
+            except KeyboardInterrupt:
+                pass
+        return bytes(data)
+    if args.capture:
+        with open(args.capture, "rb") as file:
+            return file.read()
+    return sys.stdin.buffer.read()
+
+
+def write_tables(tables: dict, directory: str, fmt: str):
+    os.makedirs(directory, exist_ok=True)
+    for name, columns in tables.items():
+        path = os.path.join(directory, f"{name}.{fmt}")
+        if fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            pq.write_table(pa.table(columns), path)
+        else:
+            names = list(columns)
+            rows = zip(*(columns[column] for column in names))
+            with open(path, "w") as file:
+                file.write(",".join(names) + "\n")
+                for row in rows:
+                    file.write(",".join(str(value) for value in row) + "\n")
+        print(f"Wrote {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", nargs="?", help="captured serial bytes (default: stdin)")
+    parser.add_argument("--port", help="serial port to read from instead")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--csv", metavar="DIR", help="write CSV tables to DIR")
+    parser.add_argument("--parquet", metavar="DIR", help="write Parquet tables to DIR")
+    args = parser.parse_args()
+
+    stream = read_input(args)
+    started = time.perf_counter()
+    frames, rejected = split_frames(stream)
+    data = parse(frames)
+    stats = link_stats(data["packets"])
+    elapsed = time.perf_counter() - started
+
+    packets = data["packets"]
+    print(
+        f"{len(stream)} bytes, {len(frames)} frames ({rejected} rejected), "
+        f"{len(packets)} packets, parsed in {elapsed * 1000:.1f}ms"
+    )
+    if len(packets):
+        print(f"{len(stream) / len(frames):.1f} serial bytes per frame")
+
+    names = data["devices"]
+    expected = {int(run["run"]): int(run["num_packets"]) for run in data["runs"]}
+    print("\n| Run | Device | Packets | Loss | RSSI Min | RSSI Max | RSSI Avg | RSSI Std |")
+    print("|-----|--------|---------|------|----------|----------|----------|----------|")
+    for i in range(len(stats.get("run", []))):
+        run = int(stats["run"][i])
+        short_id = int(stats["short_id"][i])
+        count = int(stats["count"][i])
+        loss = 100.0 * (1 - count / expected[run]) if expected.get(run) else float("nan")
+        print(
+            f"| {run} | {names.get(short_id, f'{short_id:08X}')} | {count} | {loss:.1f}% "
+            f"| {stats['rssi_min'][i]:.1f} | {stats['rssi_max'][i]:.1f} "
+            f"| {stats['rssi_avg'][i]:.1f} | {stats['rssi_std'][i]:.1f} |"
+        )
+    for end in data["ends"]:
+        reason = END_REASONS[end["reason"]] if end["reason"] < len(END_REASONS) else "?"
+        print(f"Run {end['run']}: {reason} after {end['elapsed_ms'] / 1000:.1f}s")
+
+    tables = {
+        "packets": {
+            "run": packets["run"],
+            "device": [names.get(int(s), f"{int(s):08X}") for s in packets["short_id"]],
+            "sequence": packets["sequence"],
+            "rssi": packets["rssi_half_db"] / 2.0,
+            "ticks_ms": packets["ticks_ms"],
+        },
+        "runs": {name: data["runs"][name] for name in RUN_START_DTYPE.names},
+        "summaries": {
+            name: [row[i] for row in data["summaries"]]
+            for i, name in enumerate(
+                (
+                    "run",
+                    "short_id",
+                    "received",
+                    "expected",
+                    "duplicates",
+                    "out_of_order",
+                    "longest_burst",
+                    "rssi_min_half_db",
+                    "rssi_max_half_db",
+                    "rssi_avg_half_db",
+                    "rssi_std_x100",
+                    "device",
+                )
+            )
+        },
+    }
+    if args.csv:
+        write_tables(tables, args.csv, "csv")
+    if args.parquet:
+        write_tables(tables, args.parquet, "parquet")
+
+
+if __name__ == "__main__":
+    main()
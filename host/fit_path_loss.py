@@ -0,0 +1,108 @@
+"""Fit per-relay path loss models from CALPOINT lines in a controller log.
+
+The controller's k command prints one CALPOINT JSON line per relay with the
+raw RSSI samples of the last test and the distance entered for it. This
+script collects them from saved console output, fits
+
+    tx_power - rssi = A + 10 * n * log10(distance)
+
+per relay by least squares over all samples at once with NumPy, and writes a
+calibration.json the controller loads at boot (copy it to the CIRCUITPY
+drive):
+
+    python host/fit_path_loss.py console.log --output calibration.json
+
+Requires numpy.
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+import numpy as np
+
+Z_95 = 1.96
+
+
+def read_points(lines) -> dict:
+    """relay -> (x, y) arrays of 10*log10(distance) and path loss"""
+    samples = defaultdict(lambda: ([], []))
+    for line in lines:
+        marker = line.find("CALPOINT ")
+        if marker < 0:
+            continue
+        point = json.loads(line[marker + len("CALPOINT ") :])
+        rssi = np.asarray(point["samples"], dtype=float)
+        # The short id keys calibration.json, older logs only have the full id
+        xs, ys = samples[point.get("short_id", point["device"])]
+        xs.append(np.full(rssi.shape, 10 * np.log10(point["distance_m"])))
+        ys.append(point["tx_power"] - rssi)
+    return {
+        device_id: (np.concatenate(xs), np.concatenate(ys))
+        for device_id, (xs, ys) in samples.items()
+    }
+
+
+def fit(x: np.ndarray, y: np.ndarray) -> dict | None:
+    """Least squares A and n with 95% intervals, None without two distances"""
+    if len(np.unique(x)) < 2 or len(x) < 3:
+        return None
+    design = np.column_stack((np.ones_like(x), x))
+    (a, n), _, _, _ = np.linalg.lstsq(design, y, rcond=None)
+    residuals = y - design @ np.array([a, n])
+    sigma = float(np.sqrt(residuals @ residuals / (len(x) - 2)))
+    covariance = sigma**2 * np.linalg.inv(design.T @ design)
+    a_error, n_error = np.sqrt(np.diag(covariance))
+    return {
+        "a": float(a),
+        "n": float(n),
+        "sigma": sigma,
+        "a_ci": float(Z_95 * a_error),
+        "n_ci": float(Z_95 * n_error),
+        "samples": len(x),
+        "distances": len(np.unique(x)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("logs", nargs="*", help="console logs (default: stdin)")
+    parser.add_argument("--output", help="write calibration.json here")
+    args = parser.parse_args()
+
+    lines = []
+    if args.logs:
+        for path in args.logs:
+            with open(path) as file:
+                lines.extend(file)
+    else:
+        lines.extend(sys.stdin)
+
+    calibration = {}
+    print("| Device | Samples | Distances | A (95%) | n (95%) | Residual |")
+    print("|--------|---------|-----------|---------|---------|----------|")
+    for device_id, (x, y) in read_points(lines).items():
+        result = fit(x, y)
+        if result is None:
+            print(f"| {device_id} | {len(x)} | 1 | - | - | - |")
+            continue
+        print(
+            f"| {device_id} | {result['samples']} | {result['distances']} "
+            f"| {result['a']:.1f} ±{result['a_ci']:.1f}db | {result['n']:.2f} ±{result['n_ci']:.2f} "
+            f"| {result['sigma']:.1f}db |"
+        )
+        calibration[device_id] = {
+            "a": result["a"],
+            "n": result["n"],
+            "sigma": result["sigma"],
+        }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(calibration, file, indent=2)
+        print(f"\nWrote {len(calibration)} relays to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
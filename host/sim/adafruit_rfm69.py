@@ -0,0 +1,354 @@
+"""Simulated drop-in for the adafruit_rfm69 driver.
+
+Implements the subset of the `RFM69` API the analyzer uses on top of the
+shared medium in `medium.py`. Packets take their real time on air (from
+bitrate, preamble, sync word and RadioHead header), the radio is half
+duplex, and the single-packet FIFO drops packets that arrive before the
+previous one was read, like the real chip.
+"""
+
+import random
+import time
+
+import simnode
+from medium import ChannelModel
+
+_RH_BROADCAST_ADDRESS = 0xFF
+_FXOSC = 32000000.0
+_FSTEP = _FXOSC / 524288
+
+# Operating modes, as in the driver
+SLEEP_MODE = 0b000
+STANDBY_MODE = 0b001
+FS_MODE = 0b010
+TX_MODE = 0b011
+RX_MODE = 0b100
+
+_HISTORY_S = 2.0  # How long carriers and mode changes are remembered
+
+
+class RFM69:
+    def __init__(
+        self,
+        spi,
+        cs,
+        reset,
+        frequency: int,
+        *,
+        sync_word: bytes = b"\x2d\xd4",
+        preamble_length: int = 4,
+        encryption_key: bytes | None = None,
+        high_power: bool = True,
+        baudrate: int = 2000000,
+    ):
+        node = simnode.current
+        expected_cs = "RFM_CS" if node.config.variant == "onboard" else "D10"
+        if getattr(cs, "pin", None) != expected_cs:
+            raise RuntimeError("Invalid RFM69 version, check wiring!")
+
+        self._node = node
+        self._link = node.link
+        self._tx_power = 13
+        self.high_power = high_power
+        self.sync_word = sync_word
+        self.preamble_length = preamble_length
+        self.encryption_key = encryption_key
+        self._frequency_hz = frequency * 1e6
+        self._bitrate = 250000.0
+        self._frequency_deviation = 250000.0
+        self._mode = STANDBY_MODE
+        self._modes = [(time.monotonic(), STANDBY_MODE, self._frequency_hz)]
+        self._carriers = []
+        self._fifo = None
+        self._fifo_rssi = 0.0
+
+        self.last_rssi = 0.0
+        self.ack_wait = 0.5
+        self.receive_timeout = 0.5
+        self.xmit_timeout = 2.0
+        self.ack_retries = 5
+        self.ack_delay = None
+        self.sequence_number = 0
+        self.node = _RH_BROADCAST_ADDRESS
+        self.destination = _RH_BROADCAST_ADDRESS
+        self.identifier = 0
+        self.flags = 0
+
+        self._counters = {
+            "tx_packets": 0,
+            "tx_airtime_s": 0.0,
+            "rx_packets": 0,
+            "lost_weak": 0,
+            "lost_collision": 0,
+            "lost_not_listening": 0,
+            "lost_overrun": 0,
+        }
+        node.radios.append(self)
+
+    # Radio settings
+
+    @property
+    def tx_power(self) -> int:
+        return self._tx_power
+
+    @tx_power.setter
+    def tx_power(self, val: float):
+        val = int(val)
+        if self.high_power:
+            assert -2 <= val <= 20
+        else:
+            assert -18 <= val <= 13
+        self._tx_power = val
+
+    @property
+    def frequency_mhz(self) -> float:
+        return self._frequency_hz / 1e6
+
+    @frequency_mhz.setter
+    def frequency_mhz(self, val: float):
+        assert 290 <= val <= 1020
+        # Quantize to the synthesizer step like the real register
+        self._frequency_hz = round(val * 1e6 / _FSTEP) * _FSTEP
+        self._set_mode(self._mode)
+
+    @property
+    def bitrate(self) -> float:
+        return self._bitrate
+
+    @bitrate.setter
+    def bitrate(self, val: float):
+        assert (_FXOSC / 65535) <= val <= 32000000.0
+        self._bitrate = _FXOSC / (int((_FXOSC / val) + 0.5) & 0xFFFF)
+
+    @property
+    def frequency_deviation(self) -> float:
+        return self._frequency_deviation
+
+    @frequency_deviation.setter
+    def frequency_deviation(self, val: float):
+        assert 0 <= val <= (_FSTEP * 16383)
+        self._frequency_deviation = _FSTEP * (int((val / _FSTEP) + 0.5) & 0x3FFF)
+
+    @property
+    def temperature(self) -> float:
+        return round(self._node.config.temperature)
+
+    @property
+    def operation_mode(self) -> int:
+        return self._mode
+
+    @operation_mode.setter
+    def operation_mode(self, val: int):
+        self._set_mode(val)
+
+    @property
+    def rssi(self) -> float:
+        """Instantaneous channel power: the strongest carrier on air or noise"""
+        self._drain_link()
+        now = time.monotonic()
+        level = self._link.noise_floor_dbm + random.gauss(0.0, 1.0)
+        for carrier in self._carriers:
+            if carrier.start <= now <= carrier.end and self._on_channel(carrier):
+                level = max(level, carrier.rssi)
+        # The register has 0.5dB resolution
+        return round(level * 2) / 2
+
+    # Modes
+
+    def reset(self):
+        self._set_mode(STANDBY_MODE)
+
+    def idle(self):
+        self._set_mode(STANDBY_MODE)
+
+    def sleep(self):
+        self._set_mode(SLEEP_MODE)
+
+    def listen(self):
+        self._set_mode(RX_MODE)
+
+    def transmit(self):
+        self._set_mode(TX_MODE)
+
+    def _set_mode(self, mode: int):
+        self._mode = mode
+        self._modes.append((time.monotonic(), mode, self._frequency_hz))
+
+    # Packets
+
+    def _airtime_s(self, payload_len: int) -> float:
+        sync_len = len(self.sync_word) if self.sync_word else 0
+        # preamble, sync word, length byte, payload incl. header, CRC
+        return (self.preamble_length + sync_len + 1 + payload_len + 2) * 8 / self._bitrate
+
+    def packet_sent(self) -> bool:
+        return self._mode != TX_MODE
+
+    def payload_ready(self) -> bool:
+        self._process_carriers()
+        return self._fifo is not None
+
+    def send(
+        self,
+        data,
+        *,
+        keep_listening: bool = False,
+        destination: int | None = None,
+        node: int | None = None,
+        identifier: int | None = None,
+        flags: int | None = None,
+    ) -> bool:
+        assert 0 < len(data) <= 60
+        payload = bytearray(4)
+        payload[0] = self.destination if destination is None else destination
+        payload[1] = self.node if node is None else node
+        payload[2] = self.identifier if identifier is None else identifier
+        payload[3] = self.flags if flags is None else flags
+        payload += data
+
+        # Going to standby clears the FIFO
+        self.idle()
+        self._fifo = None
+        self.transmit()
+        start = time.monotonic()
+        airtime = self._airtime_s(len(payload))
+        self._link.transmit(
+            start,
+            start + airtime,
+            self._frequency_hz,
+            self._bitrate,
+            self._frequency_deviation,
+            self._tx_power,
+            payload,
+        )
+        self._counters["tx_packets"] += 1
+        self._counters["tx_airtime_s"] += airtime
+        time.sleep(max(0.0, start + airtime - time.monotonic()))
+
+        if keep_listening:
+            self.listen()
+        else:
+            self.idle()
+        return True
+
+    def receive(
+        self,
+        *,
+        keep_listening: bool = True,
+        with_ack: bool = False,
+        timeout: float | None = None,
+        with_header: bool = False,
+    ):
+        if timeout is None:
+            timeout = self.receive_timeout
+        if timeout is not None:
+            self.listen()
+            deadline = time.monotonic() + timeout
+            while not self.payload_ready() and time.monotonic() < deadline:
+                time.sleep(0.001)
+
+        if not self.payload_ready():
+            if not keep_listening:
+                self.idle()
+            return None
+
+        packet = self._fifo
+        self.last_rssi = self._fifo_rssi
+        self._fifo = None
+        self.idle()
+
+        if self.node != _RH_BROADCAST_ADDRESS and packet[0] not in (
+            _RH_BROADCAST_ADDRESS,
+            self.node,
+        ):
+            packet = None
+        elif not with_header:
+            packet = packet[4:]
+
+        if keep_listening:
+            self.listen()
+        else:
+            self.idle()
+        return packet
+
+    # Medium
+
+    def _on_channel(self, carrier) -> bool:
+        bandwidth = ChannelModel.bandwidth_hz(self._bitrate, self._frequency_deviation)
+        return abs(carrier.frequency_hz - self._frequency_hz) < bandwidth
+
+    def _drain_link(self):
+        for carrier in self._link.carriers():
+            self._carriers.append(carrier)
+
+    def _tuned_at(self, when: float) -> tuple:
+        """(mode, frequency) of the radio at the given time"""
+        state = self._modes[0][1:]
+        for changed_at, mode, frequency_hz in self._modes:
+            if changed_at > when:
+                break
+            state = (mode, frequency_hz)
+        return state
+
+    def _listening_throughout(self, carrier) -> bool:
+        """Whether the radio stayed in receive mode for the whole packet"""
+        mode, frequency_hz = self._tuned_at(carrier.start)
+        if mode != RX_MODE:
+            return False
+        for changed_at, mode, changed_hz in self._modes:
+            if carrier.start < changed_at < carrier.end:
+                if mode != RX_MODE or changed_hz != frequency_hz:
+                    return False
+        return True
+
+    def _decodable(self, carrier) -> str | None:
+        """None if the carrier can be received, "" if it was not meant for this
+        radio's channel or modulation, otherwise the loss counter to bump"""
+        _, frequency_hz = self._tuned_at(carrier.start)
+        bandwidth = ChannelModel.bandwidth_hz(self._bitrate, self._frequency_deviation)
+        if abs(carrier.frequency_hz - frequency_hz) >= bandwidth:
+            return ""
+        if abs(carrier.bitrate - self._bitrate) > 0.05 * self._bitrate:
+            return ""
+        if not self._listening_throughout(carrier):
+            return "lost_not_listening"
+        if carrier.rssi < ChannelModel.sensitivity(self._bitrate):
+            return "lost_weak"
+        for other in self._carriers:
+            if (
+                other is not carrier
+                and other.start < carrier.end
+                and carrier.start < other.end
+                and self._on_channel(other)
+                and other.rssi > carrier.rssi - self._link.capture_db
+            ):
+                return "lost_collision"
+        return None
+
+    def _process_carriers(self):
+        self._drain_link()
+        now = time.monotonic()
+        for carrier in self._carriers:
+            if carrier.payload is None or carrier.end > now:
+                continue
+            loss = self._decodable(carrier)
+            if loss is None and self._fifo is not None:
+                loss = "lost_overrun"
+            if loss is None:
+                self._fifo = bytearray(carrier.payload)
+                self._fifo_rssi = round(carrier.rssi * 2) / 2
+                self._counters["rx_packets"] += 1
+            elif loss:
+                self._counters[loss] += 1
+            carrier.payload = None  # Processed, kept only as interference
+
+        horizon = now - _HISTORY_S
+        self._carriers = [c for c in self._carriers if c.end >= horizon]
+        if len(self._modes) > 1 and self._modes[0][0] < horizon:
+            keep = [m for m in self._modes if m[0] >= horizon]
+            older = [m for m in self._modes if m[0] < horizon]
+            self._modes = older[-1:] + keep
+
+    def counters(self) -> dict:
+        self._process_carriers()
+        return dict(self._counters)
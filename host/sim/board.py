@@ -0,0 +1,24 @@
+"""Simulated board pins for a Feather RP2040 RFM69 (or a board with a breakout)"""
+
+import simnode
+
+
+class Pin:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return f"board.{self.name}"
+
+
+SCK = Pin("SCK")
+MOSI = Pin("MOSI")
+MISO = Pin("MISO")
+LED = Pin("LED")
+NEOPIXEL = Pin("NEOPIXEL")
+D9 = Pin("D9")
+D10 = Pin("D10")
+
+if simnode.current is None or simnode.current.config.variant == "onboard":
+    RFM_CS = Pin("RFM_CS")
+    RFM_RST = Pin("RFM_RST")
@@ -0,0 +1,11 @@
+"""Simulated busio: the SPI bus is only a handle for the simulated radio"""
+
+
+class SPI:
+    def __init__(self, clock, MOSI=None, MISO=None):
+        self.clock = clock
+        self.MOSI = MOSI
+        self.MISO = MISO
+
+    def deinit(self):
+        pass
@@ -0,0 +1,28 @@
+"""Simulated digitalio pins"""
+
+
+class Direction:
+    INPUT = "input"
+    OUTPUT = "output"
+
+
+class Pull:
+    UP = "up"
+    DOWN = "down"
+
+
+class DigitalInOut:
+    def __init__(self, pin):
+        self.pin = pin.name
+        self.direction = Direction.INPUT
+        self.value = False
+
+    def switch_to_output(self, value: bool = False, drive_mode=None):
+        self.direction = Direction.OUTPUT
+        self.value = value
+
+    def switch_to_input(self, pull=None):
+        self.direction = Direction.INPUT
+
+    def deinit(self):
+        pass
@@ -0,0 +1,151 @@
+"""Shared radio medium and channel model for the simulated RFM69.
+
+The launcher owns a `Medium` that runs as a thread. Every transmission is
+reported to it when it starts; the medium computes the received power at
+every other node (log-distance path loss plus log-normal shadowing) and
+fans the transmission out as a carrier. Each node decides on its own
+whether a carrier is decodable: enough power, its radio listening on that
+channel for the whole packet, no collision and a free FIFO.
+"""
+
+import math
+import queue
+import random
+import threading
+
+
+class ChannelModel:
+    """Log-distance path loss: rssi = tx - A - 10 * n * log10(d) + shadowing"""
+
+    def __init__(
+        self,
+        reference_loss_db: float = 35.0,
+        path_loss_exponent: float = 2.7,
+        shadowing_db: float = 2.0,
+        noise_floor_dbm: float = -110.0,
+        capture_db: float = 6.0,
+        seed: int | None = None,
+    ):
+        self.reference_loss_db = reference_loss_db
+        self.path_loss_exponent = path_loss_exponent
+        self.shadowing_db = shadowing_db
+        self.noise_floor_dbm = noise_floor_dbm
+        self.capture_db = capture_db
+        self._random = random.Random(seed)
+
+    def rssi(self, tx_power_dbm: float, distance_m: float) -> float:
+        distance_m = max(distance_m, 0.1)
+        loss = self.reference_loss_db + 10 * self.path_loss_exponent * math.log10(
+            distance_m
+        )
+        return tx_power_dbm - loss + self._random.gauss(0.0, self.shadowing_db)
+
+    @staticmethod
+    def sensitivity(bitrate: float) -> float:
+        """Approximate RFM69 sensitivity: -118dBm at 1.2kbit/s, 10dB per decade"""
+        return -118.0 + 10 * math.log10(max(bitrate, 1200.0) / 1200.0)
+
+    @staticmethod
+    def bandwidth_hz(bitrate: float, frequency_deviation: float) -> float:
+        """Half of the Carson bandwidth: carriers closer than this share a channel"""
+        return frequency_deviation + bitrate / 2
+
+
+class Transmission:
+    """A packet on air as seen by one receiver"""
+
+    __slots__ = (
+        "sender",
+        "start",
+        "end",
+        "frequency_hz",
+        "bitrate",
+        "frequency_deviation",
+        "rssi",
+        "payload",
+    )
+
+    def __init__(self, sender, start, end, frequency_hz, bitrate, fdev, rssi, payload):
+        self.sender = sender
+        self.start = start
+        self.end = end
+        self.frequency_hz = frequency_hz
+        self.bitrate = bitrate
+        self.frequency_deviation = fdev
+        self.rssi = rssi
+        self.payload = payload
+
+
+class RadioLink:
+    """A node's connection to the medium: one shared uplink, one own downlink"""
+
+    def __init__(self, name: str, uplink, downlink, noise_floor_dbm: float, capture_db: float):
+        self.name = name
+        self.uplink = uplink
+        self.downlink = downlink
+        self.noise_floor_dbm = noise_floor_dbm
+        self.capture_db = capture_db
+
+    def transmit(self, start, end, frequency_hz, bitrate, fdev, tx_power_dbm, payload):
+        self.uplink.put(
+            (self.name, start, end, frequency_hz, bitrate, fdev, tx_power_dbm, bytes(payload))
+        )
+
+    def carriers(self):
+        """Drain carriers delivered by the medium since the last call"""
+        while True:
+            try:
+                yield self.downlink.get_nowait()
+            except queue.Empty:
+                return
+
+
+class Medium:
+    """In-process hub that fans transmissions out to every other node"""
+
+    def __init__(self, model: ChannelModel, context):
+        self.model = model
+        self._context = context
+        self._uplink = context.Queue()
+        self._downlinks = {}
+        self._positions = {}
+        self._thread = None
+        self.transmissions = 0
+        self.airtime_s = 0.0
+
+    def attach(self, name: str, position: tuple) -> RadioLink:
+        downlink = self._context.Queue()
+        self._downlinks[name] = downlink
+        self._positions[name] = position
+        return RadioLink(
+            name, self._uplink, downlink, self.model.noise_floor_dbm, self.model.capture_db
+        )
+
+    def distance(self, a: str, b: str) -> float:
+        (ax, ay), (bx, by) = self._positions[a], self._positions[b]
+        return math.hypot(ax - bx, ay - by)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._uplink.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def _run(self):
+        while True:
+            event = self._uplink.get()
+            if event is None:
+                return
+            sender, start, end, frequency_hz, bitrate, fdev, tx_power, payload = event
+            self.transmissions += 1
+            self.airtime_s += end - start
+            for name, downlink in self._downlinks.items():
+                if name == sender:
+                    continue
+                rssi = self.model.rssi(tx_power, self.distance(sender, name))
+                downlink.put(
+                    Transmission(sender, start, end, frequency_hz, bitrate, fdev, rssi, payload)
+                )
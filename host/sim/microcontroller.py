@@ -0,0 +1,23 @@
+"""Simulated microcontroller: cpu identity and non-volatile memory"""
+
+import simnode
+
+
+class _Processor:
+    @property
+    def uid(self) -> bytearray:
+        return bytearray(simnode.current.config.uid)
+
+    @property
+    def temperature(self) -> float:
+        return simnode.current.config.temperature
+
+    frequency = 125000000
+
+
+cpu = _Processor()
+nvm = bytearray(4096)
+
+
+def reset():
+    raise SystemExit("microcontroller.reset()")
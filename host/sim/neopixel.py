@@ -0,0 +1,29 @@
+"""Simulated NeoPixel strip that only remembers its colors"""
+
+
+class NeoPixel:
+    def __init__(self, pin, n: int, *, brightness: float = 1.0, auto_write: bool = True, **kwargs):
+        self.pin = pin
+        self.brightness = brightness
+        self.auto_write = auto_write
+        self._pixels = [(0, 0, 0)] * n
+        self.shown = list(self._pixels)
+
+    def __len__(self):
+        return len(self._pixels)
+
+    def __getitem__(self, index):
+        return self._pixels[index]
+
+    def __setitem__(self, index, color):
+        self._pixels[index] = color
+        if self.auto_write:
+            self.show()
+
+    def fill(self, color):
+        self._pixels = [color] * len(self._pixels)
+        if self.auto_write:
+            self.show()
+
+    def show(self):
+        self.shown = list(self._pixels)
@@ -0,0 +1,125 @@
+"""Per-process state of a simulated node.
+
+Each simulated device runs in its own process, like a real board, so the
+module-level state in the device code is never shared. `current` is set by
+`run_node` before any device module is imported; the hardware stubs in this
+directory read their identity and radio link from it.
+"""
+
+import os
+import queue
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+current = None  # Node of this process
+
+
+class NodeConfig:
+    """Static description of a simulated device"""
+
+    def __init__(self, name: str, uid: bytes, position: tuple):
+        self.name = name
+        self.uid = uid
+        self.position = position
+        self.variant = "onboard"  # "onboard" (Feather RFM) or "external" breakout
+        self.temperature = 22.0
+        self.verbose = True
+        self.serial_capture = None  # File receiving binary serial writes
+
+
+class ConsoleInput:
+    """Serial console fed by the launcher through a queue"""
+
+    def __init__(self, commands):
+        self._commands = commands
+        self._buffer = ""
+
+    def _fill(self):
+        while True:
+            try:
+                self._buffer += self._commands.get_nowait()
+            except queue.Empty:
+                return
+
+    @property
+    def bytes_available(self) -> int:
+        self._fill()
+        return len(self._buffer)
+
+    def read(self, size: int = 1) -> str:
+        while len(self._buffer) < size:
+            self._fill()
+            if len(self._buffer) < size:
+                time.sleep(0.005)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class PrefixedOutput:
+    """Serial console output, tagged with the node name or discarded"""
+
+    def __init__(self, stream, prefix: str, enabled: bool):
+        self._stream = stream
+        self._prefix = prefix
+        self._enabled = enabled
+        self._at_line_start = True
+
+    def write(self, text: str) -> int:
+        if not self._enabled:
+            return len(text)
+        out = []
+        for line in text.splitlines(keepends=True):
+            if self._at_line_start:
+                out.append(self._prefix)
+            out.append(line)
+            self._at_line_start = line.endswith("\n")
+        self._stream.write("".join(out))
+        self._stream.flush()
+        return len(text)
+
+    def flush(self):
+        self._stream.flush()
+
+
+class Node:
+    """A running simulated device: its config, console and medium link"""
+
+    def __init__(self, config: NodeConfig, link, commands, stats):
+        self.config = config
+        self.link = link
+        self.console = ConsoleInput(commands)
+        self.stats = stats
+        self.radios = []
+
+
+def _terminate(signum, frame):
+    sys.exit(0)
+
+
+def run_node(config: NodeConfig, link, commands, stats, repo_root: str, seed: int):
+    """Process entry point: boot code.py against the simulated hardware"""
+    global current
+    current = Node(config, link, commands, stats)
+
+    random.seed(seed)
+    signal.signal(signal.SIGTERM, _terminate)
+    sim_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path[:0] = [sim_dir, repo_root]
+    sys.stdin = current.console
+    sys.stdout = PrefixedOutput(sys.__stdout__, f"[{config.name}] ", config.verbose)
+    # Scratch directory standing in for the node's CIRCUITPY drive
+    drive = tempfile.mkdtemp(prefix=f"rfm69-sim-{config.name}-")
+    os.chdir(drive)
+
+    import runpy
+
+    try:
+        runpy.run_path(os.path.join(repo_root, "code.py"), run_name="__main__")
+    finally:
+        for radio in current.radios:
+            stats.put((config.name, radio.counters()))
+        shutil.rmtree(drive, ignore_errors=True)
@@ -0,0 +1,22 @@
+"""Simulated supervisor: serial input comes from the launcher"""
+
+import time
+
+import simnode
+
+
+class _Runtime:
+    @property
+    def serial_bytes_available(self) -> int:
+        return simnode.current.console.bytes_available
+
+    @property
+    def serial_connected(self) -> bool:
+        return True
+
+
+runtime = _Runtime()
+
+
+def ticks_ms() -> int:
+    return int(time.monotonic() * 1000) & 0x3FFFFFFF
@@ -0,0 +1,22 @@
+"""Simulated usb_cdc: binary serial output goes to the node's capture file"""
+
+import simnode
+
+
+class _Serial:
+    def __init__(self):
+        self._file = None
+
+    def write(self, data) -> int:
+        path = simnode.current.config.serial_capture
+        if path is None:
+            return len(data)
+        if self._file is None:
+            self._file = open(path, "ab")
+        self._file.write(bytes(data))
+        self._file.flush()
+        return len(data)
+
+
+console = _Serial()
+data = None
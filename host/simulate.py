@@ -0,0 +1,141 @@
+"""Run a controller and N relays on a simulated RFM69 channel.
+
+Every device is a separate process running the unmodified code.py against
+the hardware stubs in host/sim, connected through a shared medium with
+log-distance path loss, shadowing, time on air and collisions. The first
+node is the controller; it is switched to controller mode and fed the
+scripted commands, the others stay relays.
+
+    python host/simulate.py --relays 8 --distance 30 --at 2:s --duration 20
+
+Each --at SECONDS:TEXT sends one line to the controller console that many
+seconds after start. At the end, per-node radio counters are printed.
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(HOST_DIR)
+sys.path.insert(0, os.path.join(HOST_DIR, "sim"))
+
+from medium import ChannelModel, Medium  # noqa: E402
+from simnode import NodeConfig, run_node  # noqa: E402
+
+BOOT_S = 1.0  # Time for the nodes to boot before the controller is woken up
+
+
+def _parse_at(value: str) -> tuple:
+    seconds, _, text = value.partition(":")
+    return float(seconds), text
+
+
+def build_nodes(args) -> list:
+    nodes = [NodeConfig("ctrl", bytes.fromhex("C0DE000000000000"), (0.0, 0.0))]
+    if args.serial_capture:
+        nodes[0].serial_capture = os.path.abspath(args.serial_capture)
+    for i in range(args.relays):
+        if args.layout == "line":
+            # A chain away from the controller, for multi-hop forwarding
+            position = (args.distance * (i + 1), 0.0)
+        else:
+            angle = 2 * math.pi * i / max(args.relays, 1)
+            position = (args.distance * math.cos(angle), args.distance * math.sin(angle))
+        config = NodeConfig(f"r{i + 1:02}", (0xE661000000000000 + i + 1).to_bytes(8, "big"), position)
+        config.temperature = 20.0 + i % 5
+        config.verbose = args.verbose
+        nodes.append(config)
+    return nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--relays", type=int, default=4)
+    parser.add_argument("--distance", type=float, default=20.0, help="relay distance from the controller (m)")
+    parser.add_argument(
+        "--layout",
+        choices=("ring", "line"),
+        default="ring",
+        help="relays on a circle around the controller, or in a line spaced --distance apart",
+    )
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--at", type=_parse_at, action="append", default=[], metavar="SECONDS:TEXT")
+    parser.add_argument("--reference-loss", type=float, default=35.0, help="path loss at 1m (dB)")
+    parser.add_argument("--exponent", type=float, default=2.7, help="path loss exponent")
+    parser.add_argument("--shadowing", type=float, default=2.0, help="shadowing sigma (dB)")
+    parser.add_argument("--noise-floor", type=float, default=-110.0, help="noise floor (dBm)")
+    parser.add_argument("--capture", type=float, default=6.0, help="capture threshold (dB)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show relay console output")
+    parser.add_argument("--serial-capture", metavar="FILE", help="write the controller's binary serial output here")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("fork")
+    model = ChannelModel(
+        reference_loss_db=args.reference_loss,
+        path_loss_exponent=args.exponent,
+        shadowing_db=args.shadowing,
+        noise_floor_dbm=args.noise_floor,
+        capture_db=args.capture,
+        seed=args.seed,
+    )
+    medium = Medium(model, context)
+    stats = context.Queue()
+    processes = []
+    consoles = {}
+    for index, config in enumerate(build_nodes(args)):
+        link = medium.attach(config.name, config.position)
+        consoles[config.name] = context.Queue()
+        process = context.Process(
+            target=run_node,
+            args=(config, link, consoles[config.name], stats, REPO_ROOT, args.seed * 1000 + index),
+            daemon=True,
+        )
+        processes.append(process)
+
+    medium.start()
+    for process in processes:
+        process.start()
+
+    started = time.monotonic()
+    script = [(BOOT_S, "\n")] + sorted((BOOT_S + t, text + "\n") for t, text in args.at)
+    try:
+        for at, text in script:
+            time.sleep(max(0.0, started + at - time.monotonic()))
+            consoles["ctrl"].put(text)
+        time.sleep(max(0.0, started + BOOT_S + args.duration - time.monotonic()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=2.0)
+        medium.stop()
+
+    counters = {}
+    while True:
+        try:
+            name, values = stats.get(timeout=0.2)
+        except queue.Empty:
+            break
+        counters[name] = values
+
+    print("\n| Node | TX   | TX airtime | RX   | Weak | Collision | Not listening | Overrun |")
+    print("|------|------|------------|------|------|-----------|---------------|---------|")
+    for name in sorted(counters):
+        c = counters[name]
+        print(
+            f"| {name:<4} | {c['tx_packets']:>4} | {c['tx_airtime_s'] * 1000:>8.1f}ms | {c['rx_packets']:>4} "
+            f"| {c['lost_weak']:>4} | {c['lost_collision']:>9} | {c['lost_not_listening']:>13} | {c['lost_overrun']:>7} |"
+        )
+    print(f"\nMedium: {medium.transmissions} transmissions, {medium.airtime_s * 1000:.1f}ms on air")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Packet size checks for the test request, run on CPython from the
+repository root:
+
+    pytest host/test_packets.py
+
+(`python -m pytest` from the root would import the board's code.py in place
+of the standard library module of that name.)
+"""
+
+import os
+import sys
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HOST_DIR, "sim"), os.path.dirname(HOST_DIR)]
+
+from packets import (  # noqa: E402
+    MAX_PAYLOAD_LENGTH,
+    WIRE_FORMAT_BINARY,
+    WIRE_FORMAT_TEXT,
+    RunTestRequest,
+    decode_packet,
+)
+from packets import TestParameters as Parameters  # noqa: E402, not a test class
+
+
+def _started_params() -> Parameters:
+    params = Parameters()
+    params.test_id = 12
+    params.ack_slots = 12
+    params.ack_slot_ms = 200
+    return params
+
+
+def test_binary_retransmit_to_seven_relays_fits():
+    pending = list(range(1, 8))
+    packet = RunTestRequest.encode(_started_params(), WIRE_FORMAT_BINARY, 500, pending)
+    assert len(packet) <= MAX_PAYLOAD_LENGTH
+    # Too many to list, so the retransmission addresses every relay
+    message = decode_packet(packet)
+    assert message.pending_count == 0
+    assert all(message.is_pending(short_id) for short_id in pending)
+
+
+def test_binary_retransmit_lists_the_relays_that_fit():
+    pending = [0x10000001, 0x10000002, 0x10000003]
+    packet = RunTestRequest.encode(_started_params(), WIRE_FORMAT_BINARY, 500, pending)
+    assert len(packet) <= MAX_PAYLOAD_LENGTH
+    message = decode_packet(packet)
+    assert [message.pending[i] for i in range(message.pending_count)] == pending
+    assert not message.is_pending(0x10000004)
+
+
+def test_full_text_request_exceeds_a_packet_but_binary_fits():
+    params = _started_params()
+    params.num_packets = 1000
+    params.slot_ms = 12
+    params.num_slots = 123
+    params.bitrate = 250000
+    params.frequency_deviation = 250000
+    text = RunTestRequest.encode(params, WIRE_FORMAT_TEXT, 12345)
+    assert len(text) > MAX_PAYLOAD_LENGTH
+    binary = RunTestRequest.encode(params, WIRE_FORMAT_BINARY, 12345, list(range(1, 8)))
+    assert len(binary) <= MAX_PAYLOAD_LENGTH
+    message = decode_packet(binary)
+    assert message.bitrate == 250000
+    assert message.start_in_ms == 12345
@@ -0,0 +1,53 @@
+"""Machine-mode frame checks, run on CPython from the repository root:
+
+    pytest host/test_stream.py
+"""
+
+import io
+import os
+import sys
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HOST_DIR, os.path.join(HOST_DIR, "sim"), os.path.dirname(HOST_DIR)]
+
+from collect import parse, split_frames  # noqa: E402
+from packets import format_short_id  # noqa: E402
+from stats import LinkStats  # noqa: E402
+from stream import ResultStream  # noqa: E402
+
+SHORT_ID = 0x052381F5
+DEVICE_ID = "E661000000000001"
+
+
+def _stream() -> tuple[ResultStream, io.BytesIO]:
+    stream = ResultStream()
+    stream.enabled = True
+    stream._port = port = io.BytesIO()
+    return stream, port
+
+
+def _run(name_of) -> dict:
+    stream, port = _stream()
+    stats = LinkStats(3)
+    for sequence in range(3):
+        stats.add(-60.0, sequence)
+        stream.packet(1, SHORT_ID, sequence, -60.0, 1000 + sequence)
+    stream.run_end(1, "all relays delivered", 1.5, {SHORT_ID: stats}, name_of)
+    frames, rejected = split_frames(port.getvalue())
+    assert rejected == 0
+    return parse(frames)
+
+
+def test_run_summary_carries_the_packet_short_id():
+    # A relay only heard in binary is named by its short id
+    parsed = _run(format_short_id)
+    summary = parsed["summaries"][0]
+    assert summary[1] == SHORT_ID == int(parsed["packets"]["short_id"][0])
+    assert summary[-1] == format_short_id(SHORT_ID)
+
+
+def test_run_summary_keeps_the_full_device_id_as_its_name():
+    parsed = _run({SHORT_ID: DEVICE_ID}.get)
+    summary = parsed["summaries"][0]
+    assert summary[1] == SHORT_ID
+    assert parsed["devices"] == {SHORT_ID: DEVICE_ID}
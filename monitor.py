@@ -0,0 +1,310 @@
+import json
+from array import array
+from console import console
+
+# Heartbeat interval offered when monitoring starts
+DEFAULT_HEARTBEAT_S = 10
+
+# While monitoring: how often alerts are checked, a MONITOR line with every
+# window is printed, and the request is repeated for relays that restarted
+# or came into range
+MONITOR_CHECK_S = 1.0
+MONITOR_REPORT_S = 60.0
+MONITOR_REFRESH_S = 300.0
+
+# Sliding windows kept per relay: name, bucket length and number of buckets.
+# Each is a ring of buckets, so a longer window costs no more memory, only
+# a coarser resolution.
+WINDOWS = (("1m", 5, 12), ("10m", 60, 10), ("1h", 300, 12))
+
+# Relays monitored at most; the least recently heard one makes room
+MONITOR_CAPACITY = 16
+
+# A heartbeat gap this large is a relay that restarted, not lost heartbeats
+MAX_SEQUENCE_GAP = 1000
+
+# Alert thresholds, checked on the shortest window against the longest one.
+# An alert clears once the value is back past the threshold by the hysteresis.
+LOSS_ALERT_PCT = 20.0
+LOSS_HYSTERESIS_PCT = 10.0
+RSSI_ALERT_DB = -95.0
+RSSI_DROP_DB = 6.0  # Below the 1h mean
+RSSI_HYSTERESIS_DB = 3.0
+SILENT_INTERVALS = 3  # Heartbeat intervals without a heartbeat
+
+# Heartbeats a window needs before its loss or RSSI can raise an alert
+MIN_ALERT_SAMPLES = 5
+
+ALERT_LOSS = 0x01
+ALERT_RSSI = 0x02
+ALERT_DROP = 0x04
+ALERT_SILENT = 0x08
+ALERT_NAMES = (
+    (ALERT_LOSS, "loss"),
+    (ALERT_RSSI, "rssi"),
+    (ALERT_DROP, "drop"),
+    (ALERT_SILENT, "silent"),
+)
+
+
+class SlidingWindow:
+    """Heartbeats of one relay over the last `buckets` * `bucket_s` seconds.
+
+    Every bucket holds the heartbeats received and expected (received plus
+    the sequence gaps before them) and the RSSI sum, min and max in half
+    dB, in arrays allocated up front. A bucket is cleared when time wraps
+    back to it, so the window slides without allocating.
+    """
+
+    def __init__(self, name: str, bucket_s: int, buckets: int):
+        self.name = name
+        self.bucket_s = bucket_s
+        self.buckets = buckets
+        self.received = array("H", [0] * buckets)
+        self.expected = array("H", [0] * buckets)
+        self.rssi_total = array("l", [0] * buckets)  # half dB
+        self.rssi_min = array("h", [0] * buckets)
+        self.rssi_max = array("h", [0] * buckets)
+        self._epoch = -1  # Bucket number of the newest bucket since time 0
+
+    @staticmethod
+    def bytes_per_bucket() -> int:
+        return 2 + 2 + 4 + 2 + 2
+
+    def _advance(self, now: float):
+        epoch = int(now // self.bucket_s)
+        if self._epoch < 0:
+            self._epoch = epoch
+            return
+        for step in range(1, min(epoch - self._epoch, self.buckets) + 1):
+            slot = (self._epoch + step) % self.buckets
+            self.received[slot] = self.expected[slot] = 0
+            self.rssi_total[slot] = 0
+        if epoch > self._epoch:
+            self._epoch = epoch
+
+    def add(self, now: float, rssi: float, missed: int):
+        self._advance(now)
+        slot = self._epoch % self.buckets
+        value = round(rssi * 2)
+        if not self.received[slot]:
+            self.rssi_min[slot] = self.rssi_max[slot] = value
+        elif value < self.rssi_min[slot]:
+            self.rssi_min[slot] = value
+        elif value > self.rssi_max[slot]:
+            self.rssi_max[slot] = value
+        self.received[slot] = min(self.received[slot] + 1, 0xFFFF)
+        self.expected[slot] = min(self.expected[slot] + 1 + missed, 0xFFFF)
+        self.rssi_total[slot] += value
+
+    def summary(self, now: float) -> tuple:
+        """(received, expected, RSSI mean, min, max) over the window"""
+        self._advance(now)
+        received = expected = total = 0
+        low = high = 0
+        for slot in range(self.buckets):
+            count = self.received[slot]
+            expected += self.expected[slot]
+            if not count:
+                continue
+            if not received or self.rssi_min[slot] < low:
+                low = self.rssi_min[slot]
+            if not received or self.rssi_max[slot] > high:
+                high = self.rssi_max[slot]
+            received += count
+            total += self.rssi_total[slot]
+        mean = total / received / 2 if received else 0.0
+        return received, expected, mean, low / 2, high / 2
+
+
+def loss_percent(received: int, expected: int) -> float:
+    return 100.0 * (1 - received / expected) if expected else 0.0
+
+
+class DeviceMonitor:
+    """Windows, heartbeat sequence and raised alerts of one relay"""
+
+    def __init__(self, short_id: int):
+        self.short_id = short_id
+        self.windows = [SlidingWindow(*window) for window in WINDOWS]
+        self.last_sequence = -1
+        self.last_heard = 0.0
+        self.heartbeats = 0
+        self.alerts = 0  # ALERT_* bits raised and not cleared yet
+
+    def add(self, sequence: int, rssi: float, now: float):
+        missed = 0
+        if self.last_sequence >= 0:
+            gap = (sequence - self.last_sequence) & 0xFFFF
+            if gap == 0:
+                return  # Repeat, e.g. a flood heard twice
+            if gap <= MAX_SEQUENCE_GAP:
+                missed = gap - 1
+        self.last_sequence = sequence
+        self.last_heard = now
+        self.heartbeats += 1
+        for window in self.windows:
+            window.add(now, rssi, missed)
+
+
+class Monitor:
+    """Long-running link monitoring from relay heartbeats.
+
+    Memory is fixed: at most `capacity` relays, each with the same windows
+    of preallocated buckets, however long monitoring runs. check() compares
+    the shortest window with the thresholds and the longest one and reports
+    every alert raised or cleared since the last call. Relays are tracked
+    by short id, `name_of(short_id)` gives the name they are reported under.
+    """
+
+    def __init__(self, interval_s: int, name_of, capacity: int = MONITOR_CAPACITY):
+        self.interval_s = interval_s
+        self.name_of = name_of
+        self.capacity = capacity
+        self.started_at = 0.0
+        self._devices = {}  # short_id -> DeviceMonitor
+        self._next_check = 0.0
+        self._next_report = 0.0
+        self._next_refresh = 0.0
+
+    def start(self, now: float):
+        self.started_at = now
+        self._next_report = now + MONITOR_REPORT_S
+
+    def request_sent(self, now: float):
+        self._next_refresh = now + MONITOR_REFRESH_S
+
+    def refresh_due(self, now: float) -> bool:
+        """Whether to repeat the request, for relays that restarted or came
+        into range"""
+        return now >= self._next_refresh
+
+    def service(self, now: float):
+        """Print ALERT lines for alerts raised or cleared, and every
+        MONITOR_REPORT_S a MONITOR line with all windows"""
+        if now < self._next_check:
+            return
+        self._next_check = now + MONITOR_CHECK_S
+        for device_id, name, raised, value in self.check(now):
+            # Warnings, so quiet console output still shows them
+            console.warning(
+                "ALERT {}",
+                json.dumps(
+                    {"device": device_id, "alert": name, "raised": raised, "value": round(value, 1)}
+                ),
+            )
+        if now >= self._next_report:
+            self._next_report = now + MONITOR_REPORT_S
+            console.info("MONITOR {}", json.dumps(self.as_dict(now)))
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    @staticmethod
+    def bytes_per_device() -> int:
+        """Size of the bucket arrays of one relay"""
+        buckets = sum(window[2] for window in WINDOWS)
+        return buckets * SlidingWindow.bytes_per_bucket()
+
+    def add(self, short_id: int, sequence: int, rssi: float, now: float):
+        device = self._devices.get(short_id)
+        if device is None:
+            if len(self._devices) >= self.capacity:
+                self._evict()
+            device = self._devices[short_id] = DeviceMonitor(short_id)
+        device.add(sequence, rssi, now)
+
+    def _evict(self):
+        oldest = None
+        for short_id, device in self._devices.items():
+            if oldest is None or device.last_heard < self._devices[oldest].last_heard:
+                oldest = short_id
+        del self._devices[oldest]
+
+    def resume(self, now: float):
+        """Restart the silence timers, e.g. after a test the relays sat out"""
+        for device in self._devices.values():
+            device.last_heard = max(device.last_heard, now)
+
+    def check(self, now: float) -> list:
+        """Alerts raised or cleared: (device name, alert, raised, value)"""
+        changes = []
+        for device in self._devices.values():
+            recent = device.windows[0].summary(now)
+            baseline = device.windows[-1].summary(now)
+            silent_s = now - device.last_heard
+            values = {
+                ALERT_LOSS: loss_percent(recent[0], recent[1]),
+                ALERT_RSSI: recent[2],
+                ALERT_DROP: baseline[2] - recent[2],
+                ALERT_SILENT: silent_s,
+            }
+            raised = 0
+            if recent[1] >= MIN_ALERT_SAMPLES:
+                loss_limit = LOSS_ALERT_PCT
+                if device.alerts & ALERT_LOSS:
+                    loss_limit -= LOSS_HYSTERESIS_PCT
+                if values[ALERT_LOSS] > loss_limit:
+                    raised |= ALERT_LOSS
+            if recent[0] >= MIN_ALERT_SAMPLES:
+                rssi_limit = RSSI_ALERT_DB
+                drop_limit = RSSI_DROP_DB
+                if device.alerts & ALERT_RSSI:
+                    rssi_limit += RSSI_HYSTERESIS_DB
+                if device.alerts & ALERT_DROP:
+                    drop_limit -= RSSI_HYSTERESIS_DB
+                if values[ALERT_RSSI] < rssi_limit:
+                    raised |= ALERT_RSSI
+                if baseline[0] > recent[0] and values[ALERT_DROP] > drop_limit:
+                    raised |= ALERT_DROP
+            if silent_s > SILENT_INTERVALS * self.interval_s:
+                raised |= ALERT_SILENT
+
+            changed = raised ^ device.alerts
+            for bit, name in ALERT_NAMES:
+                if changed & bit:
+                    changes.append(
+                        (self.name_of(device.short_id), name, bool(raised & bit), values[bit])
+                    )
+            device.alerts = raised
+        return changes
+
+    def render(self, now: float):
+        print("\n" + "=" * 80)
+        print(f"MONITOR, heartbeat every {self.interval_s}s, up {now - self.started_at:.0f}s")
+        print("=" * 80)
+        header = "| Device | Heard | Beats |"
+        rule = "|--------|-------|-------|"
+        for name, _, _ in WINDOWS:
+            header += f" Loss {name:<3} | RSSI {name:<3} |"
+            rule += "----------|----------|"
+        print(header + " Alerts |")
+        print(rule + "--------|")
+        for device in self._devices.values():
+            row = f"| {self.name_of(device.short_id):<6} | {now - device.last_heard:>4.0f}s | {device.heartbeats:>5} |"
+            for window in device.windows:
+                received, expected, mean, _, _ = window.summary(now)
+                row += f" {loss_percent(received, expected):>7.1f}% | {mean:>8.1f} |"
+            alerts = ",".join(name for bit, name in ALERT_NAMES if device.alerts & bit)
+            print(f"{row} {alerts or '-':>6} |")
+        print(
+            f"\n  {len(self._devices)}/{self.capacity} relays, "
+            f"{self.bytes_per_device()} bytes of buckets each"
+        )
+        print("=" * 80 + "\n")
+
+    def as_dict(self, now: float) -> dict:
+        devices = {}
+        for device in self._devices.values():
+            entry = {"heard_s": round(now - device.last_heard, 1), "alerts": device.alerts}
+            for window in device.windows:
+                received, expected, mean, low, high = window.summary(now)
+                entry[window.name] = {
+                    "received": received,
+                    "expected": expected,
+                    "rssi_avg": round(mean, 2),
+                    "rssi_min": low,
+                    "rssi_max": high,
+                }
+            devices[self.name_of(device.short_id)] = entry
+        return {"interval_s": self.interval_s, "devices": devices}
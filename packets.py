@@ -1,69 +1,880 @@
+import struct
+import time
 import adafruit_rfm69
 
+# Wire formats. Text packets are colon-delimited UTF-8 and readable in a serial
+# sniffer; binary packets are fixed-layout and several times shorter on air.
+WIRE_FORMAT_TEXT = "text"
+WIRE_FORMAT_BINARY = "binary"
+
+# Format used when encoding without an explicit format. Decoding always accepts
+# both, and relays answer in the format of the request they received.
+DEFAULT_WIRE_FORMAT = WIRE_FORMAT_TEXT
+
+# Binary packets start with a version byte that has the high bit set, so they
+# can never be mistaken for a text packet, followed by a message type byte.
+BINARY_VERSION = 1
+BINARY_HEADER = 0x80 | BINARY_VERSION
+
+# Message types of both modules; diag_packets.py holds the ping, blast,
+# profile, downlink and heartbeat messages
+TYPE_RUN_TEST_REQUEST = 0x01
+TYPE_RUN_TEST_RESPONSE = 0x02
+TYPE_INFO_REQUEST = 0x03
+TYPE_INFO_RESPONSE = 0x04
+TYPE_ABORT_TEST_REQUEST = 0x05
+TYPE_SLOT_ASSIGNMENT = 0x06
+TYPE_PING_REQUEST = 0x07
+TYPE_PING_RESPONSE = 0x08
+TYPE_BLAST_REQUEST = 0x09
+TYPE_BLAST_DATA = 0x0A
+TYPE_BLAST_SUMMARY = 0x0B
+TYPE_STATS_REQUEST = 0x0C
+TYPE_STATS_RESPONSE = 0x0D
+TYPE_TEST_ACK = 0x0E
+TYPE_FLOOD = 0x0F
+TYPE_DOWNLINK_DATA = 0x10
+TYPE_DOWNLINK_SUMMARY = 0x11
+TYPE_MONITOR_REQUEST = 0x12
+TYPE_HEARTBEAT = 0x13
+
+# Length of the RadioHead header in front of a received payload
+RADIO_HEADER_LENGTH = 4
+
+# Radio framing around the payload: the preamble and sync word, whose
+# lengths are radio settings (these are the driver's defaults), then the
+# length byte, RadioHead header and CRC
+DEFAULT_PREAMBLE_LENGTH = 4
+DEFAULT_SYNC_LENGTH = 2
+_FRAME_BYTES = 1 + RADIO_HEADER_LENGTH + 2
+
+# Largest payload the driver sends in one packet
+MAX_PAYLOAD_LENGTH = 60
+
+# Shortest payload on air, a bare binary header
+MIN_PAYLOAD_LENGTH = 2
+
+# Packets a loop reads back to back before it looks at serial input again
+MAX_DRAIN_PACKETS = 8
+
+# Longest an idle loop waits for a packet, which bounds how late it notices
+# serial input
+IDLE_WAIT_S = 0.005
+
+_COLON = 0x3A
+_DOT = 0x2E
+_MINUS = 0x2D
+_ZERO = 0x30
+_F = 0x46
+
+_short_id_cache = {}  # device_id -> short id
+_SHORT_ID_CACHE_SIZE = 32
+
+
+def short_device_id(device_id: str) -> int:
+    """Hash a device id into the id used by the binary format.
+
+    32-bit FNV-1a folded to 30 bits, so decoded ids stay small ints on
+    CircuitPython. The fold changed every id from the first binary format,
+    so all devices have to run the same version.
+    """
+    value = _short_id_cache.get(device_id)
+    if value is not None:
+        return value
+
+    value = 0x811C9DC5
+    for char in device_id:
+        value = ((value ^ ord(char)) * 0x01000193) & 0xFFFFFFFF
+    value = (value >> 30) ^ (value & 0x3FFFFFFF)
+
+    if len(_short_id_cache) >= _SHORT_ID_CACHE_SIZE:
+        _short_id_cache.clear()
+    _short_id_cache[device_id] = value
+    return value
+
+
+def format_short_id(short_id: int) -> str:
+    """Format a short device id for display"""
+    return f"{short_id:08X}"
+
+
+def airtime_s(
+    payload_len: int,
+    bitrate: float,
+    preamble_length: int = DEFAULT_PREAMBLE_LENGTH,
+    sync_length: int = DEFAULT_SYNC_LENGTH,
+) -> float:
+    """Time on air in seconds for a payload of the given length"""
+    return (preamble_length + sync_length + _FRAME_BYTES + payload_len) * 8 / bitrate
+
+
+def binary_header(msg_type: int, size: int) -> bytearray:
+    """A binary packet of the given type with room for `size` bytes of fields"""
+    packet = bytearray(2 + size)
+    packet[0] = BINARY_HEADER
+    packet[1] = msg_type
+    return packet
+
+
+class _DeviceIdCache:
+    """Bounded cache of device id strings so decoding does not build a new one
+    per packet.
+
+    Text ids are matched byte by byte against recently seen ids, binary ids
+    are looked up by short id.
+    """
+
+    _SIZE = 16
+
+    def __init__(self):
+        self._text_ids = [None] * self._SIZE  # [raw bytes, device_id, short_id]
+        self._text_next = 0
+        self._binary_ids = {}  # short_id -> device_id
+
+    def from_text(self, message, buf, start: int, end: int):
+        length = end - start
+        for entry in self._text_ids:
+            if entry is None or len(entry[0]) != length:
+                continue
+            raw = entry[0]
+            i = 0
+            while i < length and raw[i] == buf[start + i]:
+                i += 1
+            if i == length:
+                message.device_id = entry[1]
+                message.short_id = entry[2]
+                return
+
+        raw = bytes(buf[start:end])
+        device_id = str(raw, "utf-8")
+        entry = [raw, device_id, short_device_id(device_id)]
+        self._text_ids[self._text_next] = entry
+        self._text_next = (self._text_next + 1) % self._SIZE
+        message.device_id = device_id
+        message.short_id = entry[2]
+
+    def from_binary(self, message, short_id: int):
+        device_id = self._binary_ids.get(short_id)
+        if device_id is None:
+            if len(self._binary_ids) >= self._SIZE:
+                self._binary_ids.clear()
+            device_id = format_short_id(short_id)
+            self._binary_ids[short_id] = device_id
+        message.device_id = device_id
+        message.short_id = short_id
+
+
+_device_ids = _DeviceIdCache()
+
+
+def _hex_digit(char: int) -> int:
+    char |= 0x20  # Lower case
+    if _ZERO <= char <= _ZERO + 9:
+        return char - _ZERO
+    if 0x61 <= char <= 0x66:
+        return char - 0x61 + 10
+    raise ValueError("Invalid hex field")
+
+
+class PacketReader:
+    """Reads fields in place from a received buffer, without the copies and
+    lists of str/split.
+
+    Text fields are colon-delimited ASCII, binary fields little-endian.
+    Decoding still creates the float fields and, on CPython, any int over
+    256, so it keeps garbage small rather than avoiding it.
+    """
+
+    __slots__ = ("buf", "pos", "end")
+
+    def reset(self, buf, pos: int, end: int):
+        self.buf = buf
+        self.pos = pos
+        self.end = end
+
+    def more(self) -> bool:
+        """Whether fields are left, for optional fields appended to a layout"""
+        return self.pos < self.end
+
+    def _field_end(self) -> int:
+        stop = self.pos
+        while stop < self.end and self.buf[stop] != _COLON:
+            stop += 1
+        return stop
+
+    def text_int(self) -> int:
+        buf = self.buf
+        pos = self.pos
+        stop = self._field_end()
+        negative = pos < stop and buf[pos] == _MINUS
+        if negative:
+            pos += 1
+        if pos >= stop:
+            raise ValueError("Empty integer field")
+        value = 0
+        while pos < stop:
+            digit = buf[pos] - _ZERO
+            if digit < 0 or digit > 9:
+                raise ValueError("Invalid integer field")
+            value = value * 10 + digit
+            pos += 1
+        self.pos = stop + 1
+        return -value if negative else value
+
+    def text_float(self) -> float:
+        buf = self.buf
+        pos = self.pos
+        stop = self._field_end()
+        negative = pos < stop and buf[pos] == _MINUS
+        if negative:
+            pos += 1
+        whole = 0
+        fraction = 0
+        scale = 1
+        seen_dot = False
+        while pos < stop:
+            char = buf[pos]
+            if char == _DOT and not seen_dot:
+                seen_dot = True
+            else:
+                digit = char - _ZERO
+                if digit < 0 or digit > 9:
+                    raise ValueError("Invalid float field")
+                if seen_dot:
+                    fraction = fraction * 10 + digit
+                    scale *= 10
+                else:
+                    whole = whole * 10 + digit
+            pos += 1
+        self.pos = stop + 1
+        value = whole + fraction / scale
+        return -value if negative else value
+
+    def text_hex(self) -> int:
+        buf = self.buf
+        pos = self.pos
+        stop = self._field_end()
+        if pos >= stop:
+            raise ValueError("Empty hex field")
+        value = 0
+        while pos < stop:
+            value = (value << 4) | _hex_digit(buf[pos])
+            pos += 1
+        self.pos = stop + 1
+        return value
+
+    def hex_byte(self) -> int:
+        """Two hex digits without a delimiter, as in a packed bitmap"""
+        pos = self.pos
+        self.pos = pos + 2
+        return (_hex_digit(self.buf[pos]) << 4) | _hex_digit(self.buf[pos + 1])
+
+    def text_bool(self) -> bool:
+        stop = self._field_end()
+        value = self.pos < stop and self.buf[self.pos] in b"T1"
+        self.pos = stop + 1
+        return value
+
+    def text_device_id(self, message):
+        stop = self._field_end()
+        _device_ids.from_text(message, self.buf, self.pos, stop)
+        self.pos = stop + 1
+
+    def u8(self) -> int:
+        value = self.buf[self.pos]
+        self.pos += 1
+        return value
+
+    def i8(self) -> int:
+        value = self.u8()
+        return value - 0x100 if value & 0x80 else value
+
+    def u16(self) -> int:
+        buf = self.buf
+        pos = self.pos
+        self.pos = pos + 2
+        return buf[pos] | (buf[pos + 1] << 8)
+
+    def i16(self) -> int:
+        value = self.u16()
+        return value - 0x10000 if value & 0x8000 else value
+
+    def u32(self) -> int:
+        low = self.u16()
+        return low | (self.u16() << 16)
+
+    def i32(self) -> int:
+        low = self.u16()
+        return low | (self.i16() << 16)
+
+    def binary_device_id(self, message):
+        _device_ids.from_binary(message, self.u32())
+
+    def rest(self) -> str:
+        """The remaining bytes as text, for a trailing free-form field"""
+        value = str(bytes(self.buf[self.pos : self.end]), "utf-8")
+        self.pos = self.end
+        return value
+
+
+_reader = PacketReader()
+
+
+def slot_index(short_id: int, num_slots: int, num_assigned: int) -> int:
+    """Slot of a relay without an assigned index: hashed into the spare slots
+    after the assigned ones, or into all slots if there are none to spare"""
+    if num_slots > num_assigned:
+        return num_assigned + short_id % (num_slots - num_assigned)
+    return short_id % num_slots
+
 
 class TestParameters:
-    num_packets: int = 10
-    delay_ms: int = 1000
-    stagger_ms: int = 100
-    high_power: bool = True
-    tx_power: int = 13
+    __slots__ = (
+        "num_packets",
+        "delay_ms",
+        "stagger_ms",
+        "high_power",
+        "tx_power",
+        "slot_ms",
+        "num_slots",
+        "slot_plan",
+        "num_assigned",
+        "bitrate",
+        "frequency_deviation",
+        "test_id",
+        "ack_slots",
+        "ack_slot_ms",
+        "channels",
+        "channel_step_khz",
+        "dwell_ms",
+        "downlink",
+    )
+
+    def __init__(self):
+        self.num_packets: int = 10
+        self.delay_ms: int = 1000
+        self.stagger_ms: int = 100
+        self.high_power: bool = True
+        self.tx_power: int = 13
+        # Slotted (TDMA) responses, disabled when slot_ms is 0. Relays with an
+        # index assigned for slot_plan use it, the others hash into the slots
+        # after the first num_assigned.
+        self.slot_ms: int = 0
+        self.num_slots: int = 0
+        self.slot_plan: int = 0
+        self.num_assigned: int = 0
+        # Radio settings for the duration of the test, 0 keeps the current one
+        self.bitrate: int = 0
+        self.frequency_deviation: int = 0
+        # Start handshake, absent when test_id is 0. Relays acknowledge the
+        # request in ack_slots slots of ack_slot_ms right after it (by slot plan
+        # index like test responses), and tag their responses with test_id.
+        self.test_id: int = 0
+        self.ack_slots: int = 0
+        self.ack_slot_ms: int = 0
+        # Channel groups, sent with the start handshake. With more than one
+        # channel, the relays with plan index k move to channel k % channels,
+        # channel_step_khz apart above the default frequency, once the test
+        # begins. Channel g gets the g-th dwell_ms of every period, when the
+        # controller listens on it. This isolates the groups' collisions; with
+        # one receiver it does not shorten the test.
+        self.channels: int = 1
+        self.channel_step_khz: int = 0
+        self.dwell_ms: int = 0
+        # Downlink test: the controller sends the packets every delay_ms and
+        # each relay answers once with a summary, in its slot of a window
+        # of ack_slots slots that opens one delay after the last packet
+        self.downlink: bool = False
+
+    @property
+    def radio_changed(self) -> bool:
+        return self.bitrate > 0 or self.frequency_deviation > 0
+
+    @property
+    def slotted(self) -> bool:
+        return self.slot_ms > 0 and self.num_slots > 0
+
+    @property
+    def ack_window_ms(self) -> int:
+        """Time after the request reserved for acknowledgements"""
+        return self.ack_slots * self.ack_slot_ms
+
+    @property
+    def multi_channel(self) -> bool:
+        return self.channels > 1 and self.dwell_ms > 0
+
+    def channel_mhz(self, base_mhz: float, channel: int) -> float:
+        return base_mhz + channel * self.channel_step_khz / 1000.0
+
+    @property
+    def report_at_ms(self) -> int:
+        """When the summary window of a downlink test opens, from the start"""
+        return self.num_packets * self.delay_ms
+
+    @property
+    def period_ms(self) -> int:
+        """Time between two packets of the same relay"""
+        if self.downlink:
+            return self.delay_ms
+        if self.multi_channel:
+            return max(self.delay_ms, self.channels * self.dwell_ms)
+        if self.slotted:
+            return max(self.delay_ms, self.num_slots * self.slot_ms)
+        return self.delay_ms
+
+    def copy(self) -> "TestParameters":
+        """Copy the parameters, e.g. to keep them past the next decoded packet"""
+        params = TestParameters()
+        for name in TestParameters.__slots__:
+            setattr(params, name, getattr(self, name))
+        return params
 
 
 class RunTestRequest(TestParameters):
+    """Starts a test. The start handshake adds when the test schedule begins,
+    relative to this packet, and on retransmissions the relays still expected
+    to acknowledge (all of them when the list is empty)."""
+
+    __slots__ = ("start_in_ms", "pending_count", "pending", "wire_format")
+
+    # Most relays listed in a retransmission
+    PENDING_CAPACITY = 7
+
+    FLAG_HIGH_POWER = 0x01
+    FLAG_DOWNLINK = 0x02
+
+    # num_packets, delay_ms, stagger_ms, flags, tx_power
+    _BINARY = "<HHHBb"
+    # slot_ms, num_slots, slot_plan, num_assigned
+    _BINARY_SLOTS = "<HHBH"
+    # bitrate / 100, frequency_deviation / 100
+    _BINARY_RADIO = "<HH"
+    # test_id, ack_slots, ack_slot_ms, start_in_ms, channels, channel_step_khz,
+    # dwell_ms, then pending short ids
+    _BINARY_START = "<BHHiBHH"
+
+    def __init__(self):
+        super().__init__()
+        self.start_in_ms: int = 0
+        self.pending_count: int = 0
+        self.pending: list[int] = [0] * self.PENDING_CAPACITY
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    def is_pending(self, short_id: int) -> bool:
+        """Whether this (re)transmission is meant for the given relay"""
+        if not self.pending_count:
+            return True
+        for i in range(self.pending_count):
+            if self.pending[i] == short_id:
+                return True
+        return False
+
     @staticmethod
-    def encode(params: TestParameters) -> bytes:
-        return bytes(
-            f"R:{params.num_packets}:{params.delay_ms}:{params.stagger_ms}:{int(params.high_power)}:{params.tx_power}",
-            "utf-8",
-        )
+    def encode(
+        params: TestParameters,
+        wire_format: str | None = None,
+        start_in_ms: int = 0,
+        pending: list | tuple = (),
+    ) -> bytes:
+        """Encode a test request. The `pending` list is left out, which
+        addresses every relay, when it does not fit in the packet. A text
+        request with every block can itself exceed MAX_PAYLOAD_LENGTH, the
+        caller checks the length; binary ones always fit."""
+        # Optional blocks are appended in order, so later blocks also need
+        # the (zeroed) fields of the earlier ones in front of them
+        start = params.test_id > 0
+        radio = params.radio_changed or start
+        slots = params.slotted or radio
+        if not start or len(pending) > RunTestRequest.PENDING_CAPACITY:
+            pending = ()
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            size = struct.calcsize(RunTestRequest._BINARY)
+            slots_size = struct.calcsize(RunTestRequest._BINARY_SLOTS)
+            radio_size = struct.calcsize(RunTestRequest._BINARY_RADIO)
+            start_size = struct.calcsize(RunTestRequest._BINARY_START)
+            room = (MAX_PAYLOAD_LENGTH - 2 - size - slots_size - radio_size - start_size) // 4
+            if len(pending) > room:
+                pending = ()
+            packet = binary_header(
+                TYPE_RUN_TEST_REQUEST,
+                size
+                + (slots_size if slots else 0)
+                + (radio_size if radio else 0)
+                + (start_size + 4 * len(pending) if start else 0),
+            )
+            struct.pack_into(
+                RunTestRequest._BINARY,
+                packet,
+                2,
+                params.num_packets,
+                params.delay_ms,
+                params.stagger_ms,
+                RunTestRequest._flags(params),
+                params.tx_power,
+            )
+            if slots:
+                struct.pack_into(
+                    RunTestRequest._BINARY_SLOTS,
+                    packet,
+                    2 + size,
+                    params.slot_ms,
+                    params.num_slots,
+                    params.slot_plan,
+                    params.num_assigned,
+                )
+            if radio:
+                struct.pack_into(
+                    RunTestRequest._BINARY_RADIO,
+                    packet,
+                    2 + size + slots_size,
+                    round(params.bitrate / 100),
+                    round(params.frequency_deviation / 100),
+                )
+            if start:
+                offset = 2 + size + slots_size + radio_size
+                struct.pack_into(
+                    RunTestRequest._BINARY_START,
+                    packet,
+                    offset,
+                    params.test_id,
+                    params.ack_slots,
+                    params.ack_slot_ms,
+                    start_in_ms,
+                    params.channels,
+                    params.channel_step_khz,
+                    params.dwell_ms,
+                )
+                offset += start_size
+                for short_id in pending:
+                    struct.pack_into("<I", packet, offset, short_id)
+                    offset += 4
+            return bytes(packet)
+
+        text = f"R:{params.num_packets}:{params.delay_ms}:{params.stagger_ms}:{RunTestRequest._flags(params)}:{params.tx_power}"
+        if slots:
+            text += f":{params.slot_ms}:{params.num_slots}:{params.slot_plan}:{params.num_assigned}"
+        if radio:
+            text += f":{round(params.bitrate)}:{round(params.frequency_deviation)}"
+        if start:
+            text += f":{params.test_id}:{params.ack_slots}:{params.ack_slot_ms}:{start_in_ms}"
+            text += f":{params.channels}:{params.channel_step_khz}:{params.dwell_ms}"
+            room = (MAX_PAYLOAD_LENGTH - len(text)) // 9
+            if len(pending) <= room:
+                for short_id in pending:
+                    text += f":{format_short_id(short_id)}"
+        return bytes(text, "utf-8")
 
     @staticmethod
-    def decode(params: list[str]) -> "RunTestRequest":
-        request = RunTestRequest()
-        request.num_packets = int(params[0])
-        request.delay_ms = int(params[1])
-        request.stagger_ms = int(params[2])
-        request.high_power = bool(int(params[3]))
-        request.tx_power = int(params[4])
-        return request
+    def _flags(params: TestParameters) -> int:
+        flags = RunTestRequest.FLAG_HIGH_POWER if params.high_power else 0
+        if params.downlink:
+            flags |= RunTestRequest.FLAG_DOWNLINK
+        return flags
+
+    def _set_flags(self, flags: int):
+        self.high_power = bool(flags & RunTestRequest.FLAG_HIGH_POWER)
+        self.downlink = bool(flags & RunTestRequest.FLAG_DOWNLINK)
+
+    def decode_text(self, reader: PacketReader) -> "RunTestRequest":
+        self.num_packets = reader.text_int()
+        self.delay_ms = reader.text_int()
+        self.stagger_ms = reader.text_int()
+        self._set_flags(reader.text_int())
+        self.tx_power = reader.text_int()
+        if reader.more():
+            self.slot_ms = reader.text_int()
+            self.num_slots = reader.text_int()
+            self.slot_plan = reader.text_int()
+            self.num_assigned = reader.text_int()
+        else:
+            self.slot_ms = self.num_slots = self.slot_plan = self.num_assigned = 0
+        if reader.more():
+            self.bitrate = reader.text_int()
+            self.frequency_deviation = reader.text_int()
+        else:
+            self.bitrate = self.frequency_deviation = 0
+        self.pending_count = 0
+        if reader.more():
+            self.test_id = reader.text_int()
+            self.ack_slots = reader.text_int()
+            self.ack_slot_ms = reader.text_int()
+            self.start_in_ms = reader.text_int()
+            self.channels = reader.text_int()
+            self.channel_step_khz = reader.text_int()
+            self.dwell_ms = reader.text_int()
+            while reader.more() and self.pending_count < self.PENDING_CAPACITY:
+                self.pending[self.pending_count] = reader.text_hex()
+                self.pending_count += 1
+        else:
+            self.test_id = self.ack_slots = self.ack_slot_ms = self.start_in_ms = 0
+            self.channels = 1
+            self.channel_step_khz = self.dwell_ms = 0
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "RunTestRequest":
+        self.num_packets = reader.u16()
+        self.delay_ms = reader.u16()
+        self.stagger_ms = reader.u16()
+        self._set_flags(reader.u8())
+        self.tx_power = reader.i8()
+        if reader.more():
+            self.slot_ms = reader.u16()
+            self.num_slots = reader.u16()
+            self.slot_plan = reader.u8()
+            self.num_assigned = reader.u16()
+        else:
+            self.slot_ms = self.num_slots = self.slot_plan = self.num_assigned = 0
+        if reader.more():
+            self.bitrate = reader.u16() * 100
+            self.frequency_deviation = reader.u16() * 100
+        else:
+            self.bitrate = self.frequency_deviation = 0
+        self.pending_count = 0
+        if reader.more():
+            self.test_id = reader.u8()
+            self.ack_slots = reader.u16()
+            self.ack_slot_ms = reader.u16()
+            self.start_in_ms = reader.i32()
+            self.channels = reader.u8()
+            self.channel_step_khz = reader.u16()
+            self.dwell_ms = reader.u16()
+            while reader.more() and self.pending_count < self.PENDING_CAPACITY:
+                self.pending[self.pending_count] = reader.u32()
+                self.pending_count += 1
+        else:
+            self.test_id = self.ack_slots = self.ack_slot_ms = self.start_in_ms = 0
+            self.channels = 1
+            self.channel_step_khz = self.dwell_ms = 0
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
 
 
 class RunTestResponse:
+    __slots__ = ("device_id", "short_id", "packet_num", "test_id", "wire_format")
+
+    # short device id, packet_num, then the test id if the test has one
+    _BINARY = "<IH"
+
     def __init__(self):
         self.device_id: str = ""
+        self.short_id: int = 0
         self.packet_num: int = 0
+        self.test_id: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
 
     @staticmethod
-    def encode(device_id: str, packet_num: int) -> bytes:
+    def encode(
+        device_id: str,
+        packet_num: int,
+        wire_format: str | None = None,
+        test_id: int = 0,
+    ) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            size = struct.calcsize(RunTestResponse._BINARY)
+            packet = binary_header(TYPE_RUN_TEST_RESPONSE, size + (1 if test_id else 0))
+            struct.pack_into(
+                RunTestResponse._BINARY,
+                packet,
+                2,
+                short_device_id(device_id),
+                packet_num,
+            )
+            if test_id:
+                packet[2 + size] = test_id
+            return bytes(packet)
+
+        if test_id:
+            return bytes(f"RR:{device_id}:{packet_num}:{test_id}", "utf-8")
         return bytes(f"RR:{device_id}:{packet_num}", "utf-8")
 
+    def decode_text(self, reader: PacketReader) -> "RunTestResponse":
+        reader.text_device_id(self)
+        self.packet_num = reader.text_int()
+        self.test_id = reader.text_int() if reader.more() else 0
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "RunTestResponse":
+        reader.binary_device_id(self)
+        self.packet_num = reader.u16()
+        self.test_id = reader.u8() if reader.more() else 0
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class TestAck:
+    """A relay confirming it received the request of a test"""
+
+    __slots__ = ("device_id", "short_id", "test_id", "wire_format")
+
+    # short device id, test id
+    _BINARY = "<IB"
+
+    def __init__(self):
+        self.device_id: str = ""
+        self.short_id: int = 0
+        self.test_id: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
     @staticmethod
-    def decode(params: list[str]) -> "RunTestResponse":
-        response = RunTestResponse()
-        response.device_id = params[0]
-        response.packet_num = int(params[1])
-        return response
+    def encode(device_id: str, test_id: int, wire_format: str | None = None) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(TYPE_TEST_ACK, struct.calcsize(TestAck._BINARY))
+            struct.pack_into(
+                TestAck._BINARY, packet, 2, short_device_id(device_id), test_id
+            )
+            return bytes(packet)
+
+        return bytes(f"TA:{device_id}:{test_id}", "utf-8")
+
+    def decode_text(self, reader: PacketReader) -> "TestAck":
+        reader.text_device_id(self)
+        self.test_id = reader.text_int()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "TestAck":
+        reader.binary_device_id(self)
+        self.test_id = reader.u8()
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
 
 
 class InfoRequest:
+    __slots__ = ("wire_format",)
+
+    def __init__(self):
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
     @staticmethod
-    def encode() -> bytes:
+    def encode(wire_format: str | None = None) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            return bytes(binary_header(TYPE_INFO_REQUEST, 0))
+
         return bytes("I", "utf-8")
 
+    def decode_text(self, reader: PacketReader) -> "InfoRequest":
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "InfoRequest":
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class AbortTestRequest:
+    __slots__ = ("wire_format",)
+
+    def __init__(self):
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    @staticmethod
+    def encode(wire_format: str | None = None) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            return bytes(binary_header(TYPE_ABORT_TEST_REQUEST, 0))
+
+        return bytes("A", "utf-8")
+
+    def decode_text(self, reader: PacketReader) -> "AbortTestRequest":
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "AbortTestRequest":
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class SlotAssignment:
+    """Assigns response slot indices to relays (by short id) for one slot plan"""
+
+    __slots__ = ("slot_plan", "count", "short_ids", "indices", "wire_format")
+
+    # Most assignments per packet in each format
+    CAPACITY_BINARY = 9
+    CAPACITY_TEXT = 4
+
+    def __init__(self):
+        self.slot_plan: int = 0
+        self.count: int = 0
+        self.short_ids: list[int] = [0] * self.CAPACITY_BINARY
+        self.indices: list[int] = [0] * self.CAPACITY_BINARY
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
+    def index_of(self, short_id: int) -> int | None:
+        for i in range(self.count):
+            if self.short_ids[i] == short_id:
+                return self.indices[i]
+        return None
+
     @staticmethod
-    def decode(params: list[str]) -> "InfoRequest":
-        return InfoRequest()
+    def encode(
+        slot_plan: int, assignments: list, wire_format: str | None = None
+    ) -> bytes:
+        """Encode (short_id, index) pairs, at most the format's capacity"""
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(TYPE_SLOT_ASSIGNMENT, 2 + 6 * len(assignments))
+            packet[2] = slot_plan
+            packet[3] = len(assignments)
+            offset = 4
+            for short_id, index in assignments:
+                struct.pack_into("<IH", packet, offset, short_id, index)
+                offset += 6
+            return bytes(packet)
+
+        text = f"SA:{slot_plan}"
+        for short_id, index in assignments:
+            text += f":{format_short_id(short_id)}:{index}"
+        return bytes(text, "utf-8")
+
+    def decode_text(self, reader: PacketReader) -> "SlotAssignment":
+        self.slot_plan = reader.text_int()
+        self.count = 0
+        while reader.more() and self.count < self.CAPACITY_BINARY:
+            self.short_ids[self.count] = reader.text_hex()
+            self.indices[self.count] = reader.text_int()
+            self.count += 1
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "SlotAssignment":
+        self.slot_plan = reader.u8()
+        count = min(reader.u8(), self.CAPACITY_BINARY)
+        for i in range(count):
+            self.short_ids[i] = reader.u32()
+            self.indices[i] = reader.u16()
+        self.count = count
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
 
 
 class InfoResponse:
+    __slots__ = (
+        "device_id",
+        "short_id",
+        "high_power",
+        "tx_power",
+        "temperature",
+        "frequency_mhz",
+        "bitrate_kbps",
+        "frequency_deviation",
+        "wire_format",
+    )
+
+    # short device id, flags, tx_power, temperature (0.1C), frequency (kHz),
+    # bitrate (100bit/s), frequency deviation (100hz)
+    _BINARY = "<IBbhIHH"
+
     def __init__(self):
         self.device_id: str = ""
+        self.short_id: int = 0
         self.high_power: bool = False
         self.tx_power: int = 0
         self.temperature: float = 0.0
         self.frequency_mhz: float = 0.0
         self.bitrate_kbps: float = 0.0
         self.frequency_deviation: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
 
     @staticmethod
     def encode(
@@ -74,54 +885,297 @@ class InfoResponse:
         frequency_mhz: float,
         bitrate_kbps: float,
         frequency_deviation_hz: float,
+        wire_format: str | None = None,
     ) -> bytes:
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            packet = binary_header(
+                TYPE_INFO_RESPONSE, struct.calcsize(InfoResponse._BINARY)
+            )
+            struct.pack_into(
+                InfoResponse._BINARY,
+                packet,
+                2,
+                short_device_id(device_id),
+                int(high_power),
+                int(tx_power),
+                round(temperature * 10),
+                round(frequency_mhz * 1000),
+                round(bitrate_kbps / 100),
+                round(frequency_deviation_hz / 100),
+            )
+            return bytes(packet)
+
         return bytes(
             f"IR:{device_id}:{high_power}:{tx_power}:{temperature}:{frequency_mhz}:{bitrate_kbps}:"
             f"{frequency_deviation_hz}",
             "utf-8",
         )
 
+    def decode_text(self, reader: PacketReader) -> "InfoResponse":
+        reader.text_device_id(self)
+        self.high_power = reader.text_bool()
+        self.tx_power = reader.text_int()
+        self.temperature = reader.text_float()
+        self.frequency_mhz = reader.text_float()
+        self.bitrate_kbps = reader.text_float()
+        self.frequency_deviation = reader.text_float()
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "InfoResponse":
+        reader.binary_device_id(self)
+        self.high_power = bool(reader.u8() & 0x01)
+        self.tx_power = reader.i8()
+        self.temperature = reader.i16() / 10
+        self.frequency_mhz = reader.u32() / 1000
+        self.bitrate_kbps = reader.u16() * 100.0
+        self.frequency_deviation = reader.u16() * 100.0
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+
+class Flood:
+    """Envelope that relays rebroadcast to reach devices out of direct range.
+
+    The origin's short id and sequence number identify the flood, so every
+    device handles and forwards it once. Each forwarder increments `hops`,
+    appends the RSSI it received the flood at and adds the time it held it
+    to `delay_ms`. The wrapped packet follows and is decoded with inner().
+    """
+
+    __slots__ = (
+        "origin",
+        "sequence",
+        "hops",
+        "max_hops",
+        "delay_ms",
+        "rssi",
+        "buf",
+        "inner_offset",
+        "wire_format",
+    )
+
+    # Most hops a flood can be allowed
+    MAX_HOPS = 7
+
+    # origin short id, sequence, hops, max hops, delay ms, then one signed
+    # RSSI byte per hop and the wrapped packet
+    _BINARY = "<IHBBH"
+
+    def __init__(self):
+        self.origin: int = 0
+        self.sequence: int = 0
+        self.hops: int = 0
+        self.max_hops: int = 0
+        self.delay_ms: int = 0
+        self.rssi: list[int] = [0] * self.MAX_HOPS
+        self.buf = None
+        self.inner_offset: int = 0
+        self.wire_format: str = WIRE_FORMAT_TEXT
+
     @staticmethod
-    def decode(params: list[str]) -> "InfoResponse":
-        response = InfoResponse()
-        response.device_id = params[0]
-        response.high_power = bool(params[1])
-        response.tx_power = int(params[2])
-        response.temperature = float(params[3])
-        response.frequency_mhz = float(params[4])
-        response.bitrate_kbps = float(params[5])
-        response.frequency_deviation = float(params[6])
-
-        return response
-
-
-def decode_packet(packet: bytes):
-    """Parse incoming packet and return command and parameters"""
-    packet_text = str(packet, "utf-8")
-    parts = packet_text.split(":")
-
-    cmd = parts[0]
-    params = parts[1:] if len(parts) > 1 else []
-    if cmd == "R":
-        return RunTestRequest.decode(params)
-    if cmd == "RR":
-        return RunTestResponse.decode(params)
-    if cmd == "I":
-        return InfoRequest.decode(params)
-    if cmd == "IR":
-        return InfoResponse.decode(params)
-
-    return None
-
-
-def check_for_message(rfm69: adafruit_rfm69.RFM69) -> tuple[any | None, float | None]:
+    def encode(
+        origin: int,
+        sequence: int,
+        max_hops: int,
+        packet,
+        wire_format: str | None = None,
+        hops: int = 0,
+        rssi: list | tuple = (),
+        delay_ms: int = 0,
+    ) -> bytes | None:
+        """Wrap a packet, or return None if the envelope does not fit"""
+        max_hops = min(max_hops, Flood.MAX_HOPS)
+        delay_ms = min(delay_ms, 0xFFFF)
+        if (wire_format or DEFAULT_WIRE_FORMAT) == WIRE_FORMAT_BINARY:
+            size = struct.calcsize(Flood._BINARY)
+            if 2 + size + len(rssi) + len(packet) > MAX_PAYLOAD_LENGTH:
+                return None
+            envelope = binary_header(TYPE_FLOOD, size + len(rssi) + len(packet))
+            struct.pack_into(
+                Flood._BINARY, envelope, 2, origin, sequence, hops, max_hops, delay_ms
+            )
+            offset = 2 + size
+            for value in rssi:
+                struct.pack_into("<b", envelope, offset, max(-128, min(127, value)))
+                offset += 1
+            envelope[offset:] = packet
+            return bytes(envelope)
+
+        text = f"F:{format_short_id(origin)}:{sequence}:{hops}:{max_hops}:{delay_ms}:"
+        for value in rssi:
+            text += f"{value}:"
+        if len(text) + len(packet) > MAX_PAYLOAD_LENGTH:
+            return None
+        return bytes(text, "utf-8") + bytes(packet)
+
+    def inner(self):
+        """Decode the wrapped packet. Like every decoded message it is reused
+        by the next decode; a flood wrapped in a flood is not decoded."""
+        buf = self.buf
+        offset = self.inner_offset
+        if offset + 1 < len(buf) and (
+            (buf[offset] == _F and buf[offset + 1] == _COLON)
+            or (buf[offset] == BINARY_HEADER and buf[offset + 1] == TYPE_FLOOD)
+        ):
+            return None
+        return decode_packet(self.buf, self.inner_offset)
+
+    def inner_packet(self) -> bytes:
+        """Copy of the wrapped packet, to forward after the next decode"""
+        return bytes(self.buf[self.inner_offset :])
+
+    def decode_text(self, reader: PacketReader) -> "Flood":
+        self.origin = reader.text_hex()
+        self.sequence = reader.text_int()
+        self.hops = min(reader.text_int(), self.MAX_HOPS)
+        self.max_hops = reader.text_int()
+        self.delay_ms = reader.text_int()
+        for i in range(self.hops):
+            self.rssi[i] = reader.text_int()
+        self._keep_inner(reader)
+        self.wire_format = WIRE_FORMAT_TEXT
+        return self
+
+    def decode_binary(self, reader: PacketReader) -> "Flood":
+        self.origin = reader.u32()
+        self.sequence = reader.u16()
+        self.hops = min(reader.u8(), self.MAX_HOPS)
+        self.max_hops = reader.u8()
+        self.delay_ms = reader.u16()
+        for i in range(self.hops):
+            self.rssi[i] = reader.i8()
+        self._keep_inner(reader)
+        self.wire_format = WIRE_FORMAT_BINARY
+        return self
+
+    def _keep_inner(self, reader: PacketReader):
+        if reader.pos >= reader.end:
+            raise ValueError("Flood without a wrapped packet")
+        self.buf = reader.buf
+        self.inner_offset = reader.pos
+
+
+# Decoded messages are reused for every packet of their type, so callers must
+# copy any field they want to keep before the next call to decode_packet.
+# Keyed by the first two bytes of the packet; the value holds the number of
+# bytes before the first field and the decoder to call.
+_DECODERS = {}
+
+
+def register_decoder(prefix: bytes, skip: int, decoder):
+    """Have decode_packet call `decoder(reader)` for packets starting with
+    `prefix`, its fields starting `skip` bytes in"""
+    second = prefix[1] if len(prefix) > 1 else 0
+    _DECODERS[(prefix[0] << 8) | second] = (skip, decoder)
+
+
+register_decoder(b"R:", 2, RunTestRequest().decode_text)
+register_decoder(b"RR", 3, RunTestResponse().decode_text)
+register_decoder(b"I", 1, InfoRequest().decode_text)
+register_decoder(b"IR", 3, InfoResponse().decode_text)
+register_decoder(b"A", 1, AbortTestRequest().decode_text)
+register_decoder(b"SA", 3, SlotAssignment().decode_text)
+register_decoder(b"TA", 3, TestAck().decode_text)
+register_decoder(b"F:", 2, Flood().decode_text)
+for _msg_type, _message in (
+    (TYPE_RUN_TEST_REQUEST, RunTestRequest()),
+    (TYPE_RUN_TEST_RESPONSE, RunTestResponse()),
+    (TYPE_INFO_REQUEST, InfoRequest()),
+    (TYPE_INFO_RESPONSE, InfoResponse()),
+    (TYPE_ABORT_TEST_REQUEST, AbortTestRequest()),
+    (TYPE_SLOT_ASSIGNMENT, SlotAssignment()),
+    (TYPE_TEST_ACK, TestAck()),
+    (TYPE_FLOOD, Flood()),
+):
+    register_decoder(bytes((BINARY_HEADER, _msg_type)), 2, _message.decode_binary)
+
+
+# Whether diag_packets registered its decoders yet. A relay imports it with
+# the first packet no decoder above knows, instead of at boot.
+_diag_loaded = False
+
+
+def _load_diag_decoders() -> bool:
+    """Register the ping, blast, profiling, downlink and monitoring decoders;
+    False when they already were"""
+    global _diag_loaded
+    if _diag_loaded:
+        return False
+    _diag_loaded = True
+    import diag_packets  # noqa: F401
+
+    return True
+
+
+def decode_packet(packet, offset: int = 0):
+    """Parse incoming packet in place and return the decoded message.
+
+    `offset` skips any header in front of the payload. Unknown packets return
+    None; the returned message object is reused by the next call.
+    """
+    end = len(packet)
+    if offset >= end:
+        return None
+
+    key = (packet[offset] << 8) | (packet[offset + 1] if offset + 1 < end else 0)
+    entry = _DECODERS.get(key)
+    if entry is None:
+        if not _load_diag_decoders():
+            return None
+        entry = _DECODERS.get(key)
+        if entry is None:
+            return None
+
+    skip, decoder = entry
+    _reader.reset(packet, offset + skip, end)
+    return decoder(_reader)
+
+
+def check_for_message(
+    rfm69: adafruit_rfm69.RFM69, timeout: float = 0.1
+) -> tuple[object | None, float | None]:
     try:
-        packet = rfm69.receive(timeout=0.1, keep_listening=True)
+        # Keep the RadioHead header so the driver does not copy the payload
+        packet = rfm69.receive(
+            timeout=timeout, keep_listening=True, with_header=True
+        )
         if packet is not None:
             rssi = rfm69.last_rssi
-            message = decode_packet(packet)
+            message = decode_packet(packet, RADIO_HEADER_LENGTH)
             return message, rssi
         return None, None
     except Exception as e:
         print(f"Error decoding packet: {e}")
         return None, None
+
+
+def poll_message(rfm69: adafruit_rfm69.RFM69) -> tuple[object | None, float | None]:
+    """Read a packet only if one is already waiting in the FIFO.
+
+    Checks the payload ready flag and returns straight away when it is clear,
+    so a loop can drain a burst of packets without ever blocking.
+    """
+    if not rfm69.payload_ready():
+        return None, None
+    return check_for_message(rfm69, 0)
+
+
+def wait_for_packet(rfm69: adafruit_rfm69.RFM69, limit_s: float = IDLE_WAIT_S) -> bool:
+    """Sleep until a packet is waiting in the FIFO or the limit is over.
+
+    Sleeps in steps no longer than the shortest packet takes on air, so a
+    packet is picked up at most one step after it arrived, before a second
+    one can complete and overrun it. Also puts the radio back in receive
+    mode if something left it in standby.
+    """
+    if rfm69.operation_mode != adafruit_rfm69.RX_MODE:
+        rfm69.listen()
+    step_s = airtime_s(MIN_PAYLOAD_LENGTH, rfm69.bitrate)
+    deadline = time.monotonic() + limit_s
+    while not rfm69.payload_ready():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(step_s, remaining))
+    return True
@@ -0,0 +1,188 @@
+import gc
+import sys
+import time
+
+# Functions timed while profiling is on, by the name modules import them
+# under, and the counter they add to
+INSTRUMENTED = {
+    "check_for_message": "receive",
+    "poll_message": "receive",
+    "wait_for_packet": "idle",
+    "attempt_send": "send",
+    "get_user_command": "input",
+    "check_serial_input": "input",
+    "indicate_ready": "led",
+    "indicate_processing": "led",
+    "print": "print",
+}
+INSTRUMENTED_MODULES = (
+    "controller_mode",
+    "controller_test",
+    "controller_downlink",
+    "relay_mode",
+    "relay_diag",
+    "ping",
+    "blast",
+    "flood",
+    "console",
+)
+
+# Counter names in the order they are reported; "heap" is not timed, see
+# Profiler.heap_counter
+COUNTER_NAMES = ("loop", "receive", "idle", "send", "input", "led", "print")
+
+_mem_free = getattr(gc, "mem_free", None)
+
+
+class Counter:
+    __slots__ = ("name", "calls", "total_ns", "max_ns")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, elapsed_ns: int):
+        self.calls += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+
+
+class Profiler:
+    """Call counts and times of the hot paths, plus heap use.
+
+    Enabling swaps the instrumented functions for timed wrappers in the
+    modules that call them, and disabling puts the originals back, so the
+    only cost while off is the loops checking `enabled` once per pass.
+    Modules imported on first use are patched by `instrument` instead.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self._patched = []  # (module, name, original or None for builtins)
+        self._patched_modules = set()
+        self.reset()
+
+    def reset(self):
+        self.counters = {name: Counter(name) for name in COUNTER_NAMES}
+        self.mem_free = 0
+        self.min_mem_free = 0
+        self.gc_count = 0
+        self._last_free = 0
+        self._last_tick_ns = 0
+
+    def enable(self):
+        if self.enabled:
+            return
+        for module_name in INSTRUMENTED_MODULES:
+            self._patch(module_name)
+        self._last_tick_ns = 0
+        self.enabled = True
+
+    def instrument(self, module_name: str):
+        """Patch a module that was imported lazily, after profiling started"""
+        if self.enabled:
+            self._patch(module_name)
+
+    def _patch(self, module_name: str):
+        module = sys.modules.get(module_name)
+        if (
+            module is None
+            or module_name not in INSTRUMENTED_MODULES
+            or module_name in self._patched_modules
+        ):
+            return
+        self._patched_modules.add(module_name)
+        for name, counter_name in INSTRUMENTED.items():
+            original = getattr(module, name, None)
+            if original is None and name != "print":
+                continue
+            self._patched.append((module, name, original))
+            setattr(
+                module,
+                name,
+                self._timed(self.counters[counter_name], original or print),
+            )
+
+    def disable(self):
+        for module, name, original in self._patched:
+            if original is None:
+                delattr(module, name)
+            else:
+                setattr(module, name, original)
+        self._patched = []
+        self._patched_modules = set()
+        self.enabled = False
+
+    def _timed(self, counter: Counter, function):
+        def timed(*args, **kwargs):
+            started = time.monotonic_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                counter.add(time.monotonic_ns() - started)
+
+        return timed
+
+    def tick(self):
+        """Called once per loop pass: loop time and a heap sample"""
+        now = time.monotonic_ns()
+        if self._last_tick_ns:
+            self.counters["loop"].add(now - self._last_tick_ns)
+        self._last_tick_ns = now
+
+        if _mem_free is None:
+            return
+        free = _mem_free()
+        # The heap only grows back when the collector ran
+        if free > self._last_free + 256 and self._last_free:
+            self.gc_count += 1
+        self._last_free = free
+        self.mem_free = free
+        if not self.min_mem_free or free < self.min_mem_free:
+            self.min_mem_free = free
+
+    def heap_counter(self) -> Counter:
+        """Heap figures packed into a counter for the stats packet: calls is
+        the collections seen, total_ns the free heap and max_ns the lowest"""
+        heap = Counter("heap")
+        heap.calls = self.gc_count
+        heap.total_ns = self.mem_free
+        heap.max_ns = self.min_mem_free
+        return heap
+
+    def snapshot(self) -> list:
+        return [self.counters[name] for name in COUNTER_NAMES] + [self.heap_counter()]
+
+
+def render_counters(title: str, counters: list):
+    """Print counters as a table, with the heap pseudo-counter last"""
+    print("\n" + "=" * 80)
+    print(title)
+    print("=" * 80)
+    print("| Path | Calls | Total | Mean | Max |")
+    print("|------|-------|-------|------|-----|")
+    for counter in counters:
+        if counter.name == "heap":
+            continue
+        mean_us = counter.total_ns / counter.calls / 1000 if counter.calls else 0.0
+        print(
+            f"| {counter.name:<7} | {counter.calls:>7} | {counter.total_ns / 1e6:>9.1f}ms "
+            f"| {mean_us:>9.1f}us | {counter.max_ns / 1000:>9.1f}us |"
+        )
+    for counter in counters:
+        if counter.name == "heap":
+            if counter.total_ns:
+                print(
+                    f"\nFree heap: {counter.total_ns} bytes, lowest {counter.max_ns} bytes, "
+                    f"{counter.calls} collections seen"
+                )
+            else:
+                print("\nFree heap: not available on this platform")
+    print("=" * 80 + "\n")
+
+
+profiler = Profiler()
@@ -0,0 +1,176 @@
+import time
+from array import array
+import adafruit_rfm69
+from diag_packets import (
+    PING_TIMESTAMP_MASK,
+    PingRequest,
+    PingResponse,
+)
+from packets import (
+    airtime_s,
+    check_for_message,
+    format_short_id,
+)
+from input import get_user_input
+from registry import Registry
+from rfm_util import attempt_send
+from rgb_indicator import indicate_processing, indicate_ready
+from stats import percentile
+
+# Most round trips kept per relay for the percentiles
+MAX_PINGS = 500
+
+# How long to wait for a ping echo before counting it lost
+PING_TIMEOUT_S = 0.5
+
+
+def timestamp_us() -> int:
+    return (time.monotonic_ns() // 1000) & PING_TIMESTAMP_MASK
+
+
+class PingResults:
+    """Round trips to one relay and where their time went"""
+
+    def __init__(self, device_id: str, capacity: int):
+        self.device_id = device_id
+        self.sent = 0
+        self.rtt_us = array("L")
+        self._capacity = capacity
+        self._jitter_sum_us = 0
+        self._airtime_sum_us = 0
+        self._turnaround_sum_us = 0
+
+    def add(self, rtt_us: int, airtime_us: int, turnaround_us: int):
+        if len(self.rtt_us) >= self._capacity:
+            return
+        if self.rtt_us:
+            self._jitter_sum_us += abs(rtt_us - self.rtt_us[-1])
+        self.rtt_us.append(rtt_us)
+        self._airtime_sum_us += airtime_us
+        self._turnaround_sum_us += turnaround_us
+
+    def render(self):
+        received = len(self.rtt_us)
+        timeouts = self.sent - received
+        timeout_rate = 100.0 * timeouts / self.sent if self.sent else 0.0
+        print(
+            f"\n{self.device_id}: {received}/{self.sent} replies, {timeout_rate:.1f}% timed out"
+        )
+        if not received:
+            return
+
+        rtts = sorted(self.rtt_us)
+        jitter = self._jitter_sum_us / (received - 1) if received > 1 else 0
+        print(
+            f"  RTT min {rtts[0] / 1000:.1f}ms | median {percentile(rtts, 0.5) / 1000:.1f}ms"
+            f" | p95 {percentile(rtts, 0.95) / 1000:.1f}ms | p99 {percentile(rtts, 0.99) / 1000:.1f}ms"
+            f" | max {rtts[-1] / 1000:.1f}ms | jitter {jitter / 1000:.1f}ms"
+        )
+
+        mean_rtt = sum(rtts) / received
+        airtime = self._airtime_sum_us / received
+        turnaround = self._turnaround_sum_us / received
+        other = max(0.0, mean_rtt - airtime - turnaround)
+        print(
+            f"  Mean {mean_rtt / 1000:.1f}ms = airtime {airtime / 1000:.1f}ms"
+            f" + relay turnaround {turnaround / 1000:.1f}ms"
+            f" + radio/driver and receive polling {other / 1000:.1f}ms"
+        )
+
+
+class PingSession:
+    """Pings relays one at a time, waiting for each echo before the next ping"""
+
+    def __init__(self, rfm69: adafruit_rfm69.RFM69, wire_format: str):
+        self._rfm69 = rfm69
+        self._wire_format = wire_format
+        self._sequence = 0
+
+    def run(
+        self, targets: dict, count: int, interval_ms: int, timeout_s: float
+    ) -> list:
+        """Ping each relay in `targets` (short_id -> device_id) `count` times"""
+        results = []
+        for short_id, device_id in targets.items():
+            print(f"\n[PING] {device_id} ({format_short_id(short_id)}): {count} pings")
+            result = PingResults(device_id, min(count, MAX_PINGS))
+            for _ in range(count):
+                self._ping(short_id, result, timeout_s)
+                time.sleep(interval_ms / 1000.0)
+            results.append(result)
+        return results
+
+    def _ping(self, short_id: int, result: PingResults, timeout_s: float):
+        self._sequence = (self._sequence + 1) & 0xFFFF
+        sequence = self._sequence
+        request = PingRequest.encode(
+            short_id, sequence, timestamp_us(), self._wire_format
+        )
+        attempt_send(self._rfm69, request)
+        result.sent += 1
+
+        deadline = time.monotonic() + timeout_s
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"[PING] seq {sequence}: timeout")
+                return
+            message, _ = check_for_message(self._rfm69, remaining)
+            if (
+                isinstance(message, PingResponse)
+                and message.short_id == short_id
+                and message.sequence == sequence
+            ):
+                break
+
+        rtt_us = (timestamp_us() - message.timestamp_us) & PING_TIMESTAMP_MASK
+        response_len = len(
+            PingResponse.encode(
+                message.device_id,
+                sequence,
+                message.timestamp_us,
+                message.turnaround_us,
+                message.wire_format,
+            )
+        )
+        bitrate = self._rfm69.bitrate
+        airtime_us = int(
+            (airtime_s(len(request), bitrate) + airtime_s(response_len, bitrate))
+            * 1000000
+        )
+        result.add(rtt_us, airtime_us, message.turnaround_us)
+        print(f"[PING] seq {sequence}: {rtt_us / 1000:.1f}ms")
+
+
+def ping_relays(rfm69: adafruit_rfm69.RFM69, registry: Registry, wire_format: str):
+    """Ping one known relay, or all of them in turn, and report round trips"""
+    if not len(registry):
+        print("\n[CONTROLLER] No relays known yet, request device info (q) first")
+        return
+
+    print("\n[CONTROLLER] Ping Relays")
+    print("-" * 40)
+    target = get_user_input("Relay device id or short id (all)", "all")
+    count = int(get_user_input("Pings per relay", 10))
+    interval_ms = int(get_user_input("Pause between pings (ms)", 100))
+
+    if target.lower() == "all":
+        targets = registry.names()
+    else:
+        relay = registry.find(target)
+        if relay is None:
+            print(f"[CONTROLLER] Unknown relay: {target}")
+            return
+        targets = {relay.short_id: relay.device_id}
+
+    indicate_processing()
+    session = PingSession(rfm69, wire_format)
+    results = session.run(targets, count, interval_ms, PING_TIMEOUT_S)
+    indicate_ready()
+
+    print("\n" + "=" * 80)
+    print("PING RESULTS")
+    print("=" * 80)
+    for result in results:
+        result.render()
+    print("=" * 80 + "\n")
@@ -0,0 +1,157 @@
+from packets import InfoResponse, format_short_id
+
+# Relays kept at most; the least recently heard one makes room for a new one
+REGISTRY_CAPACITY = 64
+
+# A relay not heard from for this long is dropped
+REGISTRY_TTL_S = 900.0
+
+
+class Relay:
+    """What the controller knows about one relay"""
+
+    __slots__ = (
+        "device_id",
+        "short_id",
+        "rssi",
+        "last_seen",
+        "has_info",
+        "high_power",
+        "tx_power",
+        "temperature",
+        "frequency_mhz",
+        "bitrate",
+        "frequency_deviation",
+    )
+
+    def __init__(self, short_id: int, device_id: str):
+        self.short_id = short_id
+        self.device_id = device_id
+        self.rssi = 0.0
+        self.last_seen = 0.0
+        self.has_info = False  # Whether the fields below came from an InfoResponse
+        self.high_power = False
+        self.tx_power = 0
+        self.temperature = 0.0
+        self.frequency_mhz = 0.0
+        self.bitrate = 0.0
+        self.frequency_deviation = 0
+
+
+class Registry:
+    """Relays heard recently, keyed by short id.
+
+    Any relay packet refreshes an entry's RSSI and last-seen time, info
+    responses also fill in its radio settings. Entries expire after
+    `ttl_s`, and when all `capacity` entries are taken the one heard least
+    recently is evicted, so memory stays bounded however large the fleet.
+    """
+
+    def __init__(self, capacity: int = REGISTRY_CAPACITY, ttl_s: float = REGISTRY_TTL_S):
+        self.capacity = capacity
+        self.ttl_s = ttl_s
+        self._relays = {}  # short_id -> Relay
+
+    def __len__(self) -> int:
+        return len(self._relays)
+
+    def __contains__(self, short_id: int) -> bool:
+        return short_id in self._relays
+
+    def __iter__(self):
+        return iter(self._relays)
+
+    def get(self, short_id: int) -> Relay | None:
+        return self._relays.get(short_id)
+
+    def device_id(self, short_id: int) -> str:
+        relay = self._relays.get(short_id)
+        return relay.device_id if relay is not None else format_short_id(short_id)
+
+    def names(self) -> dict:
+        """short_id -> device_id of every relay"""
+        return {short_id: relay.device_id for short_id, relay in self._relays.items()}
+
+    def seen(self, short_id: int, device_id: str, rssi: float, now: float) -> Relay:
+        """Record a packet from a relay, adding it if it is new"""
+        relay = self._relays.get(short_id)
+        if relay is None:
+            if len(self._relays) >= self.capacity:
+                self._evict()
+            relay = self._relays[short_id] = Relay(short_id, device_id)
+        elif device_id != format_short_id(short_id):
+            # Binary packets from relays never seen in text carry only the
+            # short id; keep the full id once it is known
+            relay.device_id = device_id
+        relay.rssi = rssi
+        relay.last_seen = now
+        return relay
+
+    def update_info(self, message: InfoResponse, rssi: float, now: float):
+        relay = self.seen(message.short_id, message.device_id, rssi, now)
+        relay.has_info = True
+        relay.high_power = message.high_power
+        relay.tx_power = message.tx_power
+        relay.temperature = message.temperature
+        relay.frequency_mhz = message.frequency_mhz
+        relay.bitrate = message.bitrate_kbps
+        relay.frequency_deviation = message.frequency_deviation
+
+    def find(self, text: str) -> Relay | None:
+        """Look a relay up by its device id or short id"""
+        text = text.upper()
+        for short_id, relay in self._relays.items():
+            if text in (relay.device_id.upper(), format_short_id(short_id)):
+                return relay
+        return None
+
+    def expire(self, now: float) -> int:
+        """Drop relays not heard from within the TTL, returning how many"""
+        stale = [
+            short_id
+            for short_id, relay in self._relays.items()
+            if now - relay.last_seen > self.ttl_s
+        ]
+        for short_id in stale:
+            del self._relays[short_id]
+        return len(stale)
+
+    def clear(self):
+        self._relays = {}
+
+    def _evict(self):
+        oldest = None
+        for short_id, relay in self._relays.items():
+            if oldest is None or relay.last_seen < self._relays[oldest].last_seen:
+                oldest = short_id
+        del self._relays[oldest]
+
+    def render(self, now: float):
+        print("\n" + "=" * 80)
+        print(f"RELAY REGISTRY ({len(self._relays)}/{self.capacity}, TTL {self.ttl_s:.0f}s)")
+        print("=" * 80)
+        if not self._relays:
+            print("No relays heard yet, request device info (q) or run a test")
+            print("=" * 80 + "\n")
+            return
+        print(
+            "| Device | Short ID | Last Seen | RSSI | TX Power | High Power | Temp | Bitrate | Freq Dev |"
+        )
+        print(
+            "|--------|----------|-----------|------|----------|------------|------|---------|----------|"
+        )
+        relays = sorted(self._relays.values(), key=lambda relay: relay.last_seen)
+        for relay in reversed(relays):
+            if relay.has_info:
+                info = (
+                    f"{relay.tx_power:>6}db | {str(relay.high_power):>10} "
+                    f"| {relay.temperature:>3.0f}C | {relay.bitrate / 1000:>5.1f}k "
+                    f"| {relay.frequency_deviation:>6.0f}hz"
+                )
+            else:
+                info = f"{'-':>8} | {'-':>10} | {'-':>4} | {'-':>7} | {'-':>8}"
+            print(
+                f"| {relay.device_id:<6} | {format_short_id(relay.short_id)} "
+                f"| {now - relay.last_seen:>8.0f}s | {relay.rssi:>4.0f} | {info} |"
+            )
+        print("=" * 80 + "\n")
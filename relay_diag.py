@@ -0,0 +1,88 @@
+import time
+import adafruit_rfm69
+from diag_packets import (
+    BlastRequest,
+    BlastSummary,
+    PingRequest,
+    PingResponse,
+    StatsRequest,
+    StatsResponse,
+)
+from perf import profiler
+from rfm_util import attempt_send
+
+# Pause before echoing a ping so the controller's radio is back in receive mode
+# after its transmission
+PING_GUARD_S = 0.003
+
+
+def answer_ping(
+    rfm69: adafruit_rfm69.RFM69, device_id: str, message: PingRequest, received_at_ns: int
+):
+    """Echo a ping straight away, reporting how long that took"""
+    time.sleep(PING_GUARD_S)
+    turnaround_us = (time.monotonic_ns() - received_at_ns) // 1000
+    response = PingResponse.encode(
+        device_id,
+        message.sequence,
+        message.timestamp_us,
+        turnaround_us,
+        message.wire_format,
+    )
+    attempt_send(rfm69, response)
+
+
+def answer_blast(rfm69: adafruit_rfm69.RFM69, device_id: str, request: BlastRequest):
+    """Run a throughput blast, then tell the controller how much was sent"""
+    from blast import send_blast
+    profiler.instrument("blast")
+
+    sent, elapsed = send_blast(rfm69, device_id, request)
+    time.sleep(PING_GUARD_S)
+    attempt_send(
+        rfm69,
+        BlastSummary.encode(device_id, sent, int(elapsed * 1000), request.wire_format),
+    )
+
+
+def answer_stats(send, device_id: str, message: StatsRequest, router, flood_hops: int):
+    """Apply a profiling action, or send every counter back with `send`.
+    `router` is the relay's FloodRouter, None before its first flood."""
+    if message.action == StatsRequest.ACTION_ENABLE:
+        profiler.enable()
+    elif message.action == StatsRequest.ACTION_DISABLE:
+        profiler.disable()
+    elif message.action == StatsRequest.ACTION_RESET:
+        profiler.reset()
+        if router is not None:
+            router.reset()
+    else:
+        counters = profiler.snapshot()
+        if router is not None:
+            flood_counters = router.snapshot()
+            if any(counter.calls for counter in flood_counters):
+                counters += flood_counters
+        gap_s = PING_GUARD_S
+        if flood_hops:
+            from flood import FORWARD_JITTER_MS
+
+            # Floods need room for forwarders to pass each counter on
+            gap_s += FORWARD_JITTER_MS / 1000.0
+        for index, counter in enumerate(counters):
+            time.sleep(gap_s)
+            if counter.name == "heap":
+                total, maximum = counter.total_ns, counter.max_ns  # bytes
+            else:
+                total, maximum = counter.total_ns // 1_000_000, counter.max_ns // 1000
+            send(
+                StatsResponse.encode(
+                    device_id,
+                    index,
+                    len(counters),
+                    counter.calls,
+                    total,
+                    maximum,
+                    counter.name,
+                    message.wire_format,
+                ),
+            )
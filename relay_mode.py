@@ -3,16 +3,51 @@ import time
 import adafruit_rfm69
 from input import MODE_CONTROLLER, check_serial_input
 from packets import (
+    DEFAULT_WIRE_FORMAT,
+    IDLE_WAIT_S,
+    MAX_DRAIN_PACKETS,
+    AbortTestRequest,
+    Flood,
     InfoResponse,
     InfoRequest,
     RunTestRequest,
+    SlotAssignment,
+    TestAck,
     TestParameters,
     RunTestResponse,
-    check_for_message,
+    poll_message,
+    short_device_id,
+    slot_index,
+    wait_for_packet,
 )
+from console import console
+from perf import profiler
 from rfm_util import attempt_send
+from relay_test import SLOT_OFFSET_FRACTION, DownlinkRun, TestRun
 from rgb_indicator import indicate_processing, indicate_ready
 
+# Heartbeats vary their interval by up to this fraction either way, so relays
+# that started together drift apart instead of colliding every time
+HEARTBEAT_JITTER = 0.1
+
+# Packets other relays send to the controller, which a relay only forwards
+RELAY_RESPONSES = (RunTestResponse, InfoResponse, TestAck)
+
+# Packets decoded by packets.py. Everything else is a ping, blast, profiling,
+# downlink or monitoring packet, whose decoders (diag_packets) and handlers
+# (blast, flood) are only imported once the first one arrives.
+CORE_PACKETS = (
+    Flood,
+    RunTestResponse,
+    InfoResponse,
+    TestAck,
+    TestParameters,
+    RunTestRequest,
+    SlotAssignment,
+    AbortTestRequest,
+    InfoRequest,
+)
+
 
 class RelayMode:
     """Class to handle relay mode operations"""
@@ -20,73 +55,455 @@ class RelayMode:
     def __init__(self, rfm69: adafruit_rfm69.RFM69, device_id: str):
         self._rfm69 = rfm69
         self._device_id = device_id
+        self._short_id = short_device_id(device_id)
+        self._wire_format = DEFAULT_WIRE_FORMAT  # Answer in the controller's format
+        self._slot_plan: int | None = None  # Plan of the assigned slot index
+        self._slot_index = 0
+        self._test: TestRun | DownlinkRun | None = None
+        self._test_id = 0  # Of the last test started, to ignore its retransmissions
+        # Hops allowed when answering, set by each request: 0 when it came
+        # straight from the controller, the flood's limit when forwarded
+        self._flood_hops = 0
+        self._router = None  # FloodRouter, from the first flood received
+        self._ack_at: float | None = None
+        self._info_reply_at: float | None = None
+        # Monitoring: a heartbeat every interval while no test runs
+        self._heartbeat_interval_s = 0
+        self._heartbeat_at: float | None = None
+        self._heartbeat_sequence = 0
+        # Radio settings to return to after a test that changed them
+        self._default_bitrate = rfm69.bitrate
+        self._default_frequency_deviation = rfm69.frequency_deviation
+        self._default_frequency = rfm69.frequency_mhz
+
+    def _plan_index(self, params: TestParameters, num_slots: int) -> int:
+        """This relay's slot: its assigned index, or hashed into the spares"""
+        if self._slot_plan == params.slot_plan:
+            return self._slot_index
+        return slot_index(self._short_id, num_slots, params.num_assigned)
+
+    def _on_test_request(
+        self, message: RunTestRequest, rssi: float, received_at: float, flood_hops: int
+    ):
+        """Start a test, or acknowledge a retransmission of the current one"""
+        if message.test_id:
+            if not message.is_pending(self._short_id):
+                return  # Retransmitted for other relays
+            if message.test_id == self._test_id:
+                # Already started: the controller missed the acknowledgement
+                self._schedule_ack(message, received_at)
+                return
+
+        console.info("[RELAY] Received test command | RSSI: {}db", rssi)
+        self._wire_format = message.wire_format
+        self._flood_hops = flood_hops
+        self._test_id = message.test_id
+        self._start_test(message, received_at + message.start_in_ms / 1000.0)
+        self._schedule_ack(message, received_at)
+
+    def _schedule_ack(self, message: RunTestRequest, received_at: float):
+        """Acknowledge in this relay's slot of the window after the request.
+        Once the test is under way there is no window; the test packets
+        confirm the start instead."""
+        if not message.ack_slots or message.start_in_ms <= 0:
+            return
+        index = self._plan_index(message, message.ack_slots)
+        self._ack_at = (
+            received_at + (index + SLOT_OFFSET_FRACTION) * message.ack_slot_ms / 1000.0
+        )
+
+    def _service_ack(self, now: float):
+        if self._ack_at is None or now < self._ack_at:
+            return
+        self._ack_at = None
+        self._send(TestAck.encode(self._device_id, self._test_id, self._wire_format))
+        console.info("[RELAY] Acknowledged test {}", self._test_id)
 
-    def _run_test(self, params: TestParameters):
-        """Execute a test with the given parameters"""
-        print(f"\n[TEST] Starting test with parameters:")
-        print(f"  Packets: {params.num_packets}")
-        print(f"  Delay: {params.delay_ms}ms")
-        print(f"  Stagger: {params.stagger_ms}ms")
-        print(f"  High Power: {params.high_power}")
-        print(f"  TX Power: {params.tx_power}db")
+    def _start_test(self, params: TestParameters, start: float):
+        """Start (or restart) a test with the given parameters"""
+        if self._test is not None:
+            console.info("[TEST] Restarting: new test command received")
 
-        # Configure radio
+        console.info("\n[TEST] Starting test with parameters:")
+        console.info("  Packets: {}", params.num_packets)
+        console.info("  Delay: {}ms", params.delay_ms)
+        console.info("  Stagger: {}ms", params.stagger_ms)
+        console.info("  High Power: {}", params.high_power)
+        console.info("  TX Power: {}db", params.tx_power)
+        if params.radio_changed:
+            console.info("  Bitrate: {}bps", params.bitrate)
+            console.info("  Frequency Deviation: {}hz", params.frequency_deviation)
+
+        if params.downlink:
+            slot = self._plan_index(params, max(params.ack_slots, 1))
+            console.info("  Downlink: summary in slot {} of {}ms", slot, params.ack_slot_ms)
+            self._configure_radio(params)
+            self._test = DownlinkRun(params, self._wire_format, start, slot)
+            return
+
+        slot = 0
+        group = 0
+        frequency_mhz = 0.0
+        if params.multi_channel:
+            index = self._plan_index(params, max(params.num_slots, params.channels))
+            group = index % params.channels
+            slot = index // params.channels
+            frequency_mhz = params.channel_mhz(self._default_frequency, group)
+            console.info(
+                "  Channel: {}/{} at {:.3f}mhz, dwell {}ms",
+                group,
+                params.channels,
+                frequency_mhz,
+                params.dwell_ms,
+            )
+        if params.slotted:
+            if not params.multi_channel:
+                slot = self._plan_index(params, params.num_slots)
+            console.info("  Slot: {}/{} of {}ms", slot, params.num_slots, params.slot_ms)
+
+        self._configure_radio(params)
+        self._test = TestRun(
+            params, self._wire_format, start, slot, time.monotonic(), group, frequency_mhz
+        )
+        if self._test.next_packet:
+            console.info("  Joined late: skipping {} packets", self._test.next_packet)
+        if self._test.done:
+            self._end_test()
+            console.info("[TEST] Complete: joined after the last packet")
+
+    def _configure_radio(self, params: TestParameters):
         self._rfm69.high_power = params.high_power
         self._rfm69.tx_power = params.tx_power
+        self._restore_radio()
+        if params.bitrate:
+            self._rfm69.bitrate = params.bitrate
+        if params.frequency_deviation:
+            self._rfm69.frequency_deviation = params.frequency_deviation
+
+    def _end_test(self):
+        """Drop the running test and return to the default radio settings"""
+        self._test = None
+        self._restore_radio()
+
+    def _restore_radio(self):
+        if self._rfm69.bitrate != self._default_bitrate:
+            self._rfm69.bitrate = self._default_bitrate
+        if self._rfm69.frequency_deviation != self._default_frequency_deviation:
+            self._rfm69.frequency_deviation = self._default_frequency_deviation
+        if self._rfm69.frequency_mhz != self._default_frequency:
+            self._tune(self._default_frequency)
+
+    def _tune(self, frequency_mhz: float):
+        """Change channel in standby, then receive on the new one"""
+        self._rfm69.idle()
+        self._rfm69.frequency_mhz = frequency_mhz
+        self._rfm69.listen()
+
+    def _service_test(self, now: float):
+        """Send the next test packet if it is due"""
+        test = self._test
+        if test is None or now < test.next_send_at:
+            return
+        if isinstance(test, DownlinkRun):
+            self._send_summary(test)
+            return
+
+        if test.frequency_mhz:
+            # Until now the relay stayed on the default channel for
+            # retransmissions of the request
+            self._tune(test.frequency_mhz)
+            test.frequency_mhz = 0.0
+        response = RunTestResponse.encode(
+            self._device_id, test.next_packet, test.wire_format, test.params.test_id
+        )
+        self._send(response)
+        console.debug("[TEST] Sent packet {}/{}", test.next_packet + 1, test.params.num_packets)
+
+        test.advance()
+        if test.done:
+            self._end_test()
+            console.info("\n[TEST] Complete:")
+            if self._flood_hops:
+                console.info("  Flood: {}", self._router.describe())
+            indicate_ready()
+
+    def _send_summary(self, test: DownlinkRun):
+        """Report a downlink test in one packet and end it"""
+        from diag_packets import DownlinkSummary
+
+        stats = test.stats
+        self._send(
+            DownlinkSummary.encode(
+                self._device_id,
+                test.params.test_id,
+                stats.expected,
+                stats.count,
+                stats.rssi_min,
+                stats.rssi_max,
+                stats.rssi_avg,
+                stats.bitmap,
+                test.wire_format,
+            )
+        )
+        self._end_test()
+        console.info(
+            "\n[TEST] Downlink complete: received {}/{}, RSSI {:.1f}/{:.1f}/{:.1f}db",
+            stats.count,
+            stats.expected,
+            stats.rssi_min,
+            stats.rssi_avg,
+            stats.rssi_max,
+        )
+        indicate_ready()
 
-        delay_sec = params.delay_ms / 1000.0
+    def _service_info_reply(self, now: float):
+        """Send a pending device info reply once its random delay is over"""
+        if self._info_reply_at is None or now < self._info_reply_at:
+            return
 
-        for i in range(params.num_packets):
-            # Send test packet
-            response = RunTestResponse.encode(self._device_id, i)
-            attempt_send(self._rfm69, response)
-            print(f"[TEST] Sent packet {i+1}/{params.num_packets}")
+        self._info_reply_at = None
+        response = InfoResponse.encode(
+            device_id=self._device_id,
+            high_power=self._rfm69.high_power,
+            tx_power=self._rfm69.tx_power,
+            temperature=self._rfm69.temperature,
+            frequency_mhz=self._rfm69.frequency_mhz,
+            bitrate_kbps=self._rfm69.bitrate,
+            frequency_deviation_hz=self._rfm69.frequency_deviation,
+            wire_format=self._wire_format,
+        )
+        self._send(response)
+        console.info("[RELAY] Device info sent to controller")
 
-            time.sleep(delay_sec)
-            stagger_ms = random.randint(0, params.stagger_ms)
-            time.sleep(stagger_ms / 1000.0)
+    def _on_monitor_request(self, message: "MonitorRequest", flood_hops: int):
+        """Start, change or stop the heartbeats"""
+        self._wire_format = message.wire_format
+        self._flood_hops = flood_hops
+        if message.interval_s == self._heartbeat_interval_s:
+            return  # A refresh for relays that joined later
+        self._heartbeat_interval_s = message.interval_s
+        if not message.interval_s:
+            self._heartbeat_at = None
+            console.info("[RELAY] Monitoring stopped")
+            return
+        # The first one at a random point of the interval spreads the fleet out
+        self._heartbeat_at = time.monotonic() + random.uniform(0, message.interval_s)
+        console.info("[RELAY] Heartbeat every {}s", message.interval_s)
 
-        print(f"\n[TEST] Complete:")
+    def _service_heartbeat(self, now: float):
+        if self._heartbeat_at is None or now < self._heartbeat_at:
+            return
+        interval_s = self._heartbeat_interval_s
+        jitter = random.uniform(-HEARTBEAT_JITTER, HEARTBEAT_JITTER)
+        self._heartbeat_at = now + interval_s * (1 + jitter)
+        if self._test is not None:
+            return  # Skipped without a sequence number, so it is not lost
+        from diag_packets import Heartbeat
+
+        self._send(Heartbeat.encode(self._device_id, self._heartbeat_sequence, self._wire_format))
+        self._heartbeat_sequence = (self._heartbeat_sequence + 1) & 0xFFFF
+
+    def _send(self, packet: bytes):
+        """Answer the controller the way the last request reached this relay"""
+        if self._flood_hops:
+            self._router.send(packet, self._flood_hops, self._wire_format)
+        else:
+            attempt_send(self._rfm69, packet)
+
+    def _on_flood(self, message: Flood, rssi: float, received_at: float):
+        """Queue a flood for forwarding and handle what it carries, once"""
+        if self._router is None:
+            from flood import FloodRouter
+            profiler.instrument("flood")
+
+            self._router = FloodRouter(self._rfm69, self._short_id)
+        if not self._router.receive(message, rssi, received_at):
+            return
+        max_hops = message.max_hops
+        # Time it spent in forwarders, so schedules line up with relays that
+        # heard the controller directly
+        delay_s = message.delay_ms / 1000.0
+        inner = message.inner()
+        if inner is None or isinstance(inner, RELAY_RESPONSES):
+            return
+        if isinstance(inner, CORE_PACKETS):
+            self._handle_message(inner, rssi, received_at - delay_s, max_hops)
+        else:
+            self._on_diagnostic(inner, rssi, received_at - delay_s, max_hops, delay_s)
+
+    def _idle_limit(self, now: float) -> float:
+        """Sleep no longer than until the next scheduled transmission"""
+        limit = IDLE_WAIT_S
+        if self._test is not None:
+            limit = min(limit, self._test.next_send_at - now)
+        if self._info_reply_at is not None:
+            limit = min(limit, self._info_reply_at - now)
+        if self._ack_at is not None:
+            limit = min(limit, self._ack_at - now)
+        if self._heartbeat_at is not None:
+            limit = min(limit, self._heartbeat_at - now)
+        if self._router is not None:
+            forward_at = self._router.next_due()
+            if forward_at is not None:
+                limit = min(limit, forward_at - now)
+        return max(limit, 0.0)
+
+    def _on_diagnostic(
+        self,
+        message,
+        rssi: float,
+        received_at: float,
+        flood_hops: int = 0,
+        delay_s: float = 0.0,
+    ):
+        """Handle a ping, blast, profiling, downlink or monitoring packet.
+        decode_packet imported diag_packets to decode it, so importing from it
+        and relay_diag here only looks the modules up after the first one."""
+        from diag_packets import (
+            BlastRequest,
+            DownlinkData,
+            MonitorRequest,
+            PingRequest,
+            StatsRequest,
+        )
+        from relay_diag import answer_blast, answer_ping, answer_stats
+        profiler.instrument("relay_diag")
+
+        # Only a ping turnaround needs the nanosecond clock
+        received_at_ns = 0
+        if isinstance(message, PingRequest):
+            received_at_ns = time.monotonic_ns() - int(delay_s * 1e9)
+        indicate_processing()
+
+        if isinstance(message, DownlinkData):
+            test = self._test
+            if isinstance(test, DownlinkRun) and message.test_id == test.params.test_id:
+                test.stats.add(rssi, message.packet_num)
+
+        elif isinstance(message, PingRequest):
+            if message.target == self._short_id:
+                answer_ping(self._rfm69, self._device_id, message, received_at_ns)
+
+        elif isinstance(message, BlastRequest):
+            if message.target == self._short_id:
+                if self._test is not None:
+                    console.info("[TEST] Aborted: blast requested")
+                    self._end_test()
+                answer_blast(self._rfm69, self._device_id, message)
+
+        elif isinstance(message, StatsRequest):
+            if message.target == self._short_id:
+                self._flood_hops = flood_hops
+                answer_stats(self._send, self._device_id, message, self._router, flood_hops)
+                console.info("[RELAY] Profiling {}", "on" if profiler.enabled else "off")
+
+        elif isinstance(message, MonitorRequest):
+            self._on_monitor_request(message, flood_hops)
+
+        # Anything else is another relay answering the controller
+
+        if self._test is None:
+            indicate_ready()
+
+    def _handle_message(
+        self, message, rssi: float, received_at: float, flood_hops: int = 0
+    ):
+        if not isinstance(message, CORE_PACKETS):
+            self._on_diagnostic(message, rssi, received_at, flood_hops)
+            return
+
+        indicate_processing()
+
+        # Check if this is a command
+        if isinstance(message, Flood):
+            self._on_flood(message, rssi, received_at)
+
+        elif isinstance(message, RELAY_RESPONSES):
+            pass  # Another relay answering the controller
+
+        elif isinstance(message, RunTestRequest):
+            self._on_test_request(message, rssi, received_at, flood_hops)
+
+        elif isinstance(message, SlotAssignment):
+            index = message.index_of(self._short_id)
+            if index is not None:
+                self._slot_plan = message.slot_plan
+                self._slot_index = index
+                console.info(
+                    "[RELAY] Assigned slot {} in plan {} | RSSI: {}db",
+                    index,
+                    message.slot_plan,
+                    rssi,
+                )
+
+        elif isinstance(message, AbortTestRequest):
+            console.info("[RELAY] Received abort command | RSSI: {}db", rssi)
+            self._wire_format = message.wire_format
+            self._flood_hops = flood_hops
+            if self._test is not None:
+                console.info("[TEST] Aborted by controller")
+                self._end_test()
+
+        elif isinstance(message, InfoRequest):
+            console.info("[RELAY] Received info request | RSSI: {}db", rssi)
+            self._wire_format = message.wire_format
+            self._flood_hops = flood_hops
+            # Random delay to avoid collisions
+            self._info_reply_at = time.monotonic() + random.randint(50, 200) / 1000.0
+        else:
+            # Decoded messages are reused, so describe it now
+            console.warning(
+                "[RELAY] Unknown command type: {} | RSSI: {}db", str(message), rssi
+            )
+
+        if self._test is None:
+            indicate_ready()
 
     def run(self):
         """Relay mode - listen for commands from controller"""
         print("[RELAY MODE] Listening for commands...")
         indicate_ready()
+        self._rfm69.listen()
 
         while True:
+            if profiler.enabled:
+                profiler.tick()
+
             # Check for mode switch request
             key = check_serial_input()
             if key:
+                if self._test is not None:
+                    console.info("[TEST] Aborted: switching to controller mode")
+                console.flush_all()
+                self._end_test()
+                self._info_reply_at = None
+                self._ack_at = None
+                self._heartbeat_interval_s = 0
+                self._heartbeat_at = None
+                if self._router is not None:
+                    self._router.clear()
                 return MODE_CONTROLLER
 
-            # Listen for packets from controller
-            message, rssi = check_for_message(self._rfm69)
-            if message is not None:
-                indicate_processing()
-
-                # Check if this is a command
-                if isinstance(message, RunTestRequest):
-                    print(f"[RELAY] Received test command | RSSI: {rssi}db")
-                    self._run_test(message)
-
-                elif isinstance(message, InfoRequest):
-                    print(f"[RELAY] Received info request | RSSI: {rssi}db")
-                    response = InfoResponse.encode(
-                        device_id=self._device_id,
-                        high_power=self._rfm69.high_power,
-                        tx_power=self._rfm69.tx_power,
-                        temperature=self._rfm69.temperature,
-                        frequency_mhz=self._rfm69.frequency_mhz,
-                        bitrate_kbps=self._rfm69.bitrate,
-                        frequency_deviation_hz=self._rfm69.frequency_deviation,
-                    )
-
-                    time.sleep(
-                        random.randint(50, 200) / 1000.0
-                    )  # Random delay to avoid collisions
-                    attempt_send(self._rfm69, response)
-                    print("[RELAY] Device info sent to controller")
-                else:
-                    print(f"[RELAY] Unknown command type: {message} | RSSI: {rssi}db")
-
-                indicate_ready()
+            now = time.monotonic()
+            self._service_ack(now)
+            self._service_test(now)
+            self._service_info_reply(now)
+            self._service_heartbeat(now)
+            if self._router is not None:
+                self._router.service(now)
+
+            # Read every packet that is already waiting, then sleep briefly
+            # if there was nothing to do
+            received = 0
+            while received < MAX_DRAIN_PACKETS:
+                message, rssi = poll_message(self._rfm69)
+                if message is None:
+                    break
+                received += 1
+                self._handle_message(message, rssi, time.monotonic())
+
+            if not received:
+                # Print held status lines only while no transmission is due
+                if console.pending and self._idle_limit(time.monotonic()) > 0:
+                    console.flush()
+                wait_for_packet(self._rfm69, self._idle_limit(time.monotonic()))
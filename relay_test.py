@@ -0,0 +1,82 @@
+import math
+import random
+from packets import TestParameters
+from stats import LinkStats
+
+# Where in its slot a relay transmits, leaving room for clock offsets
+SLOT_OFFSET_FRACTION = 0.25
+
+
+class TestRun:
+    """A test in flight, advanced by the relay loop instead of blocking it.
+
+    Packet i is due at start + i * period plus either a random stagger or,
+    in slotted mode, the offset of this relay's slot. With channel groups
+    the offset is counted from the start of the group's dwell, and the
+    relay moves to the group's channel before its first packet. The start is derived
+    from when the test command was received, which stands in for the
+    controller's send time. A relay that only got a retransmission after the
+    start skips the packets that are already overdue.
+    """
+
+    def __init__(
+        self,
+        params: TestParameters,
+        wire_format: str,
+        start: float,
+        slot: int,
+        now: float,
+        group: int = 0,
+        frequency_mhz: float = 0.0,
+    ):
+        self.params = params.copy()
+        self.wire_format = wire_format
+        self.start = start
+        self.slot = slot
+        self.group = group
+        self.frequency_mhz = frequency_mhz  # 0 stays on the current channel
+        self.next_packet = 0
+        # With no period (delay 0, no slots) every packet is due at the start,
+        # so a late relay still sends them all
+        if now > start and params.period_ms:
+            self.next_packet = math.ceil((now - start) * 1000 / params.period_ms)
+        self.next_send_at = self._deadline(self.next_packet)
+
+    def _deadline(self, packet_num: int) -> float:
+        params = self.params
+        offset_ms = 0
+        if params.multi_channel:
+            offset_ms = self.group * params.dwell_ms
+        if params.slotted:
+            offset_ms += (self.slot + SLOT_OFFSET_FRACTION) * params.slot_ms
+        elif params.multi_channel:
+            # Away from the dwell's edges, where the controller is retuning
+            offset_ms += random.randint(params.dwell_ms // 4, params.dwell_ms * 3 // 4)
+        else:
+            offset_ms = random.randint(0, params.stagger_ms)
+        return self.start + (packet_num * params.period_ms + offset_ms) / 1000.0
+
+    @property
+    def done(self) -> bool:
+        return self.next_packet >= self.params.num_packets
+
+    def advance(self):
+        """Move on to the next packet once the current one was sent"""
+        self.next_packet += 1
+        self.next_send_at = self._deadline(self.next_packet)
+
+
+class DownlinkRun:
+    """A downlink test in flight: the controller sends, this relay listens.
+
+    Received packets go into a LinkStats, and the summary of it is due in
+    this relay's slot of the window after the controller's last packet.
+    """
+
+    def __init__(self, params: TestParameters, wire_format: str, start: float, slot: int):
+        self.params = params.copy()
+        self.wire_format = wire_format
+        self.stats = LinkStats(params.num_packets)
+        self.next_send_at = start + (
+            params.report_at_ms + (slot + SLOT_OFFSET_FRACTION) * params.ack_slot_ms
+        ) / 1000.0
@@ -1,12 +1,21 @@
 import board
 import busio
 import digitalio
+import microcontroller
 import adafruit_rfm69
 
 # Setup RFM69 radio module
 RADIO_FREQ_MHZ = 915.0  # Frequency of the radio in Mhz. Must match your RFM module!
 spi = busio.SPI(board.SCK, MOSI=board.MOSI, MISO=board.MISO)
 
+RADIO_ONBOARD = 1
+RADIO_EXTERNAL = 2
+
+# The radio found at the last boot is kept in the first bytes of NVM (within
+# runlog.NVM_RESERVED) as a marker and the variant, so it is tried first
+NVM_RADIO_OFFSET = 0
+_RADIO_MARKER = 0xA5
+
 
 def init_onboard_rfm69() -> adafruit_rfm69.RFM69 | None:
     """Initialize embedded RFM69 module"""
@@ -45,13 +54,36 @@ def init_external_rfm69() -> adafruit_rfm69.RFM69 | None:
         return None
 
 
+def _cached_radio() -> int:
+    nvm = microcontroller.nvm
+    if nvm is None or nvm[NVM_RADIO_OFFSET] != _RADIO_MARKER:
+        return 0
+    return nvm[NVM_RADIO_OFFSET + 1]
+
+
+def _cache_radio(variant: int):
+    nvm = microcontroller.nvm
+    if nvm is None or _cached_radio() == variant:
+        return  # Skip the flash write when nothing changed
+    nvm[NVM_RADIO_OFFSET : NVM_RADIO_OFFSET + 2] = bytes((_RADIO_MARKER, variant))
+
+
 def init_rfm69() -> adafruit_rfm69.RFM69 | None:
-    """Initialize RFM69 module, trying onboard first then external."""
-    rfm69 = init_onboard_rfm69()
-    if rfm69 is not None:
-        return rfm69
+    """Initialize RFM69 module, trying the one found last boot first.
+
+    Without a cached variant the onboard module is tried before the external
+    one. The variant that answered is cached for the next boot.
+    """
+    probes = ((RADIO_ONBOARD, init_onboard_rfm69), (RADIO_EXTERNAL, init_external_rfm69))
+    if _cached_radio() == RADIO_EXTERNAL:
+        probes = tuple(reversed(probes))
 
-    return init_external_rfm69()
+    for variant, init in probes:
+        rfm69 = init()
+        if rfm69 is not None:
+            _cache_radio(variant)
+            return rfm69
+    return None
 
 
 def attempt_send(rfm69: adafruit_rfm69.RFM69, data: bytes):
@@ -0,0 +1,274 @@
+import struct
+import microcontroller
+import supervisor
+from packets import TestParameters, format_short_id
+
+# Log file on the CIRCUITPY drive, used when the drive is writable from code
+LOG_FILE = "runlog.bin"
+LOG_FILE_RECORDS = 4096
+
+# Otherwise the log lives in NVM after the bytes kept for settings
+NVM_RESERVED = 64
+
+RECORD_SIZE = 16
+# magic, version, record size, last run id, capacity, head
+_HEADER = "<4sBBHII"
+_MAGIC = b"RLOG"
+_VERSION = 1
+
+RECORD_RUN = 1
+RECORD_PACKET = 2
+# type, flags, run id, num_packets, delay_ms, bitrate / 100, tx_power, time
+_RUN = "<BBHHHHbxI"
+# type, run id, short device id, sequence, rssi in half db, time
+_PACKET = "<BxHIHhI"
+
+# Records buffered in RAM before a block is written
+BLOCK_RECORDS = 32
+# Records written per service() call, keeping each call short
+CHUNK_RECORDS = 8
+
+# Zero bytes written at a time when a new log file is sized
+PAD_CHUNK = 512
+
+
+class _FileStore:
+    chunk_records = CHUNK_RECORDS
+
+    def __init__(self, file):
+        self._file = file
+
+    def read(self, offset: int, length: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def write(self, offset: int, data):
+        self._file.seek(offset)
+        self._file.write(data)
+
+    def sync(self):
+        self._file.flush()
+
+
+class _NvmStore:
+    # Every NVM write reprograms a whole flash sector, so write blocks at once
+    chunk_records = BLOCK_RECORDS
+
+    def __init__(self, start: int):
+        self._start = start
+
+    def read(self, offset: int, length: int) -> bytes:
+        start = self._start + offset
+        return bytes(microcontroller.nvm[start : start + length])
+
+    def write(self, offset: int, data):
+        start = self._start + offset
+        microcontroller.nvm[start : start + len(data)] = data
+
+    def sync(self):
+        pass
+
+
+class RunLog:
+    """Append-only ring of fixed-size test records on flash.
+
+    Records collect in a RAM block. A full block is handed over and written
+    a few records at a time by service(), which the controller calls when
+    the radio is idle, so flash writes do not delay packet reception. The
+    header with the write position is updated once per block, after the
+    block's records are in place.
+    """
+
+    def __init__(self):
+        self._store = None
+        self.location = "none"
+        self.capacity = 0
+        self.head = 0  # Records ever written, the ring slot is head % capacity
+        self.run_id = 0
+        self._active = bytearray(BLOCK_RECORDS * RECORD_SIZE)
+        self._active_count = 0
+        self._pending = bytearray(BLOCK_RECORDS * RECORD_SIZE)
+        self._pending_count = 0
+        self._pending_written = 0
+
+    def open(self):
+        """Use the log file if the drive is writable, otherwise NVM"""
+        size = struct.calcsize(_HEADER) + LOG_FILE_RECORDS * RECORD_SIZE
+        try:
+            try:
+                file = open(LOG_FILE, "r+b")
+            except OSError:
+                file = open(LOG_FILE, "w+b")
+            file.seek(0, 2)
+            if file.tell() < size:
+                # In small pieces, one 64 KB buffer may not fit in RAM
+                padding = bytes(PAD_CHUNK)
+                while file.tell() < size:
+                    file.write(memoryview(padding)[: min(PAD_CHUNK, size - file.tell())])
+                file.flush()
+            self._store = _FileStore(file)
+            self.capacity = LOG_FILE_RECORDS
+            self.location = LOG_FILE
+        except OSError:
+            nvm_size = len(microcontroller.nvm) - NVM_RESERVED
+            self._store = _NvmStore(NVM_RESERVED)
+            self.capacity = (nvm_size - struct.calcsize(_HEADER)) // RECORD_SIZE
+            self.location = "nvm"
+
+        magic, version, record_size, run_id, capacity, head = struct.unpack(
+            _HEADER, self._store.read(0, struct.calcsize(_HEADER))
+        )
+        if (
+            magic == _MAGIC
+            and version == _VERSION
+            and record_size == RECORD_SIZE
+            and capacity == self.capacity
+        ):
+            self.run_id = run_id
+            self.head = head
+        else:
+            self.clear()
+
+    @property
+    def enabled(self) -> bool:
+        return self._store is not None
+
+    def clear(self):
+        self._active_count = self._pending_count = self._pending_written = 0
+        self.head = 0
+        self.run_id = 0
+        self._write_header()
+
+    def _write_header(self):
+        self._store.write(
+            0,
+            struct.pack(
+                _HEADER,
+                _MAGIC,
+                _VERSION,
+                RECORD_SIZE,
+                self.run_id,
+                self.capacity,
+                self.head,
+            ),
+        )
+        self._store.sync()
+
+    def _next_record(self) -> int:
+        """Offset in the RAM block for one more record"""
+        if self._active_count >= BLOCK_RECORDS:
+            # The loop never went idle: finish the previous block now
+            while self._pending_count:
+                self.service()
+            self._hand_over()
+        offset = self._active_count * RECORD_SIZE
+        self._active_count += 1
+        return offset
+
+    def start_run(self, params: TestParameters):
+        self.run_id = (self.run_id + 1) & 0xFFFF
+        if not self.enabled:
+            return
+        struct.pack_into(
+            _RUN,
+            self._active,
+            self._next_record(),
+            RECORD_RUN,
+            int(params.high_power) | (int(params.slotted) << 1),
+            self.run_id,
+            params.num_packets,
+            params.delay_ms,
+            params.bitrate // 100,
+            params.tx_power,
+            supervisor.ticks_ms(),
+        )
+
+    def add_packet(self, short_id: int, sequence: int, rssi: float):
+        if not self.enabled:
+            return
+        struct.pack_into(
+            _PACKET,
+            self._active,
+            self._next_record(),
+            RECORD_PACKET,
+            self.run_id,
+            short_id,
+            sequence & 0xFFFF,
+            round(rssi * 2),
+            supervisor.ticks_ms(),
+        )
+        if self._active_count >= BLOCK_RECORDS and not self._pending_count:
+            self._hand_over()
+
+    def _hand_over(self):
+        """Queue the RAM block for writing and start a new one"""
+        self._active, self._pending = self._pending, self._active
+        self._pending_count = self._active_count
+        self._pending_written = 0
+        self._active_count = 0
+
+    def flush_soon(self):
+        """Queue a partly filled block, e.g. when a test ends"""
+        if self._active_count and not self._pending_count:
+            self._hand_over()
+
+    def service(self):
+        """Write the next few records of a queued block"""
+        if not self._pending_count:
+            return
+        header_size = struct.calcsize(_HEADER)
+        start = self._pending_written
+        count = min(self._store.chunk_records, self._pending_count - start)
+        slot = (self.head + start) % self.capacity
+        # Stop at the end of the ring, the rest goes to the start next time
+        count = min(count, self.capacity - slot)
+        self._store.write(
+            header_size + slot * RECORD_SIZE,
+            memoryview(self._pending)[start * RECORD_SIZE : (start + count) * RECORD_SIZE],
+        )
+        self._pending_written += count
+        if self._pending_written >= self._pending_count:
+            self.head += self._pending_count
+            self._pending_count = self._pending_written = 0
+            self._write_header()
+
+    def flush(self):
+        """Write everything buffered, blocking"""
+        while self._pending_count:
+            self.service()
+        self.flush_soon()
+        while self._pending_count:
+            self.service()
+
+    def dump(self, names: dict):
+        """Print the log oldest first as CSV; names maps short ids to device ids"""
+        self.flush()
+        header_size = struct.calcsize(_HEADER)
+        first = max(0, self.head - self.capacity)
+        print(f"# {self.head - first} records in {self.location}, last run {self.run_id}")
+        print("# run,<run>,<time_ms>,<num_packets>,<delay_ms>,<tx_power>,<high_power>,<slotted>,<bitrate>")
+        print("# pkt,<run>,<time_ms>,<device>,<sequence>,<rssi>")
+        for index in range(first, self.head):
+            slot = index % self.capacity
+            record = self._store.read(header_size + slot * RECORD_SIZE, RECORD_SIZE)
+            if record[0] == RECORD_RUN:
+                (
+                    _,
+                    flags,
+                    run_id,
+                    num_packets,
+                    delay_ms,
+                    bitrate,
+                    tx_power,
+                    time_ms,
+                ) = struct.unpack(_RUN, record)
+                print(
+                    f"run,{run_id},{time_ms},{num_packets},{delay_ms},{tx_power},"
+                    f"{flags & 1},{(flags >> 1) & 1},{bitrate * 100}"
+                )
+            elif record[0] == RECORD_PACKET:
+                _, run_id, short_id, sequence, rssi, time_ms = struct.unpack(
+                    _PACKET, record
+                )
+                device = names.get(short_id) or format_short_id(short_id)
+                print(f"pkt,{run_id},{time_ms},{device},{sequence},{rssi / 2}")
@@ -0,0 +1,183 @@
+import json
+import time
+from array import array
+import adafruit_rfm69
+from input import get_user_input
+from rgb_indicator import indicate_processing, indicate_ready
+from stats import HISTOGRAM_BUCKET_DB, HISTOGRAM_BUCKETS, HISTOGRAM_MIN_DB
+
+# Most channels in one scan; the per-channel histograms take 40 bytes each
+MAX_CHANNELS = 100
+
+# Histogram cells drawn from sparse to dense
+_DENSITY = " .:-=+*#%@"
+
+
+class SpectrumScan:
+    """Steps the radio across a frequency range and samples channel power.
+
+    Each channel is listened to for `dwell_ms` while the RSSI register is
+    read as fast as the SPI bus allows. Per channel the scan keeps min, max,
+    sum and count in half-dB steps and a histogram of the same 5dB buckets as
+    the test results, all in arrays allocated up front, so sampling does not
+    allocate.
+    """
+
+    def __init__(
+        self,
+        rfm69: adafruit_rfm69.RFM69,
+        start_mhz: float,
+        stop_mhz: float,
+        step_khz: float,
+        dwell_ms: int,
+    ):
+        self._rfm69 = rfm69
+        self.start_mhz = start_mhz
+        self.step_khz = step_khz
+        self.dwell_ms = dwell_ms
+        channels = int((stop_mhz - start_mhz) * 1000 / step_khz + 0.5) + 1
+        self.channels = max(1, min(channels, MAX_CHANNELS))
+        self.minimum = array("h", [0] * self.channels)  # half dB
+        self.maximum = array("h", [0] * self.channels)
+        self.total = array("l", [0] * self.channels)
+        self.count = array("L", [0] * self.channels)
+        self.histogram = array("H", [0] * (self.channels * HISTOGRAM_BUCKETS))
+        self.elapsed_s = 0.0
+
+    def frequency_mhz(self, channel: int) -> float:
+        return self.start_mhz + channel * self.step_khz / 1000.0
+
+    def run(self):
+        """Scan every channel once, then return to the original frequency"""
+        rfm69 = self._rfm69
+        original_mhz = rfm69.frequency_mhz
+        dwell_ns = self.dwell_ms * 1_000_000
+        histogram = self.histogram
+        floor = HISTOGRAM_MIN_DB * 2
+        width = HISTOGRAM_BUCKET_DB * 2
+        last_bucket = HISTOGRAM_BUCKETS - 1
+
+        started = time.monotonic_ns()
+        for channel in range(self.channels):
+            # Retune in standby, the synthesizer relocks when receive restarts
+            rfm69.idle()
+            rfm69.frequency_mhz = self.frequency_mhz(channel)
+            rfm69.listen()
+            rfm69.rssi  # The first reading still averages the old channel
+
+            base = channel * HISTOGRAM_BUCKETS
+            low = 0
+            high = -512
+            total = 0
+            count = 0
+            deadline = time.monotonic_ns() + dwell_ns
+            while time.monotonic_ns() < deadline:
+                value = int(rfm69.rssi * 2)
+                if value < low:
+                    low = value
+                if value > high:
+                    high = value
+                total += value
+                count += 1
+                bucket = (value - floor) // width
+                if bucket < 0:
+                    bucket = 0
+                elif bucket > last_bucket:
+                    bucket = last_bucket
+                histogram[base + bucket] += 1
+
+            self.minimum[channel] = low if count else 0
+            self.maximum[channel] = high if count else 0
+            self.total[channel] = total
+            self.count[channel] = count
+        self.elapsed_s = (time.monotonic_ns() - started) / 1e9
+
+        rfm69.idle()
+        rfm69.frequency_mhz = original_mhz
+        rfm69.listen()
+
+    def average(self, channel: int) -> float:
+        count = self.count[channel]
+        return self.total[channel] / count / 2 if count else 0.0
+
+    def noise_floor(self) -> float:
+        """Median of the channel averages, robust to a few busy channels"""
+        averages = sorted(self.average(channel) for channel in range(self.channels))
+        return averages[len(averages) // 2]
+
+    def render(self):
+        print("\n" + "=" * 80)
+        print(
+            f"SPECTRUM SCAN {self.frequency_mhz(0):.3f}-"
+            f"{self.frequency_mhz(self.channels - 1):.3f}mhz, "
+            f"{self.step_khz:g}khz steps, {self.dwell_ms}ms dwell"
+        )
+        print("=" * 80)
+        labels = f"{HISTOGRAM_MIN_DB}db"
+        print(f"  Freq (mhz) |    Min |    Avg |    Max | {labels:<{HISTOGRAM_BUCKETS}} | Samples")
+        for channel in range(self.channels):
+            count = self.count[channel]
+            base = channel * HISTOGRAM_BUCKETS
+            cells = ""
+            for bucket in range(HISTOGRAM_BUCKETS):
+                hits = self.histogram[base + bucket]
+                level = 0
+                if hits:
+                    level = 1 + (len(_DENSITY) - 2) * hits // count
+                cells += _DENSITY[level]
+            print(
+                f"  {self.frequency_mhz(channel):>10.3f} | {self.minimum[channel] / 2:>6.1f} "
+                f"| {self.average(channel):>6.1f} | {self.maximum[channel] / 2:>6.1f} "
+                f"| {cells} | {count}"
+            )
+
+        samples = sum(self.count)
+        busiest = 0
+        for channel in range(self.channels):
+            if self.average(channel) > self.average(busiest):
+                busiest = channel
+        print(
+            f"\n  Noise floor {self.noise_floor():.1f}db, busiest channel "
+            f"{self.frequency_mhz(busiest):.3f}mhz at {self.average(busiest):.1f}db"
+        )
+        if self.elapsed_s > 0:
+            print(
+                f"  {self.channels} channels in {self.elapsed_s:.2f}s = "
+                f"{self.channels / self.elapsed_s:.1f} channels/s, "
+                f"{samples / self.elapsed_s:.0f} samples/s"
+            )
+        print("=" * 80 + "\n")
+
+    def as_dict(self) -> dict:
+        return {
+            "start_mhz": self.start_mhz,
+            "step_khz": self.step_khz,
+            "dwell_ms": self.dwell_ms,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "noise_floor": round(self.noise_floor(), 2),
+            "min": [value / 2 for value in self.minimum],
+            "avg": [round(self.average(channel), 2) for channel in range(self.channels)],
+            "max": [value / 2 for value in self.maximum],
+            "samples": list(self.count),
+        }
+
+
+def scan_band(rfm69: adafruit_rfm69.RFM69):
+    """Sweep the receiver across a band and show the power on each channel"""
+    print("\n[CONTROLLER] Spectrum Scan")
+    print("-" * 40)
+    center = rfm69.frequency_mhz
+    start_mhz = float(get_user_input("Start frequency (mhz)", center - 1))
+    stop_mhz = float(get_user_input("Stop frequency (mhz)", center + 1))
+    step_khz = float(get_user_input("Step (khz)", 100))
+    dwell_ms = int(get_user_input("Dwell per channel (ms)", 20))
+    if stop_mhz < start_mhz or step_khz <= 0 or dwell_ms <= 0:
+        print("[CONTROLLER] Invalid scan range")
+        return
+
+    scan = SpectrumScan(rfm69, start_mhz, stop_mhz, step_khz, dwell_ms)
+    indicate_processing()
+    scan.run()
+    indicate_ready()
+    scan.render()
+    print("SCAN " + json.dumps(scan.as_dict()))
@@ -0,0 +1,176 @@
+import math
+from array import array
+
+# RSSI histogram: 5db buckets from -120db to -20db, values outside are clamped
+HISTOGRAM_MIN_DB = -120
+HISTOGRAM_BUCKET_DB = 5
+HISTOGRAM_BUCKETS = 20
+
+# Loss burst histogram: upper bound of each bucket's burst length, the last
+# bucket counts everything longer
+BURST_BUCKET_LIMITS = (1, 2, 3, 4, 8, 16)
+
+
+class LinkStats:
+    """Running RSSI statistics for one link, updated in O(1) per packet.
+
+    Memory does not depend on the number of packets received: count, min,
+    max and a Welford mean/variance, a fixed histogram, and optionally the
+    most recent raw samples in a ring buffer of half-db steps. Which
+    sequence numbers arrived is kept in a bitmap of one bit per expected
+    packet, so duplicates are not counted as received.
+    """
+
+    def __init__(self, expected: int, sample_capacity: int = 0):
+        self.expected = expected
+        self.count = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self._received = bytearray((expected + 7) // 8)
+        self.rssi_min = 0.0
+        self.rssi_max = 0.0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.last_sequence = -1
+        self.histogram = array("H", [0] * HISTOGRAM_BUCKETS)
+        self._samples = array("h", [0] * sample_capacity)
+        self._sample_next = 0
+
+    def add(self, rssi: float, sequence: int) -> bool:
+        """Add one received packet, False if it was a duplicate or out of range"""
+        if not 0 <= sequence < self.expected:
+            return False
+        mask = 1 << (sequence & 7)
+        if self._received[sequence >> 3] & mask:
+            self.duplicates += 1
+            return False
+        self._received[sequence >> 3] |= mask
+        if sequence < self.last_sequence:
+            self.out_of_order += 1
+        else:
+            self.last_sequence = sequence
+
+        self.count += 1
+        if self.count == 1:
+            self.rssi_min = self.rssi_max = rssi
+        elif rssi < self.rssi_min:
+            self.rssi_min = rssi
+        elif rssi > self.rssi_max:
+            self.rssi_max = rssi
+
+        delta = rssi - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (rssi - self._mean)
+
+        bucket = int((rssi - HISTOGRAM_MIN_DB) // HISTOGRAM_BUCKET_DB)
+        bucket = min(max(bucket, 0), HISTOGRAM_BUCKETS - 1)
+        if self.histogram[bucket] < 0xFFFF:
+            self.histogram[bucket] += 1
+
+        if len(self._samples):
+            self._samples[self._sample_next % len(self._samples)] = round(rssi * 2)
+            self._sample_next += 1
+        return True
+
+    def received(self, sequence: int) -> bool:
+        return bool(self._received[sequence >> 3] & (1 << (sequence & 7)))
+
+    @property
+    def bitmap(self) -> bytearray:
+        """Bit i of byte i // 8 is set when packet i arrived"""
+        return self._received
+
+    @property
+    def loss_percent(self) -> float:
+        if not self.expected:
+            return 0.0
+        return 100.0 * (1 - self.count / self.expected)
+
+    def loss_bursts(self):
+        """Longest run of lost packets and a histogram of run lengths.
+
+        Walks the bitmap, so call it when reporting rather than per packet.
+        """
+        return bitmap_bursts(self._received, self.expected)
+
+    @staticmethod
+    def burst_labels():
+        """Column labels for the loss burst histogram"""
+        labels = []
+        low = 1
+        for limit in BURST_BUCKET_LIMITS:
+            labels.append(str(low) if low == limit else f"{low}-{limit}")
+            low = limit + 1
+        labels.append(f"{low}+")
+        return labels
+
+    def as_dict(self) -> dict:
+        """Summary for machine-readable output"""
+        longest, bursts = self.loss_bursts()
+        return {
+            "expected": self.expected,
+            "received": self.count,
+            "loss_pct": round(self.loss_percent, 2),
+            "duplicates": self.duplicates,
+            "out_of_order": self.out_of_order,
+            "longest_burst": longest,
+            "bursts": bursts,
+            "rssi_min": self.rssi_min,
+            "rssi_max": self.rssi_max,
+            "rssi_avg": round(self.rssi_avg, 2),
+            "rssi_std": round(self.rssi_stddev, 2),
+            "rssi_histogram": list(self.histogram),
+        }
+
+    @property
+    def rssi_avg(self) -> float:
+        return self._mean
+
+    @property
+    def rssi_variance(self) -> float:
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def rssi_stddev(self) -> float:
+        return math.sqrt(self.rssi_variance)
+
+    def samples(self):
+        """The retained raw RSSI samples, oldest first"""
+        capacity = len(self._samples)
+        stored = min(self._sample_next, capacity)
+        start = self._sample_next - stored
+        for i in range(start, self._sample_next):
+            yield self._samples[i % capacity] / 2
+
+    @staticmethod
+    def bucket_floor(bucket: int) -> int:
+        """Lowest RSSI counted in a histogram bucket"""
+        return HISTOGRAM_MIN_DB + bucket * HISTOGRAM_BUCKET_DB
+
+
+def bitmap_bursts(bitmap, length: int):
+    """Longest run of lost packets among the first `length` of a bitmap of
+    received ones, and a histogram of run lengths"""
+    histogram = [0] * (len(BURST_BUCKET_LIMITS) + 1)
+    longest = 0
+    run = 0
+    for sequence in range(length + 1):
+        if sequence < length and not bitmap[sequence >> 3] & (1 << (sequence & 7)):
+            run += 1
+            continue
+        if run:
+            longest = max(longest, run)
+            bucket = 0
+            while bucket < len(BURST_BUCKET_LIMITS) and run > BURST_BUCKET_LIMITS[bucket]:
+                bucket += 1
+            histogram[bucket] += 1
+            run = 0
+    return longest, histogram
+
+
+def percentile(sorted_values, fraction: float):
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
@@ -0,0 +1,195 @@
+import struct
+from array import array
+
+try:
+    import usb_cdc
+except ImportError:
+    usb_cdc = None
+
+# Frame types; every frame is type, payload, CRC-16 (LE), COBS encoded and
+# delimited by zero bytes on both sides, so text printed in between is
+# dropped by the host as a bad frame instead of corrupting the next one.
+FRAME_PACKET = 0x01
+FRAME_DEVICE = 0x02
+FRAME_RUN_START = 0x03
+FRAME_RUN_SUMMARY = 0x04
+FRAME_RUN_END = 0x05
+
+# run id, short device id, sequence, rssi in half db, ticks_ms
+_PACKET = "<HIHhI"
+# short device id, flags, tx_power, temperature * 10, frequency khz,
+# bitrate / 100, frequency deviation / 100, then the device id text
+_DEVICE = "<IBbhIHH"
+# run id, num_packets, delay_ms, stagger_ms, tx_power, flags, bitrate / 100,
+# frequency deviation / 100
+_RUN_START = "<HHHHbBHH"
+# run id, short device id, received, expected, duplicates, out of order,
+# longest loss burst, rssi min, max and avg in half db, rssi std * 100,
+# then the device id text
+_RUN_SUMMARY = "<HIHHHHHhhhH"
+# run id, reason, elapsed ms
+_RUN_END = "<HBI"
+
+END_REASONS = (
+    "timeout",
+    "no relays responded",
+    "all relays delivered",
+    "remaining relays inactive",
+    "aborted",
+)
+
+_MAX_FRAME = 64
+
+
+def _crc16_table():
+    table = array("H", [0] * 256)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[byte] = crc & 0xFFFF
+    return table
+
+
+_CRC16_TABLE = _crc16_table()
+
+
+def crc16(data, length: int) -> int:
+    """CRC-16/CCITT-FALSE of the first length bytes"""
+    crc = 0xFFFF
+    table = _CRC16_TABLE
+    for i in range(length):
+        crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ data[i]) & 0xFF]
+    return crc
+
+
+def cobs_encode(data, length: int, out: bytearray, start: int = 0) -> int:
+    """COBS encode the first length bytes into out at start, returning the end"""
+    code_pos = start
+    pos = start + 1
+    code = 1
+    for i in range(length):
+        byte = data[i]
+        if byte:
+            out[pos] = byte
+            pos += 1
+            code += 1
+        if not byte or code == 0xFF:
+            out[code_pos] = code
+            code_pos = pos
+            pos += 1
+            code = 1
+    out[code_pos] = code
+    return pos
+
+
+class ResultStream:
+    """Test results as compact binary frames on USB serial, for host/collect.py.
+
+    Frames are built in preallocated buffers. They go to the second USB
+    serial port when boot.py enables usb_cdc.data, otherwise they are mixed
+    into the console.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._frame = bytearray(_MAX_FRAME)
+        self._encoded = bytearray(_MAX_FRAME + _MAX_FRAME // 254 + 4)
+        self._port = None
+        if usb_cdc is not None:
+            self._port = usb_cdc.data or usb_cdc.console
+
+    @property
+    def separate_port(self) -> bool:
+        return usb_cdc is not None and usb_cdc.data is not None
+
+    def _send(self, frame_type: int, fmt: str, values, text: str = ""):
+        if not self.enabled or self._port is None:
+            return
+        frame = self._frame
+        frame[0] = frame_type
+        struct.pack_into(fmt, frame, 1, *values)
+        length = 1 + struct.calcsize(fmt)
+        if text:
+            encoded_text = text.encode()[: _MAX_FRAME - length - 2]
+            frame[length : length + len(encoded_text)] = encoded_text
+            length += len(encoded_text)
+        crc = crc16(frame, length)
+        frame[length] = crc & 0xFF
+        frame[length + 1] = crc >> 8
+        length += 2
+
+        out = self._encoded
+        out[0] = 0
+        end = cobs_encode(frame, length, out, 1)
+        out[end] = 0
+        self._port.write(memoryview(out)[: end + 1])
+
+    def packet(self, run_id: int, short_id: int, sequence: int, rssi: float, ticks_ms: int):
+        self._send(
+            FRAME_PACKET,
+            _PACKET,
+            (run_id, short_id, sequence & 0xFFFF, round(rssi * 2), ticks_ms),
+        )
+
+    def device(self, message):
+        """Frame for a decoded InfoResponse"""
+        self._send(
+            FRAME_DEVICE,
+            _DEVICE,
+            (
+                message.short_id,
+                int(message.high_power),
+                message.tx_power,
+                round(message.temperature * 10),
+                round(message.frequency_mhz * 1000),
+                round(message.bitrate_kbps / 100),
+                round(message.frequency_deviation / 100),
+            ),
+            message.device_id,
+        )
+
+    def run_start(self, run_id: int, params):
+        self._send(
+            FRAME_RUN_START,
+            _RUN_START,
+            (
+                run_id,
+                params.num_packets,
+                params.delay_ms,
+                params.stagger_ms,
+                params.tx_power,
+                int(params.high_power) | (int(params.slotted) << 1),
+                params.bitrate // 100,
+                params.frequency_deviation // 100,
+            ),
+        )
+
+    def run_end(self, run_id: int, reason: str, elapsed_s: float, results: dict, name_of):
+        """Summary frame per device from its LinkStats, then the end frame.
+
+        `results` is keyed by short id, `name_of(short_id)` gives the device
+        id text sent after it.
+        """
+        for short_id, stats in results.items():
+            longest, _ = stats.loss_bursts()
+            self._send(
+                FRAME_RUN_SUMMARY,
+                _RUN_SUMMARY,
+                (
+                    run_id,
+                    short_id,
+                    stats.count,
+                    stats.expected,
+                    stats.duplicates,
+                    stats.out_of_order,
+                    longest,
+                    round(stats.rssi_min * 2),
+                    round(stats.rssi_max * 2),
+                    round(stats.rssi_avg * 2),
+                    min(round(stats.rssi_stddev * 100), 0xFFFF),
+                ),
+                name_of(short_id),
+            )
+        code = END_REASONS.index(reason) if reason in END_REASONS else 0xFF
+        self._send(FRAME_RUN_END, _RUN_END, (run_id, code, round(elapsed_s * 1000)))
@@ -0,0 +1,173 @@
+import json
+from input import get_user_input
+from packets import TestParameters
+
+# Pause between two sweep tests so relays are back on their default settings
+SWEEP_GAP_S = 0.5
+
+
+class Sweep:
+    """A grid of test configurations run back to back, with each one's results"""
+
+    def __init__(
+        self,
+        base: TestParameters,
+        tx_powers: list,
+        high_powers: list,
+        bitrates: list,
+        frequency_deviations: list,
+        name_of,
+    ):
+        self.name_of = name_of  # short_id -> name the relay is reported under
+        self.base = base.copy()
+        self.configs = []
+        for bitrate in bitrates:
+            for frequency_deviation in frequency_deviations:
+                for high_power in high_powers:
+                    for tx_power in tx_powers:
+                        params = base.copy()
+                        params.tx_power = tx_power
+                        params.high_power = high_power
+                        params.bitrate = bitrate
+                        params.frequency_deviation = frequency_deviation
+                        self.configs.append(params)
+        self.index = -1
+        self.rows = []  # per config: short_id -> (rssi_avg, loss %)
+
+    @property
+    def done(self) -> bool:
+        return self.index + 1 >= len(self.configs)
+
+    def next_config(self) -> TestParameters:
+        self.index += 1
+        return self.configs[self.index].copy()
+
+    def record(self, results: dict):
+        """Keep the summary of the finished configuration's LinkStats"""
+        self.rows.append(
+            {
+                short_id: (stats.rssi_avg, stats.loss_percent)
+                for short_id, stats in results.items()
+            }
+        )
+
+    def devices(self) -> list:
+        seen = {}
+        for row in self.rows:
+            for short_id in row:
+                seen[short_id] = True
+        return list(seen)
+
+    def describe(self, index: int) -> str:
+        params = self.configs[index]
+        bitrate = f"{params.bitrate / 1000:.1f}k" if params.bitrate else "default"
+        deviation = (
+            f"{params.frequency_deviation / 1000:.1f}k"
+            if params.frequency_deviation
+            else "default"
+        )
+        return f"tx {params.tx_power}db hp {params.high_power} br {bitrate} fdev {deviation}"
+
+    def render(self, distance):
+        """Print one table per device with a row per configuration.
+
+        `distance(tx_power, rssi, n)` estimates the distance for the table.
+        """
+        print("\n" + "=" * 80)
+        print(f"SWEEP RESULTS ({len(self.rows)}/{len(self.configs)} configurations)")
+        print("=" * 80)
+        for short_id in self.devices():
+            print(f"\n{self.name_of(short_id)}")
+            print(
+                "|   # | TX Power | High Power | Bitrate | Freq Dev | RSSI Avg | Packet Loss | Dist(n=2) | Dist(n=3) | Dist(n=4) |"
+            )
+            print(
+                "|-----|----------|------------|---------|----------|----------|-------------|-----------|-----------|-----------|"
+            )
+            for index, row in enumerate(self.rows):
+                params = self.configs[index]
+                bitrate = f"{params.bitrate / 1000:.1f}k" if params.bitrate else "-"
+                deviation = (
+                    f"{params.frequency_deviation / 1000:.1f}k"
+                    if params.frequency_deviation
+                    else "-"
+                )
+                prefix = f"| {index + 1:>3} | {params.tx_power:>6}db | {str(params.high_power):>10} | {bitrate:>7} | {deviation:>8} |"
+                if short_id not in row:
+                    print(f"{prefix}        - |      100.0% |         - |         - |         - |")
+                    continue
+                rssi_avg, loss = row[short_id]
+                print(
+                    f"{prefix} {rssi_avg:>8.1f} | {loss:>10.1f}% | "
+                    f"{distance(params.tx_power, rssi_avg, 2.0):>8.1f}m | "
+                    f"{distance(params.tx_power, rssi_avg, 3.0):>8.1f}m | "
+                    f"{distance(params.tx_power, rssi_avg, 4.0):>8.1f}m |"
+                )
+        print("=" * 80 + "\n")
+
+    def report(self, distance):
+        """The tables, then the SWEEP line for scripts reading the console"""
+        self.render(distance)
+        print("SWEEP " + json.dumps(self.as_dict()))
+
+    def as_dict(self) -> dict:
+        """Summary for machine-readable output"""
+        configs = []
+        for index, row in enumerate(self.rows):
+            params = self.configs[index]
+            configs.append(
+                {
+                    "tx_power": params.tx_power,
+                    "high_power": params.high_power,
+                    "bitrate": params.bitrate,
+                    "frequency_deviation": params.frequency_deviation,
+                    "devices": {
+                        self.name_of(short_id): {
+                            "rssi_avg": round(rssi_avg, 2),
+                            "loss_pct": round(loss, 2),
+                        }
+                        for short_id, (rssi_avg, loss) in row.items()
+                    },
+                }
+            )
+        return {"configs": configs}
+
+
+def _setting(value: str, default: float) -> int:
+    """Radio setting in Hz from a value in kilo units, 0 for the default"""
+    setting = round(float(value) * 10) * 100
+    return 0 if abs(setting - default) < 100 else setting
+
+
+def configure_sweep(
+    params: TestParameters, default_bitrate: float, default_frequency_deviation: float, name_of
+) -> Sweep:
+    """Ask for the grid of settings to sweep around `params`"""
+    print("\n[CONTROLLER] Configure Parameter Sweep")
+    print("-" * 40)
+    print("Enter comma separated values, every combination is tested")
+    tx_powers = [
+        int(value) for value in get_user_input("TX powers (db)", params.tx_power).split(",")
+    ]
+    high_powers = [
+        value.strip().lower() in ["true", "t", "1", "yes", "y"]
+        for value in get_user_input("High power modes (true/false)", params.high_power).split(",")
+    ]
+    bitrates = [
+        _setting(value, default_bitrate)
+        for value in get_user_input("Bitrates (kbit/s)", default_bitrate / 1000).split(",")
+    ]
+    deviations = [
+        _setting(value, default_frequency_deviation)
+        for value in get_user_input(
+            "Frequency deviations (khz)", default_frequency_deviation / 1000
+        ).split(",")
+    ]
+
+    sweep = Sweep(params, tx_powers, high_powers, bitrates, deviations, name_of)
+    longest_s = sum(config.num_packets * config.period_ms / 1000.0 for config in sweep.configs)
+    print(
+        f"\n[CONTROLLER] Sweeping {len(sweep.configs)} configurations, "
+        f"at most {longest_s:.0f}s of tests"
+    )
+    return sweep